@@ -19,22 +19,14 @@ Example:
 """
 import argparse
 
-from src.assign_groups import *
-from src.test_groups import *
-
 
 def import_optimal_groupings(filename):
     """
-    Import list of unique solutions (groupings) from Excel spreadsheet.
+    Import list of unique solutions (groupings) from Excel spreadsheet with one sheet per solution, or from .csv or .jsonl file written by run_program.py -o.
     """
-    groupings = pd.read_excel(filename, sheet_name=None)
-    sheet_names = list(groupings.keys())
-
-    unique_solutions = []
-    for sheet_name in sheet_names:
-        unique_solutions.append(groupings[sheet_name])
+    from src.streaming import read_solutions
 
-    return(unique_solutions)
+    return read_solutions(filename)
 
 
 if __name__ == "__main__":
@@ -42,46 +34,37 @@ if __name__ == "__main__":
     # info and args
     parser = argparse.ArgumentParser(description='Test student groups for constraint satisfaction.')
     parser.add_argument('data_filename', type=str, help='filename for Excel spreadsheet with student, group, and constraint data as your_filename_here.xlsx')
-    parser.add_argument('groups_filename', type=str, help='filename for Excel spreadsheet with student groups as your_filename_here.xlsx')
+    parser.add_argument('groups_filename', type=str, help='filename for Excel spreadsheet with student groups as your_filename_here.xlsx, or .csv or .jsonl file')
+    parser.add_argument('--json', type=str, default=None, help='save pass/fail report with one record per solution and constraint row to this JSON file')
     args = parser.parse_args()
 
+    # import after parsing, so --help and argument errors do not wait for pandas
+    from src.problem_spec import load_problem_spec
+    from src.verify import print_report, summarize_report, verify_solutions
+
     data_filename = 'data/' + args.data_filename
     groups_filename = 'results/' + args.groups_filename
 
     unique_solutions = import_optimal_groupings(groups_filename)
 
-    person_df = import_from_template(data_filename, "Person Setup")
-    with_df = import_from_template(data_filename, "Constraint - With")
-    not_with_df = import_from_template(data_filename, "Constraint - Not With")
-    in_df = import_from_template(data_filename, "Constraint - In")
-    not_in_df = import_from_template(data_filename, "Constraint - Not In")
-    hom_df = import_from_template(data_filename,"Constraint - Homogenous")
-    max_df = import_from_template(data_filename, "Constraint - Maximum")
+    spec = load_problem_spec(data_filename)
 
+    # check all constraints for all solutions at once
+    report = verify_solutions(spec, unique_solutions)
 
-    for idx, solution_df in enumerate(unique_solutions):
+    for idx in range(len(unique_solutions)):
 
         print(f"\nSOLUTION {idx}\n")
-        df = pd.merge(person_df, solution_df, on="name")
-
-        print("WITH...")
-        test_with_constraint(with_df, df, False)
-
-        print("\nNOT WITH...")
-        test_not_with_constraint(not_with_df, df, False)
-
-        print("\nIN...")
-        test_in_constraint(in_df, df, False)
-
-        print("\nNOT IN...")
-        test_not_in_constraint(not_in_df, df, False)
-
-        print("\nHOMOGENOUS...")
-        test_homogenous_constraint(hom_df, df, False)
-
-        print("\nMAXIMUM...")
-        test_maximum_constraint(max_df, df, False)
-
+        print_report(report, idx)
         print()
 
+    summary = summarize_report(report)
+    failed = summary.loc[summary["failed"] > 0]
+    print(f"{len(unique_solutions)} solution(s) checked, {int(summary['failed'].sum())} constraint row(s) FAILED")
+    for row in failed.itertuples():
+        print(f"\tsolution {row.solution} {row.constraint}: {row.failed} of {row.checked} rows FAILED ({row.violations} violations)")
 
+    # save structured report
+    if args.json:
+        report.to_json(args.json, orient="records", indent=2)
+        print(f"Report saved as \"{args.json}\"")
@@ -1,6 +1,6 @@
 """
 
-Script to use with multiple student grouping solutions to review the number of students who change groups from one solution to the next. Compares student group changes by solution and by group.
+Script to use with multiple student grouping solutions to review the number of students who change groups from one solution to the next. Compares student group changes by solution and by group, then compares all solutions by pairs of students split up (independent of group labels) and lists students who stay together.
 
 Example:
 
@@ -24,9 +24,6 @@ Example:
 
 import argparse
 
-from src.assign_groups import *
-from src.test_groups import *
-
 from check_constraints import import_optimal_groupings
 
 
@@ -35,19 +32,37 @@ if __name__ == "__main__":
     # info and args
     parser = argparse.ArgumentParser(description='Test solutions for uniqueness. Compare changes by solution (solution 0 --> 1 by group, solution 1 --> 2 by group, ...) and compare changes by group (group 1 by solution, group 2 by solution, ...)')
     parser.add_argument('data_filename', type=str, help='filename for Excel spreadsheet with student, group, and constraint data as your_filename_here.xlsx')
-    parser.add_argument('groups_filename', type=str, help='filename for Excel spreadsheet with student groups as your_filename_here.xlsx')
+    parser.add_argument('groups_filename', type=str, help='filename for Excel spreadsheet with student groups as your_filename_here.xlsx, or .csv or .jsonl file')
+    parser.add_argument('--min-count', type=int, default=None, help='list pairs of students in the same group in at least this many solutions (default all solutions)')
+    parser.add_argument('--distances', type=str, default=None, help='save solution x solution matrix of pairs broken to this CSV file')
     args = parser.parse_args()
 
+    # import after parsing, so --help and argument errors do not wait for pandas and scipy
+    from src.analysis import analyze_solutions, print_analysis
+    from src.problem_spec import load_problem_spec
+    from src.test_groups import view_changes_by_group, view_changes_by_solution
+
     data_filename = 'data/' + args.data_filename
     groups_filename = 'results/' + args.groups_filename
 
+    spec = load_problem_spec(data_filename)
     unique_solutions = import_optimal_groupings(groups_filename)
 
 
     # compare solution 0 --> 1 by group, solution 1 --> 2 by group, ...
     print("\n\nCHANGES BY SOLUTION...\n")
-    view_changes_by_solution(data_filename, unique_solutions, False)
+    view_changes_by_solution(spec, unique_solutions, False)
 
     # compare group 1 by solution, group 2 by solution, ...
     print("\n\nCHANGES BY GROUP...\n")
-    view_changes_by_group(data_filename, unique_solutions, False)
\ No newline at end of file
+    view_changes_by_group(spec, unique_solutions, False)
+
+    # compare all solutions by pairs of students, independent of group labels
+    print("\n\nPAIRS BROKEN BETWEEN SOLUTIONS...\n")
+    analysis = analyze_solutions(spec, unique_solutions, args.min_count)
+    print_analysis(analysis)
+
+    # save solution x solution distance matrix
+    if args.distances:
+        analysis["distance"].to_csv(args.distances)
+        print(f"\nDistance matrix saved as \"{args.distances}\"")
\ No newline at end of file
@@ -0,0 +1,37 @@
+"""
+
+Script that writes a synthetic student grouping workbook in the format of data_template.xlsx (or as a .json document or directory of .csv files), to try the program on classes of any size. All constraints agree with a hidden random grouping, so the problem can be solved unless --infeasible adds a contradiction.
+
+Example:
+
+    python generate_data.py 300 -o data/synthetic_300.xlsx
+
+"""
+import argparse
+
+from src.generate import INFEASIBLE_KINDS, generate_problem_spec
+from src.problem_spec import write_problem_spec
+
+
+if __name__ == "__main__":
+
+    # info and args
+    parser = argparse.ArgumentParser(description="Write a synthetic student grouping workbook.")
+    parser.add_argument("num_names", type=int, help="number of students")
+    parser.add_argument("-o", "--output", type=str, default=None, help="workbook filename (default data/synthetic_N.xlsx), a .json filename, or a directory name for .csv files")
+    parser.add_argument("-g", "--group-size", type=int, default=5, help="students per group (default 5)")
+    parser.add_argument("-c", "--char-rates", type=float, nargs="+", default=[0.5, 0.3, 0.1], help="share of students with each characteristic (default 0.5 0.3 0.1)")
+    parser.add_argument("-d", "--density", type=float, default=0.1, help="share of students in With rows and in Not With rows (default 0.1)")
+    parser.add_argument("--in-rate", type=float, default=0.02, help="share of students in In rows and in Not In rows (default 0.02)")
+    parser.add_argument("--homogenous", type=int, default=1, help="number of Homogenous groups (default 1)")
+    parser.add_argument("--spare-seats", type=int, default=0, help="extra seats per group (default 0)")
+    parser.add_argument("--infeasible", choices=INFEASIBLE_KINDS, default=None, help="add a contradiction of this kind")
+    parser.add_argument("--seed", type=int, default=None, help="random seed for repeatable workbooks")
+    args = parser.parse_args()
+
+    spec = generate_problem_spec(args.num_names, args.group_size, char_rates=args.char_rates, with_density=args.density,
+                                 not_with_density=args.density, in_rate=args.in_rate, not_in_rate=args.in_rate,
+                                 num_hom=args.homogenous, spare_seats=args.spare_seats, infeasible=args.infeasible, seed=args.seed)
+    output = args.output or f"data/synthetic_{args.num_names}.xlsx"
+    write_problem_spec(spec, output)
+    print(f"{len(spec.names)} students in {len(spec.groups)} groups saved as \"{output}\"")
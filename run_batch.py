@@ -0,0 +1,59 @@
+"""
+
+Script that solves many student grouping workbooks at once in a pool of worker processes. Each workbook is solved like run_program.py and its solutions are saved to the output directory. A summary of status, timings, and output files of every workbook is printed and saved as summary.csv in the output directory.
+
+Example:
+
+    python run_batch.py data/fall_sections -n 3 -j 4 -t 60
+
+"""
+import argparse
+import datetime
+import os
+
+from src.batch import ENGINES, SUMMARY_COLUMNS, find_workbooks, print_summary, run_batch
+
+
+def print_row(row):
+    """
+    Print one line per finished workbook.
+    """
+    print(f"{row['status']:<10} {row['solutions']} solution(s) in {row['wall_time'] or 0:.1f}s  {row['workbook']}", flush=True)
+
+
+if __name__ == "__main__":
+
+    # info and args
+    parser = argparse.ArgumentParser(description="Solve many student grouping workbooks in a pool of worker processes.")
+    parser.add_argument("path", type=str, help="directory of inputs (every .xlsx or .json file and every directory of .csv or .parquet sheet files) or manifest file (.csv with a filename column and optional num_solutions and time_limit columns, or one filename per line)")
+    parser.add_argument("-n", "--num-solutions", type=int, default=1, help="desired number of optimal solutions per workbook (default 1)")
+    parser.add_argument("-o", "--output-dir", type=str, default=None, help="directory for solutions and summary.csv (default results/batch_yyyymmdd_hhmmss)")
+    parser.add_argument("-j", "--jobs", type=int, default=os.cpu_count(), help="number of worker processes (default number of CPUs)")
+    parser.add_argument("-t", "--time-limit", type=float, default=None, help="time limit in seconds per workbook, shared by its solves (default none, 10 per solve for heuristic engine)")
+    parser.add_argument("-e", "--engine", choices=ENGINES, default="pulp", help="model engine as in run_program.py (default pulp)")
+    parser.add_argument("-b", "--backend", default="cbc", help="solver for pulp engine: cbc (default), highs, or glpk")
+    parser.add_argument("--gap", type=float, default=None, help="relative MIP gap at which the solver stops")
+    parser.add_argument("--seed", type=int, default=None, help="random seed for solver and heuristic engine")
+    args = parser.parse_args()
+
+    # import after parsing, so --help and argument errors do not wait for PuLP
+    from src.assign_groups import SOLVER_BACKENDS, backend_available
+
+    if args.backend not in SOLVER_BACKENDS:
+        parser.error(f"argument -b/--backend: invalid choice: '{args.backend}' (choose from {', '.join(map(repr, SOLVER_BACKENDS))})")
+    if args.engine == "pulp" and not backend_available(args.backend):
+        parser.error(f"argument -b/--backend: solver backend '{args.backend}' is not installed")
+
+    jobs = find_workbooks(args.path)
+    output_dir = args.output_dir or "results/batch_" + datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
+    print(f"Solving {len(jobs)} workbook(s) with {args.jobs} processes...")
+
+    try:
+        summary = run_batch(jobs, output_dir, workers=args.jobs, num_solutions=args.num_solutions, time_limit=args.time_limit,
+                            engine=args.engine, on_result=print_row, backend=args.backend, gap=args.gap, seed=args.seed)
+    except ValueError as e:
+        parser.error(str(e))
+    summary.to_csv(os.path.join(output_dir, "summary.csv"), index=False, columns=SUMMARY_COLUMNS)
+
+    print_summary(summary)
+    print(f"Summary saved as \"{os.path.join(output_dir, 'summary.csv')}\"")
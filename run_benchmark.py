@@ -0,0 +1,81 @@
+"""
+
+Script that measures how the solver scales with the number of students, the group size, and the density of With and Not With rows. Each case is a synthetic problem generated like generate_data.py and is solved and checked like run_program.py and check_constraints.py in its own process. Build time, solve time, peak memory, and solution quality of every case are appended to a results file tagged with the current commit, so performance changes can be compared between commits.
+
+Example:
+
+    python run_benchmark.py -s 50 100 200 -d 0.05 0.2 -r 3
+    python run_benchmark.py --loaders -s 1000 10000
+
+"""
+import argparse
+
+import pandas as pd
+
+from src.assign_groups import SOLVER_BACKENDS
+from src.batch import ENGINES
+from src.benchmark import LOADER_COLUMNS, benchmark_cases, benchmark_loaders, compare_results, run_benchmark, save_results
+
+
+def print_row(row):
+    """
+    Print one line per finished case.
+    """
+    infeasible = f" infeasible={row['infeasible']}" if row["infeasible"] else ""
+    print(f"{row['status']:<10} {row['num_names']} students, group size {row['group_size']}, density {row['density']}, "
+          f"seed {row['seed']}{infeasible}: build {row['build_time'] or 0:.2f}s, solve {row['solve_time'] or 0:.2f}s, "
+          f"peak {row['peak_memory_mb'] or 0:.0f} MB", flush=True)
+
+
+def print_loader_row(row):
+    """
+    Print one line per finished loader benchmark.
+    """
+    if row.get("error"):
+        print(f"{row['format']:<8} {row['num_names']} students: {row['error']}", flush=True)
+        return
+    print(f"{row['format']:<8} {row['num_names']} students, {row['bytes'] / 1024:.0f} KB: parse {row['parse_time'] * 1000:.1f} ms, "
+          f"validate {row['validate_time'] * 1000:.1f} ms, cached load {row['cached_time'] * 1000:.1f} ms", flush=True)
+
+
+if __name__ == "__main__":
+
+    # info and args
+    parser = argparse.ArgumentParser(description="Benchmark the solver on synthetic problems of increasing size.")
+    parser.add_argument("-s", "--sizes", type=int, nargs="+", default=[50, 100, 200], help="numbers of students (default 50 100 200)")
+    parser.add_argument("-g", "--group-sizes", type=int, nargs="+", default=[5], help="group sizes (default 5)")
+    parser.add_argument("-d", "--densities", type=float, nargs="+", default=[0.1], help="share of students in With rows and in Not With rows (default 0.1)")
+    parser.add_argument("-r", "--repeats", type=int, default=1, help="problems per size, group size, and density with seeds seed, seed + 1, ... (default 1)")
+    parser.add_argument("--infeasible-rate", type=float, default=0.0, help="share of problems made infeasible by a contradiction (default 0)")
+    parser.add_argument("-n", "--num-solutions", type=int, default=1, help="number of solutions per problem (default 1)")
+    parser.add_argument("-t", "--time-limit", type=float, default=60, help="time limit in seconds per solve (default 60)")
+    parser.add_argument("-e", "--engine", choices=ENGINES, default="pulp", help="model engine as in run_program.py (default pulp)")
+    parser.add_argument("-b", "--backend", choices=SOLVER_BACKENDS, default="cbc", help="solver for pulp engine (default cbc)")
+    parser.add_argument("--gap", type=float, default=None, help="relative MIP gap at which the solver stops")
+    parser.add_argument("--seed", type=int, default=0, help="seed of the first problem of each size (default 0)")
+    parser.add_argument("-o", "--output", type=str, default=None, help="CSV file the results are appended to (default results/benchmark.csv, results/loader_benchmark.csv with --loaders)")
+    parser.add_argument("--compare", action="store_true", help="only print the results already in the output file by case and commit")
+    parser.add_argument("--loaders", action="store_true", help="time reading the input in every format (xlsx, csv, parquet, json) instead of solving")
+    args = parser.parse_args()
+
+    if args.loaders:
+        output = args.output or "results/loader_benchmark.csv"
+        print(f"Timing input formats with {', '.join(str(size) for size in args.sizes)} students...")
+        results = benchmark_loaders(args.sizes, repeats=args.repeats if args.repeats > 1 else 3, seed=args.seed, on_result=print_loader_row)
+        save_results(results, output, columns=LOADER_COLUMNS)
+        print(f"Results saved as \"{output}\"")
+        raise SystemExit(0)
+
+    args.output = args.output or "results/benchmark.csv"
+    if not args.compare:
+        cases = benchmark_cases(args.sizes, args.group_sizes, args.densities, args.repeats, args.infeasible_rate, args.seed)
+        print(f"Running {len(cases)} benchmark case(s)...")
+        results = run_benchmark(cases, engine=args.engine, num_solutions=args.num_solutions, time_limit=args.time_limit,
+                                on_result=print_row, backend=args.backend, gap=args.gap, seed=args.seed)
+        all_results = save_results(results, args.output)
+        print(f"Results saved as \"{args.output}\"")
+    else:
+        all_results = pd.read_csv(args.output)
+
+    print()
+    print(compare_results(all_results).to_string(index=False))
@@ -5,72 +5,314 @@ Script that solves linear program to assign students to groups. Group assignment
 """
 import argparse
 import datetime
+import functools
+import os
 
-from src.assign_groups import *
+
+# configurations of every race and the winner, appended by runs with --race
+RACE_LOG_FILENAME = "results/race_log.csv"
+
+
+def trace_phases(profiler, trace, record):
+    """
+    Add phase timers, counters, and peak memory since the last record to profile trace and start over. Does nothing without profiler.
+    """
+    if profiler is None:
+        return
+    record.update(profiler.snapshot())
+    trace["records"].append(record)
+    profiler.reset()
+
+
+def print_solution(spec, solution_df, verbose):
+    """
+    Print maximum characteristic constraints relaxed by solution and, if verbose, the student groups.
+    """
+    # report maximum characteristic constraints relaxed by slack
+    for row in relaxed_max_char_constraints(spec, solution_df).itertuples():
+        print(f"Relaxed maximum constraint index {row.index} ({row.characteristic} = {row.value}) in group {row.group}: {row.count} > {row.maximum}")
+
+    # display student groups
+    if verbose:
+
+        for name, group in solution_df.groupby("group"):
+
+            print(f"GROUP {name}:\n")
+            for n in group["name"].values:
+                print(f"\t{n}")
+            print()
 
 
 if __name__ == "__main__":
 
     # info and args
     parser = argparse.ArgumentParser(description="Solve linear program to assign students to groups subject to constraints.")
-    parser.add_argument("filename", type=str, help="filename for Excel spreadsheet with student, group, and constraint data as your_filename_here.xlsx")
+    parser.add_argument("filename", type=str, help="filename for Excel spreadsheet with student, group, and constraint data as your_filename_here.xlsx, or .json document or directory of .csv or .parquet files with the same sheets")
     parser.add_argument("num_solutions", type=int, help="desired number of optimal solutions")
     parser.add_argument("-s", "--save", action="store_true", help="save student groups to Excel spreadsheet")
+    parser.add_argument("-o", "--output", type=str, default=None, help="write each solution to this .xlsx, .csv, or .jsonl file as soon as it is found")
     parser.add_argument("-v", "--verbose", action="store_true", help="print solution(s) in terminal")
+    parser.add_argument("-e", "--engine", choices=["pulp", "sparse", "heuristic"], default="pulp", help="model engine: PuLP expressions solved with CBC (default), vectorized sparse matrix solved in-process with HiGHS (requires scipy), or greedy construction and simulated annealing for very large classes (requires scipy)")
+    parser.add_argument("-t", "--time-limit", type=float, default=None, help="time limit in seconds per solve (default none, 10 for heuristic engine)")
+    parser.add_argument("-b", "--backend", default="cbc", help="solver for pulp engine: cbc (default), highs, or glpk. The sparse engine always uses HiGHS in-process")
+    parser.add_argument("--threads", type=int, default=None, help="solver thread count (cbc and highs backends)")
+    parser.add_argument("--gap", type=float, default=None, help="relative MIP gap at which the solver stops, e.g. 0.01 for 1%%")
+    parser.add_argument("--polish", action="store_true", help="with heuristic engine, reoptimize part of each solution exactly at the end of the time limit")
+    parser.add_argument("--seed", type=int, default=None, help="random seed for solver, heuristic engine, and parallel solves")
+    parser.add_argument("-j", "--jobs", type=int, default=1, help="solve independent randomized problems in this many worker processes and keep the best diverse solutions (default 1, one solution after another)")
+    parser.add_argument("--race", type=int, default=None, metavar="N", help="race the first N solver configurations of the portfolio (CBC and HiGHS with different seeds, sparse engine) in separate processes for each solution, keep the first proven optimal one, and log the winner to results/race_log.csv")
+    parser.add_argument("--no-presolve", action="store_true", help="build sparse engine model without presolve")
+    parser.add_argument("--decompose", action="store_true", help="with sparse engine, split the presolved problem into independent components (students who can never share a group) and solve them in parallel")
+    parser.add_argument("--hierarchical", type=int, nargs="?", const=0, default=None, metavar="SECTIONS", help="with sparse engine, assign students to sections (the \"section\" column of \"Grouping Setup\", or SECTIONS sections of about the same size, default one per 250 students), solve the sections in parallel, and repair constraints across sections, for large cohorts")
+    parser.add_argument("--history", type=str, default=None, help="pair history .npz file: penalize students grouped together in earlier runs, then add this run's solutions to the file (pulp and sparse engines, default time limit 10 seconds per solve)")
+    parser.add_argument("--symmetry-breaking", action="store_true", help="order interchangeable groups so solutions never only relabel them (usually slower)")
+    parser.add_argument("--incremental", action="store_true", help="re-solve only the students affected by edits to the input since the last run on it, keeping everyone else in their groups (one solution, requires scipy)")
+    parser.add_argument("--resume", action="store_true", help="continue from the solutions of an earlier (interrupted) run with the same input and options instead of solving them again")
+    parser.add_argument("--profile", type=str, default=None, help="write JSON trace with time per phase, row and variable counts per constraint family, and peak memory for setup and each solution to this file")
     args = parser.parse_args()
 
+    if args.history and (args.engine == "heuristic" or args.jobs > 1 or args.decompose):
+        parser.error("--history requires the pulp or sparse engine and one job without --decompose")
+    if args.decompose and (args.engine != "sparse" or args.no_presolve):
+        parser.error("--decompose requires the sparse engine with presolve")
+    if args.hierarchical is not None and (args.engine != "sparse" or args.no_presolve or args.decompose or args.history or args.race):
+        parser.error("--hierarchical requires the sparse engine with presolve without --decompose, --history, or --race")
+    if args.race and (args.jobs > 1 or args.history or args.decompose or args.incremental):
+        parser.error("--race requires one job without --history, --decompose, or --incremental")
+    if args.resume and (args.jobs > 1 or args.history):
+        parser.error("--resume requires one job without --history")
+    if args.incremental and (args.num_solutions != 1 or args.jobs > 1 or args.history or args.resume):
+        parser.error("--incremental requires num_solutions 1 and one job without --history or --resume")
+
+    # import after parsing, so --help and argument errors do not wait for pandas and PuLP
+    from src.assign_groups import *
+    from src.incremental import format_incremental_info, incremental_solve, read_last_run, write_last_run
+    from src.infeasibility import find_infeasibilities
+    from src.model_cache import DEFAULT_CACHE_DIR, checkpoint_path, model_key
+    from src.profiling import enable_profiling, phase, write_trace
+    from src.solver_session import SolverSession
+    from src.streaming import JsonLinesSolutionWriter, read_solutions, solution_writer, solve_solutions
+
+    if args.backend not in SOLVER_BACKENDS:
+        parser.error(f"argument -b/--backend: invalid choice: '{args.backend}' (choose from {', '.join(map(repr, SOLVER_BACKENDS))})")
+    if args.engine == "pulp" and not backend_available(args.backend):
+        parser.error(f"argument -b/--backend: solver backend '{args.backend}' is not installed")
+
+    # phase timers and counters of the main process, one trace record for setup and one per solution
+    profiler = enable_profiling() if args.profile else None
+    trace = {"filename": args.filename, "engine": args.engine, "num_solutions": args.num_solutions, "jobs": args.jobs, "records": []}
+
     filename = "data/" + args.filename
-    unique_solutions = []
+    spec = load_problem_spec(filename)
 
+    # stop before building the model when constraint rows contradict each other
+    with phase("infeasibility"):
+        conflicts = find_infeasibilities(spec)
+    if conflicts:
+        print("Infeasible constraints found before solving:")
+        for conflict in conflicts:
+            print(f"\t{conflict}")
+        if profiler is not None:
+            trace_phases(profiler, trace, {"record": "setup", "conflicts": conflicts})
+            write_trace(args.profile, trace)
+        raise SystemExit(1)
 
-    # collect optimal solutions
-    for i in range(args.num_solutions):
 
-        print(f"\nSOLUTION {i}\n")
+    # each solution is one more grouping in the pair history
+    pair_history = None
+    if args.history:
+        from src.pair_history import DEFAULT_TIME_LIMIT as HISTORY_TIME_LIMIT, PairHistory
+        pair_history = PairHistory.load(args.history)
+        print(f"Pair history: {pair_history.num_groupings} earlier groupings, {pair_history.num_pairs} pairs")
+        if args.time_limit is None:
+            args.time_limit = HISTORY_TIME_LIMIT
 
-        print("Solving with rigid maximum constraint...")
-        status, solution_df = run_lp_problem(filename,
-                                             elastic=False,
-                                             unique_solutions=unique_solutions)
+    if args.race:
+        from src.portfolio import RaceSession, default_portfolio
+        # one process per configuration, losing solver processes are killed when a solution is proven optimal
+        Session = functools.partial(RaceSession, configs=default_portfolio(args.race), time_limit=args.time_limit, gap=args.gap,
+                                    log_file=RACE_LOG_FILENAME)
+    elif args.hierarchical is not None:
+        from src.hierarchical import HierarchicalSession
+        from src.presolve import format_presolve_stats
+        # sections in parallel unless the randomized solves already use the processes
+        Session = functools.partial(HierarchicalSession, num_sections=args.hierarchical or None, symmetry_breaking=args.symmetry_breaking,
+                                    time_limit=args.time_limit, gap=args.gap, jobs=os.cpu_count() if args.jobs <= 1 else 1)
+    elif args.decompose:
+        from src.decompose import DecomposedSession
+        from src.presolve import format_presolve_stats
+        # components in parallel unless the randomized solves already use the processes
+        Session = functools.partial(DecomposedSession, symmetry_breaking=args.symmetry_breaking,
+                                    time_limit=args.time_limit, gap=args.gap, jobs=os.cpu_count() if args.jobs <= 1 else 1)
+    elif args.engine == "sparse":
+        from src.sparse_model import SparseSession
+        from src.presolve import format_presolve_stats
+        Session = functools.partial(SparseSession, presolve=not args.no_presolve, symmetry_breaking=args.symmetry_breaking,
+                                    time_limit=args.time_limit, gap=args.gap, pair_history=pair_history, cache_dir=DEFAULT_CACHE_DIR)
+    elif args.engine == "heuristic":
+        from src.heuristic import DEFAULT_TIME_LIMIT, HeuristicSession
+        time_limit = args.time_limit if args.time_limit is not None else DEFAULT_TIME_LIMIT
+        Session = functools.partial(HeuristicSession, time_limit=time_limit, polish=args.polish, seed=args.seed)
+    else:
+        # keep CBC output of worker processes out of the terminal
+        Session = functools.partial(SolverSession, symmetry_breaking=args.symmetry_breaking, msg=args.jobs <= 1,
+                                    backend=args.backend, threads=args.threads, time_limit=args.time_limit, gap=args.gap, seed=args.seed,
+                                    pair_history=pair_history)
 
-        if status != "Optimal":
+    # solutions are written as they are found instead of being kept until the end
+    output_filenames = [args.output] if args.output else []
+    if args.save:
+        # output filename as "groupings_yyyymmdd_hhmmss.xlsx"
+        output_filenames.append("results/groupings_"+datetime.datetime.now().strftime("%Y%m%d_%H%M%S")+".xlsx")
+    writers = [solution_writer(output_filename) for output_filename in output_filenames]
 
-            print(f"{status}...")
+    last_run = read_last_run(filename) if args.incremental else None
+    if args.incremental and last_run is None:
+        print(f"No earlier run on \"{filename}\", solving from scratch")
 
-            print("Solving with elastic maximum constraint...")
-            status, solution_df = run_lp_problem(filename,
-                                                 elastic=True,
-                                                 unique_solutions=unique_solutions)
+    if last_run is not None:
 
-            if status != "Optimal":
+        # fix students the edits do not affect and re-solve the neighborhood of the changes
+        last_spec, last_solution_df = last_run
+        status, solution_df, info = incremental_solve(last_spec, last_solution_df, spec, time_limit=args.time_limit, gap=args.gap)
+        print("Changes since the last run:" if info["changes"] else "No changes since the last run")
+        for change in info["changes"]:
+            print(f"\t{change}")
+        print(format_incremental_info(info, len(spec.names), len(spec.groups)))
+        print("\nSOLUTION 0\n")
+        print(format_solve_stats(info["stats"]))
+        trace_phases(profiler, trace, {"record": "incremental", "changes": info["changes"], "free_names": info["free_names"],
+                                       "rounds": info["rounds"], "moved": info["moved"], "stats": info["stats"]})
 
-                print(f"Unsolvable with rigid or elastic constraint. Solution {status}.")
-                break
+        if status not in SOLVED_STATUSES:
+            print(f"Unsolvable. Solution {status}.")
+        else:
+            print(f"{status}...\n")
+            print_solution(spec, solution_df, args.verbose)
+            with phase("save"):
+                for writer in writers:
+                    writer.write(solution_df, info["stats"])
+            write_last_run(filename, spec, solution_df)
 
-        print(f"{status}...\n")
+    elif args.jobs > 1:
 
-        # store unique optimal solution
-        unique_solutions.append(solution_df)
+        # independent randomized solves in worker processes, keep best diverse partitions
+        from src.parallel import DEFAULT_OVERSAMPLE, solve_parallel
+        print(f"Solving {args.num_solutions * DEFAULT_OVERSAMPLE} randomized problems with {args.jobs} processes...")
+        unique_solutions, parallel_stats = solve_parallel(spec, Session, args.num_solutions, args.jobs, seed=args.seed)
+        # worker processes are not profiled
+        trace_phases(profiler, trace, {"record": "parallel", "solves": parallel_stats["solves"], "optimal": parallel_stats["optimal"],
+                                       "solve_stats": parallel_stats["solve_stats"]})
+        print(f"{parallel_stats['optimal']} of {parallel_stats['solves']} optimal, "
+              f"{parallel_stats['unique']} unique up to group relabeling")
 
-        # display student groups
-        if args.verbose:
+        for i, (solution_df, solve_stats) in enumerate(zip(unique_solutions, parallel_stats["solve_stats"])):
+            print(f"\nSOLUTION {i}\n")
+            print(format_solve_stats(solve_stats))
+            print_solution(spec, solution_df, args.verbose)
+            with phase("save"):
+                for writer in writers:
+                    writer.write(solution_df, solve_stats)
+            if i == 0:
+                write_last_run(filename, spec, solution_df)
 
-            for name, group in solution_df.groupby("group"):
+    else:
 
-                print(f"GROUP {name}:\n")
-                for n in group["name"].values:
-                    print(f"\t{n}")
-                print()
+        # every solution is saved to a checkpoint keyed by input and options, so a later run continues instead of solving it again
+        key = model_key(spec, {"engine": "race" if args.race else args.engine, "presolve": not args.no_presolve, "decompose": args.decompose,
+                               "symmetry_breaking": args.symmetry_breaking, "time_limit": args.time_limit, "gap": args.gap,
+                               **({"backend": args.backend} if args.engine == "pulp" and not args.race else {}),
+                               **({"hierarchical": args.hierarchical} if args.hierarchical is not None else {})})
+        checkpoint_filename = checkpoint_path(key)
+        resumed, resumed_stats = [], []
+        if args.resume and os.path.exists(checkpoint_filename):
+            resumed, resumed_stats = read_solutions(checkpoint_filename, return_stats=True)
+        os.makedirs(os.path.dirname(checkpoint_filename), exist_ok=True)
+        # new solutions go after the last complete one, extra solutions stay in the checkpoint for a later run
+        checkpoint = JsonLinesSolutionWriter(checkpoint_filename, append=args.resume, num_solutions=len(resumed))
+        resumed, resumed_stats = resumed[:args.num_solutions], resumed_stats[:args.num_solutions]
+        if args.resume:
+            print(f"Resuming from {len(resumed)} solution(s) in checkpoint \"{checkpoint_filename}\"")
 
-    # save student groups
-    if args.save:
+        # build model once with slack on maximum characteristic rows and add one uniqueness cut per collected solution
+        session = Session(spec, elastic=True, unique_solutions=resumed)
+        try:
+            if session.presolve_stats:
+                print(format_presolve_stats(session.presolve_stats))
+            if args.hierarchical is not None:
+                from src.hierarchical import format_section_stats
+                print(format_section_stats(session.section_stats))
+            for class_groups in session.group_classes:
+                print(f"Interchangeable groups: {', '.join(str(group) for group in class_groups)}")
+            trace_phases(profiler, trace, {"record": "setup", "presolve_stats": session.presolve_stats})
 
-        # output filename as "groupings_yyyymmdd_hhmmss.xlsx"
-        output_filename = "results/groupings_"+datetime.datetime.now().strftime("%Y%m%d_%H%M%S")+".xlsx"
+            for i, (solution_df, solve_stats) in enumerate(zip(resumed, resumed_stats)):
+                print(f"\nSOLUTION {i} (checkpoint)\n")
+                print(format_solve_stats(solve_stats))
+                print_solution(spec, solution_df, args.verbose)
+                with phase("save"):
+                    for writer in writers:
+                        writer.write(solution_df, solve_stats)
+                if i == 0:
+                    write_last_run(filename, spec, solution_df)
+
+            # collect optimal solutions one at a time, each one is added to the session when the next is requested
+            num_found = len(resumed)
+            if num_found < args.num_solutions:
+                print(f"\nSOLUTION {num_found}\n")
+                print("Solving with elastic maximum constraint...")
+            for i, (solution_df, solve_stats) in enumerate(solve_solutions(session, args.num_solutions - num_found), start=num_found):
+
+                print(format_solve_stats(solve_stats))
+                if args.race:
+                    print(f"Race won by {solve_stats['winner']}")
+                if args.hierarchical is not None and session.repair_stats:
+                    print(f"Repaired {session.repair_stats['free_names']} students in {session.repair_stats['free_groups']} groups "
+                          f"after {session.repair_stats['rounds']} round(s), {session.repair_stats['moved']} moved")
+                    if session.repair_stats["duplicate"]:
+                        print("Same groups as an earlier solution, no other solution found")
+                print(f"{solve_stats['status']}...\n")
+                if pair_history is not None:
+                    print(f"Repeated partners: {pair_history.repeated_pairs(solution_df)}")
+
+                print_solution(spec, solution_df, args.verbose)
+                with phase("save"):
+                    for writer in [checkpoint] + writers:
+                        writer.write(solution_df, solve_stats)
+                    if i == 0:
+                        write_last_run(filename, spec, solution_df)
+                trace_phases(profiler, trace, {"record": "solution", "solution": i, "stats": solve_stats})
+                num_found = i + 1
+
+                if i + 1 < args.num_solutions:
+                    print(f"\nSOLUTION {i + 1}\n")
+                    print("Solving with elastic maximum constraint...")
+
+            if num_found < args.num_solutions:
+
+                print(format_solve_stats(session.last_stats))
+                print(f"Unsolvable. Solution {session.last_stats['status']}.")
+                trace_phases(profiler, trace, {"record": "solution", "solution": num_found, "stats": session.last_stats})
+        finally:
+            # shut down the worker pool of decomposed and hierarchical sessions
+            if hasattr(session, "close"):
+                session.close()
+            checkpoint.close()
+
+    # finish student groups files
+    with phase("save"):
+        for writer in writers:
+            writer.close()
+            print(f"Solution(s) saved as \"{writer.filename}\"")
 
-        with pd.ExcelWriter(output_filename) as writer:
-            for idx, solution_df in enumerate(unique_solutions):
-                solution_df.sort_values("group").to_excel(writer, sheet_name=f"Solution_{idx}", index=False)
+    # save pair history with this run's solutions
+    if pair_history is not None:
+        pair_history.save(args.history)
+        print(f"Pair history saved as \"{args.history}\"")
 
-        print(f"Solution(s) saved as \"{output_filename}\"")
+    # save profile trace
+    if profiler is not None:
+        trace_phases(profiler, trace, {"record": "save"})
+        write_trace(args.profile, trace)
+        print(f"Profile trace saved as \"{args.profile}\"")
 
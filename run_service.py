@@ -0,0 +1,44 @@
+"""
+
+Script that runs a long-lived local service for a web front end or scripts. The service keeps parsed workbooks and built models in memory, so each request only pays for solving, and answers solve, verify, and diff requests as JSON over HTTP (see src/service.py and its ServiceClient).
+
+Example:
+
+    python run_service.py --workers 4 --preload data/data_template.xlsx
+
+    curl -d '{"filename": "data/data_template.xlsx", "num_solutions": 2}' http://127.0.0.1:8765/solve
+    curl http://127.0.0.1:8765/metrics
+
+"""
+import argparse
+
+from src.service import DEFAULT_HOST, DEFAULT_MAX_QUEUE, DEFAULT_PORT, MODEL_CACHE_SIZE, SPEC_CACHE_SIZE, GroupingService, make_server
+
+
+if __name__ == "__main__":
+
+    # info and args
+    parser = argparse.ArgumentParser(description="Run a local service that solves, verifies, and compares student grouping workbooks kept in memory.")
+    parser.add_argument("--host", type=str, default=DEFAULT_HOST, help=f"address to listen on (default {DEFAULT_HOST}, local connections only)")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT, help=f"port to listen on (default {DEFAULT_PORT})")
+    parser.add_argument("-j", "--workers", type=int, default=None, help="number of requests solved at once (default number of CPUs)")
+    parser.add_argument("--max-queue", type=int, default=DEFAULT_MAX_QUEUE, help=f"number of requests waiting for a worker before new requests are refused (default {DEFAULT_MAX_QUEUE})")
+    parser.add_argument("--spec-cache", type=int, default=SPEC_CACHE_SIZE, help=f"number of parsed workbooks kept in memory (default {SPEC_CACHE_SIZE})")
+    parser.add_argument("--model-cache", type=int, default=MODEL_CACHE_SIZE, help=f"number of built models kept in memory (default {MODEL_CACHE_SIZE})")
+    parser.add_argument("--preload", type=str, nargs="*", default=[], help="workbooks to parse before the first request")
+    args = parser.parse_args()
+
+    service = GroupingService(args.workers, args.max_queue, args.spec_cache, args.model_cache)
+    for filename in args.preload:
+        service.spec(filename)
+        print(f"Loaded \"{filename}\"")
+
+    server = make_server(service, args.host, args.port)
+    print(f"Serving on http://{args.host}:{args.port} with {service.workers} worker(s), press Ctrl+C to stop")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.close()
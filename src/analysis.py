@@ -0,0 +1,165 @@
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+from src.encoding import encode_problem_spec
+from src.verify import encode_solutions
+
+
+####################
+# Helper Functions #
+####################
+
+def membership_matrix(labels, n_groups):
+    """
+    Create sparse (names x solutions * groups) one-hot matrix with a one at (name, solution * n_groups + group) for each assignment in (solutions x names) label matrix. Names labeled -1 have no entry for that solution.
+    """
+    S, n = labels.shape
+    solution_idx, name_idx = np.nonzero(labels >= 0)
+    cols = solution_idx * n_groups + labels[solution_idx, name_idx]
+    return sparse.csr_matrix((np.ones(len(cols), dtype=np.int64), (name_idx, cols)), shape=(n, S * n_groups))
+
+
+def pairs(counts):
+    """
+    Number of unordered pairs within groups of the given sizes.
+    """
+    counts = np.asarray(counts, dtype=np.int64)
+    return counts * (counts - 1) // 2
+
+
+def pairs_together(labels, n_groups):
+    """
+    Number of pairs of names in the same group for each solution.
+    """
+    S = len(labels)
+    solution_idx, name_idx = np.nonzero(labels >= 0)
+    sizes = np.bincount(solution_idx * n_groups + labels[solution_idx, name_idx], minlength=S * n_groups)
+    return pairs(sizes).reshape(S, n_groups).sum(axis=1)
+
+
+def pairs_together_in_both(labels, n_groups):
+    """
+    Create (solutions x solutions) matrix with the number of pairs of names in the same group in both solutions. For each solution a, combine its labels with the labels of every later solution b into one key per name, sort each row of keys, and count pairs of equal keys in each run.
+    """
+    S, n = labels.shape
+    both = np.zeros((S, S), dtype=np.int64)
+    # names missing from either solution get a key of their own
+    missing_keys = n_groups * n_groups + np.arange(n)
+
+    for a in range(S):
+        keys = labels[a][None, :] * n_groups + labels[a:]
+        keys = np.where((labels[a][None, :] < 0) | (labels[a:] < 0), missing_keys[None, :], keys).astype(np.int64)
+        keys.sort(axis=1)
+        # position of each key within its run of equal keys, summed per row, is the number of equal pairs
+        equal = keys[:, 1:] == keys[:, :-1]
+        run_count = np.cumsum(equal, axis=1)
+        run_start = np.maximum.accumulate(np.where(equal, 0, run_count), axis=1)
+        both[a, a:] = (run_count - run_start).sum(axis=1)
+
+    return np.triu(both) + np.triu(both, k=1).T
+
+
+def pair_counts(labels, n_groups):
+    """
+    Count pairs of names in the same group in each solution and in both of each two solutions. Return array of length solutions and (solutions x solutions) matrix.
+    """
+    return pairs_together(labels, n_groups), pairs_together_in_both(labels, n_groups)
+
+
+#####################
+# Solution Distance #
+#####################
+
+def distance_matrix(together, both):
+    """
+    Create (solutions x solutions) matrix of pairs broken from pair_counts: the number of pairs of names in the same group in exactly one of two solutions. Does not depend on group labels, so relabeled copies of a partition are at distance zero.
+    """
+    return together[:, None] + together[None, :] - 2 * both
+
+
+def adjusted_rand_matrix(together, both, n_names):
+    """
+    Create (solutions x solutions) matrix of adjusted Rand index from pair_counts: 1 for identical partitions up to relabeling, around 0 for partitions no more alike than random groupings of the same sizes.
+    """
+    together = together.astype(float)
+    expected = together[:, None] * together[None, :] / max(pairs(n_names), 1)
+    maximum = (together[:, None] + together[None, :]) / 2
+    with np.errstate(divide="ignore", invalid="ignore"):
+        ari = (both - expected) / (maximum - expected)
+    return np.where(maximum == expected, 1.0, ari)
+
+
+#################
+# Co-Membership #
+#################
+
+def comembership_counts(labels, n_groups):
+    """
+    Create sparse (names x names) matrix with the number of solutions in which two names are in the same group. The diagonal counts the solutions in which each name is assigned.
+    """
+    membership = membership_matrix(labels, n_groups)
+    return (membership @ membership.T).tocsr()
+
+
+def frequent_pairs(encoded, comembership, min_count):
+    """
+    Create DataFrame of pairs of names in the same group in at least min_count solutions, most frequent first.
+    """
+    upper = sparse.triu(comembership, k=1).tocoo()
+    keep = upper.data >= min_count
+    df = pd.DataFrame({
+        "name_0": np.asarray(encoded.names, dtype=object)[upper.row[keep]],
+        "name_1": np.asarray(encoded.names, dtype=object)[upper.col[keep]],
+        "count": upper.data[keep],
+    })
+    return df.sort_values(["count", "name_0", "name_1"], ascending=[False, True, True]).reset_index(drop=True)
+
+
+###################
+# Analysis Report #
+###################
+
+def analyze_solutions(spec, unique_solutions, min_count=None):
+    """
+    Compare all solutions at once. Return dict with (solutions x solutions) DataFrames of pairs broken ("distance") and adjusted Rand index ("adjusted_rand"), sparse (names x names) co-membership counts ("comembership"), and DataFrame of pairs of names together in at least min_count solutions ("frequent_pairs", default every solution) with the min_count used.
+    """
+    encoded = encode_problem_spec(spec)
+    labels = encode_solutions(encoded, unique_solutions)
+    G = encoded.n_groups
+    S = len(labels)
+
+    together, both = pair_counts(labels, G)
+    comembership = comembership_counts(labels, G)
+    min_count = min_count if min_count is not None else S
+    solution_index = pd.Index(range(S), name="solution")
+    return {
+        "distance": pd.DataFrame(distance_matrix(together, both), index=solution_index, columns=solution_index),
+        "adjusted_rand": pd.DataFrame(adjusted_rand_matrix(together, both, encoded.n_names),
+                                      index=solution_index, columns=solution_index),
+        "comembership": comembership,
+        "frequent_pairs": frequent_pairs(encoded, comembership, min_count),
+        "min_count": min_count,
+    }
+
+
+def print_analysis(analysis):
+    """
+    Print closest other solution for each solution and the pairs of names that are always (or most often) together.
+    """
+    distance = analysis["distance"].to_numpy()
+    ari = analysis["adjusted_rand"].to_numpy()
+    S = len(distance)
+
+    if S > 1:
+        masked = distance + np.diag(np.full(S, np.iinfo(np.int64).max // 2))
+        for idx in range(S):
+            closest = int(masked[idx].argmin())
+            print(f"\tsolution {idx}: closest solution {closest} ({distance[idx, closest]} pairs broken, adjusted Rand {ari[idx, closest]:.2f})")
+        upper = distance[np.triu_indices(S, k=1)]
+        print(f" ==> pairs broken between solutions: min {upper.min()}, mean {upper.mean():.1f}, max {upper.max()}")
+
+    frequent = analysis["frequent_pairs"]
+    print(f"\n{len(frequent)} pair(s) of students together in at least {analysis['min_count']} solution(s)")
+    for row in frequent.head(20).itertuples():
+        print(f"\t{row.name_0} & {row.name_1}: {row.count}")
@@ -1,6 +1,29 @@
+import os
+import re
+import tempfile
+import time
+
+import numpy as np
 import pandas as pd
 import pulp
-import random
+
+from src.encoding import encode_problem_spec
+from src.problem_spec import as_problem_spec, load_problem_spec
+from src.profiling import count, phase, record
+from src.symmetry import interchangeable_groups
+
+
+# name prefix of elastic maximum characteristic slack variables
+SLACK_PREFIX = "Max_Slack_"
+
+# name prefix of pair history repeat partner constraints
+PAIR_PREFIX = "Pair_History_"
+
+# PuLP solver backends supported by make_solver
+SOLVER_BACKENDS = ["cbc", "highs", "glpk"]
+
+# statuses of a solve with a solution, "Feasible" when the time limit stopped the solver before it proved the solution optimal
+SOLVED_STATUSES = ["Optimal", "Feasible"]
 
 
 ####################
@@ -11,35 +34,44 @@ def import_from_template(file, sheet):
     """
     Import data from template .xlsx file. Exclude one-row header.
     """
-    return pd.read_excel(file, sheet_name=sheet, header=1)
+    with phase("import_from_template"):
+        return pd.read_excel(file, sheet_name=sheet, header=1)
 
 
-def create_name_group_tups(file):
+def allowed_name_groups(encoded):
     """
-    Create list of possible (name, group) combinations.
+    Create boolean (names x groups) matrix of the (name, group) pairs allowed by the In, Not In, and Homogenous constraints. Names assigned together by a With row share the groups allowed for all of them. A name left without any allowed group keeps every group, so its constraint rows are added as before and the solver reports the problem infeasible.
     """
-    person_df = import_from_template(file, "Person Setup")
-    names = person_df["name"].to_list()
-
-    group_df = import_from_template(file, "Grouping Setup")
-    groups = group_df["group id"].to_list()
+    allowed = np.ones((encoded.n_names, encoded.n_groups), dtype=bool)
+    allowed[encoded.not_in_names, encoded.not_in_groups] = False
+    for group_idx, mask in zip(encoded.hom_groups, encoded.hom_masks):
+        allowed[~mask, group_idx] = False
+    in_mask = np.zeros_like(allowed)
+    in_mask[encoded.in_names, encoded.in_groups] = True
+    has_in = in_mask.any(axis=1)
+    allowed[has_in] &= in_mask[has_in]
 
-    name_group_tups = [(name, group) for name in names for group in groups]
+    # with: repeat until every name in a chain of With pairs has the same allowed groups
+    pairs = encoded.with_pairs()
+    while len(pairs):
+        before = allowed.sum()
+        np.logical_and.at(allowed, pairs[:, 0], allowed[pairs[:, 1]])
+        np.logical_and.at(allowed, pairs[:, 1], allowed[pairs[:, 0]])
+        if allowed.sum() == before:
+            break
 
-    return name_group_tups
+    allowed[~allowed.any(axis=1)] = True
+    return allowed
 
 
 def extract_names_groups_from_d_vars(d_vars):
     """
-    Create list of unique names and groups from the decision variables where each decision variable is formatted as a dict with key (name, group) and value "Decision_Variable_(name, _group)".
+    Create list of unique names and groups from the decision variables, in the order of the "Person Setup" and "Grouping Setup" sheets for DecisionVariables or in key order for a dict with key (name, group).
     """
-    names = []
-    groups = []
-    for name, group in d_vars.keys():
-        if name not in names:
-            names.append(name)
-        if group not in groups:
-            groups.append(group)
+    if isinstance(d_vars, DecisionVariables):
+        return list(d_vars.names), list(d_vars.groups)
+    names = list(dict.fromkeys(name for name, group in d_vars.keys()))
+    groups = list(dict.fromkeys(group for name, group in d_vars.keys()))
     return names, groups
 
 
@@ -50,16 +82,267 @@ def create_groups_size_dict(group_df):
     return pd.Series(group_df["size"].values, index=group_df["group id"]).to_dict()
 
 
+######################
+# Decision Variables #
+######################
+
+class DecisionVariables(object):
+    """
+    Binary decision variables x[name, group] for the allowed (name, group) pairs only (see allowed_name_groups). Names and groups are interned to integer indices in the order of the "Person Setup" and "Grouping Setup" sheets. Variables are kept in a list in (name, group) order with the index arrays name_idx and group_idx, and position[name index, group index] is the list position of a variable or -1 for a pair without one. Variables are named "x_<name index>_<group index>".
+
+    Also works as a read-only dict with key (name, group) like pulp.LpVariable.dicts, without keys for the pairs that are not allowed.
+    """
+
+    def __init__(self, encoded, allowed=None):
+        self.encoded = encoded
+        self.names = encoded.name_index
+        self.groups = encoded.group_index
+        allowed = allowed if allowed is not None else np.ones((encoded.n_names, encoded.n_groups), dtype=bool)
+        self.name_idx, self.group_idx = np.nonzero(allowed)
+        self.position = np.full(allowed.shape, -1, dtype=np.int32)
+        self.position[self.name_idx, self.group_idx] = np.arange(len(self.name_idx), dtype=np.int32)
+        self.variables = [pulp.LpVariable(f"x_{name_idx}_{group_idx}", cat="Binary")
+                          for name_idx, group_idx in zip(self.name_idx.tolist(), self.group_idx.tolist())]
+
+    def __repr__(self):
+        return f"DecisionVariables(names={len(self.names)}, groups={len(self.groups)}, variables={len(self.variables)})"
+
+    def __len__(self):
+        return len(self.variables)
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __contains__(self, key):
+        return self.var(*self.indices(key)) is not None
+
+    def __getitem__(self, key):
+        var = self.var(*self.indices(key))
+        if var is None:
+            raise KeyError(key)
+        return var
+
+    def indices(self, key):
+        """
+        Map (name, group) key to (name index, group index), -1 for an unknown name or group.
+        """
+        name, group = key
+        return (self.names.get_loc(name) if name in self.names else -1,
+                self.groups.get_loc(group) if group in self.groups else -1)
+
+    def var(self, name_idx, group_idx):
+        """
+        Variable of (name index, group index) or None for a pair without one.
+        """
+        if name_idx < 0 or group_idx < 0:
+            return None
+        position = self.position[name_idx, group_idx]
+        return self.variables[position] if position >= 0 else None
+
+    def get(self, key, default=None):
+        var = self.var(*self.indices(key))
+        return var if var is not None else default
+
+    def keys(self):
+        return zip(self.names[self.name_idx], self.groups[self.group_idx])
+
+    def values(self):
+        return self.variables
+
+    def items(self):
+        return zip(self.keys(), self.variables)
+
+    def by_name(self):
+        """
+        List variables of each name in name order.
+        """
+        splits = np.searchsorted(self.name_idx, np.arange(1, len(self.names)))
+        return [[self.variables[pos] for pos in positions] for positions in np.split(np.arange(len(self.variables)), splits)]
+
+    def by_group(self):
+        """
+        List variables of each group in group order.
+        """
+        order = np.argsort(self.group_idx, kind="stable")
+        splits = np.searchsorted(self.group_idx[order], np.arange(1, len(self.groups)))
+        return [[self.variables[pos] for pos in positions] for positions in np.split(order, splits)]
+
+    def names_vars(self, name_idx, group_idx):
+        """
+        List variables of names in array name_idx in group index, skipping names without one.
+        """
+        positions = self.position[name_idx, group_idx]
+        return [self.variables[pos] for pos in positions[positions >= 0]]
+
+    def solution_df(self):
+        """
+        Create solution DataFrame with names and assigned groups from the variable values of the latest solve.
+        """
+        values = np.array([var.varValue if var.varValue is not None else 0 for var in self.variables], dtype=float)
+        chosen = values > 0.5
+        return pd.DataFrame({"name": self.names[self.name_idx[chosen]].to_numpy(),
+                             "group": self.groups[self.group_idx[chosen]].to_numpy()})
+
+
+####################
+# Solver Functions #
+####################
+
+def backend_available(backend):
+    """
+    Whether the solver of backend is installed: the CBC binary that comes with PuLP, the highs binary or highspy, or the glpsol binary.
+    """
+    if backend == "cbc":
+        return pulp.PULP_CBC_CMD().available()
+    if backend == "highs":
+        return pulp.HiGHS_CMD().available() or pulp.HiGHS().available()
+    return pulp.GLPK_CMD().available()
+
+
+def make_solver(backend="cbc", msg=True, threads=None, time_limit=None, gap=None, seed=None, warm_start=False):
+    """
+    Create PuLP solver for backend ("cbc", "highs", or "glpk") with optional thread count, time limit in seconds, relative MIP gap, and random seed. Options the backend does not support are ignored (GLPK has no threads or warm start). Command line solvers write their output to a temporary log file, read back for node count and gap after the solve and printed if msg. Without the highs binary, HiGHS runs in-process through highspy.
+    """
+    if backend not in SOLVER_BACKENDS:
+        raise ValueError(f"Unknown solver backend \"{backend}\", use one of {SOLVER_BACKENDS}")
+
+    if backend == "highs" and not pulp.HiGHS_CMD().available():
+        params = {"random_seed": seed} if seed is not None else {}
+        solver = pulp.HiGHS(msg=msg, timeLimit=time_limit, gapRel=gap, threads=threads, **params)
+        log_path = None
+    else:
+        log_file = tempfile.NamedTemporaryFile(prefix=f"{backend}_", suffix=".log", delete=False)
+        log_file.close()
+        log_path = log_file.name
+
+        if backend == "cbc":
+            options = [f"randomCbcSeed {seed}", f"randomSeed {seed}"] if seed is not None else []
+            solver = pulp.PULP_CBC_CMD(msg=False, timeLimit=time_limit, gapRel=gap, threads=threads, options=options,
+                                       warmStart=warm_start, logPath=log_path)
+        elif backend == "highs":
+            options = [f"random_seed={seed}"] if seed is not None else []
+            solver = pulp.HiGHS_CMD(msg=False, timeLimit=time_limit, gapRel=gap, threads=threads, options=options,
+                                    warmStart=warm_start, logPath=log_path)
+        else:
+            options = ["--log", log_path]
+            if gap is not None:
+                options += ["--mipgap", str(gap)]
+            if seed is not None:
+                options += ["--seed", str(seed)]
+            solver = pulp.GLPK_CMD(msg=False, timeLimit=time_limit, options=options)
+
+        if not solver.available():
+            os.remove(log_path)
+            raise ValueError(f"Solver backend \"{backend}\" is not available")
+
+    solver.backend = backend
+    solver.log_path = log_path
+    solver.echo = msg
+    return solver
+
+
+def read_solver_log(solver):
+    """
+    Read and remove the log file of solver created by make_solver, printing it if the solver echoes its output. Return log text (empty for solvers not created by make_solver).
+    """
+    log_path = getattr(solver, "log_path", None)
+    if log_path is None or not os.path.exists(log_path):
+        return ""
+    with open(log_path) as log_file:
+        text = log_file.read()
+    os.remove(log_path)
+    if solver.echo:
+        print(text, end="")
+    return text
+
+
+def parse_solver_log(backend, text):
+    """
+    Find node count and relative gap in solver log text. Return (nodes, gap) with None for values the log does not report.
+    """
+    def search(pattern, cast):
+        match = re.search(pattern, text)
+        return cast(match.group(1)) if match else None
+
+    if backend == "cbc":
+        nodes = search(r"Enumerated nodes:\s+(\d+)", int)
+        gap = search(r"\nGap:\s+([-\d.eE+]+)", float)
+        if gap is None and "Result - Optimal solution found" in text:
+            gap = 0.0
+    elif backend == "highs":
+        nodes = search(r"Nodes\s+(\d+)", int)
+        gap = search(r"Gap\s+([\d.eE+-]+)%", float)
+        gap = gap / 100 if gap is not None else None
+    else:
+        nodes = None
+        gap = 0.0 if "INTEGER OPTIMAL SOLUTION FOUND" in text else None
+    return nodes, gap
+
+
+def parse_solver_time(prob, solver, log_text):
+    """
+    Find wall time spent in the solver itself in solver log text, or from the in-process HiGHS model. Return None when not reported (GLPK).
+    """
+    backend = getattr(solver, "backend", None)
+    if backend == "highs" and getattr(prob, "solverModel", None) is not None:
+        return float(prob.solverModel.getRunTime())
+    patterns = {
+        "cbc": r"Total time \(CPU seconds\):\s+[\d.]+\s+\(Wallclock seconds\):\s+([\d.]+)",
+        "highs": r"HiGHS run time\s+:\s+([\d.]+)",
+    }
+    match = re.search(patterns[backend], log_text) if backend in patterns else None
+    return float(match.group(1)) if match else None
+
+
+def solve_stats(prob, solver, status, log_text, wall_time):
+    """
+    Create dict of solve stats: backend, status, objective, relative gap, branch and bound nodes, solve wall time, and model build time (filled in by the caller).
+    """
+    backend = getattr(solver, "backend", None)
+    nodes, gap = parse_solver_log(backend, log_text)
+    if backend == "highs" and getattr(prob, "solverModel", None) is not None:
+        info = prob.solverModel.getInfo()
+        nodes, gap = int(info.mip_node_count), float(info.mip_gap)
+    return {
+        "backend": backend,
+        "status": status,
+        "objective": pulp.value(prob.objective),
+        "gap": gap,
+        "nodes": nodes,
+        "wall_time": wall_time,
+        "build_time": None,
+    }
+
+
+def solved_status(statuses):
+    """
+    Status of several solves that all found a solution: "Optimal" if every solution was proven optimal, "Feasible" otherwise.
+    """
+    return "Optimal" if all(status == "Optimal" for status in statuses) else "Feasible"
+
+
+def format_solve_stats(stats):
+    """
+    Format solve stats as one line.
+    """
+    def number(value, fmt):
+        return "-" if value is None else format(value, fmt)
+
+    return (f"Solve ({stats['backend']}): {stats['status']}, objective {number(stats['objective'], 'g')}, "
+            f"gap {number(stats['gap'], '.2%')}, nodes {number(stats['nodes'], 'd')}, "
+            f"wall time {stats['wall_time']:.2f}s, build time {number(stats['build_time'], '.2f')}s")
+
+
 ########################
 # LP Problem Functions #
 ########################
 
-def setup_lp_problem(var_tups):
+def setup_lp_problem(encoded, allowed=None):
     """
-    Instantiate LP problem with decision variables and arbitrary objective function (arbitrary because primary objective to meet constraints rather than min/max/etc. a function).
+    Instantiate LP problem with decision variables for the allowed (name, group) pairs (all pairs by default) and arbitrary objective function (arbitrary because primary objective to meet constraints rather than min/max/etc. a function).
     """
     prob = pulp.LpProblem("Problem", pulp.LpMinimize)
-    d_vars = pulp.LpVariable.dicts("Decision Variable", var_tups, cat='Binary')
+    d_vars = DecisionVariables(encoded, allowed)
     # arbitrary objective function
     prob += 0
     return prob, d_vars
@@ -69,146 +352,213 @@ def one_group_per_name_constraint(prob, d_vars, names, groups):
     """
     Add constraint to ensure one group assignment per name.
     """
-    for name in names:
-        prob += sum(d_vars[(name, group)] for group in groups) == 1
+    for name_vars in d_vars.by_name():
+        prob += pulp.lpSum(name_vars) == 1
     return prob
 
 
-def max_name_per_group_constraint(prob, d_vars, names, groups, file, sheet="Grouping Setup"):
+def max_name_per_group_constraint(prob, d_vars, names, groups, spec, sheet="Grouping Setup"):
     """
     Add constraint to ensure no more than maximum number of names assigned to each group.
     """
-    group_df = import_from_template(file, sheet)
+    group_df = spec.sheet(sheet)
     groups_size_dict = create_groups_size_dict(group_df)
-    for group in groups:
-        prob += sum(d_vars[(name, group)] for name in names) <= groups_size_dict[group]
+    for group, group_vars in zip(groups, d_vars.by_group()):
+        prob += pulp.lpSum(group_vars) <= groups_size_dict[group]
     return prob
 
 
-def with_constraint(prob, d_vars, groups, file, sheet="Constraint - With"):
+def with_constraint(prob, d_vars, groups, spec, sheet="Constraint - With"):
     """
-    Add constraint to ensure specified names assigned to group together.
+    Add constraint to ensure specified names assigned to group together. Groups allowed for only one of two names get a constraint to keep that name out.
     """
-    with_df = import_from_template(file, sheet)
+    with_df = spec.sheet(sheet)
     for idx, names_together_row in with_df.iterrows():
-        names_together = list(names_together_row.dropna().values)
-        for group in groups:
+        names_together = d_vars.names.get_indexer(names_together_row.dropna().values)
+        for group_idx in range(len(groups)):
             for idx in range(0, len(names_together)-1):
-                prob += d_vars[(names_together[idx], group)] == d_vars[(names_together[idx+1], group)]
+                var, next_var = d_vars.var(names_together[idx], group_idx), d_vars.var(names_together[idx+1], group_idx)
+                if var is not None and next_var is not None:
+                    prob += var == next_var
+                elif var is not None or next_var is not None:
+                    prob += (var if var is not None else next_var) == 0
     return prob
 
 
-def not_with_constraint(prob, d_vars, groups, file, sheet="Constraint - Not With"):
+def not_with_constraint(prob, d_vars, groups, spec, sheet="Constraint - Not With"):
     """
     Add constraint to ensure specified names assigned to different groups.
     """
-    not_with_df = import_from_template(file, sheet)
+    not_with_df = spec.sheet(sheet)
     for idx, names_separate_row in not_with_df.iterrows():
-        names_separate = list(names_separate_row.dropna().values)
-        for group in groups:
-            # no more than one of each specified name per group
-            prob += sum(d_vars[(name, group)] for name in names_separate) <= 1
+        names_separate = d_vars.names.get_indexer(names_separate_row.dropna().values)
+        for group_idx in range(len(groups)):
+            # no more than one of each specified name per group, no row for groups allowed for at most one name
+            group_vars = d_vars.names_vars(names_separate, group_idx)
+            if len(group_vars) > 1:
+                prob += pulp.lpSum(group_vars) <= 1
     return prob
 
 
-def in_constraint(prob, d_vars, file, sheet="Constraint - In"):
+def in_constraint(prob, d_vars, spec, sheet="Constraint - In"):
     """
-    Add constraint to ensure specified name assigned to specified group.
+    Add constraint to ensure specified name assigned to specified group. Usually the only variable of the name already (see allowed_name_groups).
     """
-    in_df = import_from_template(file, sheet)
+    in_df = spec.sheet(sheet)
     for idx, in_row in in_df.iterrows():
         prob += d_vars[(in_row["name"], in_row["group id"])] == 1
     return prob
 
 
-def not_in_constraint(prob, d_vars, file, sheet="Constraint - Not In"):
+def not_in_constraint(prob, d_vars, spec, sheet="Constraint - Not In"):
     """
-    Add constraint to ensure specified name not assigned to specified group.
+    Add constraint to ensure specified name not assigned to specified group. Only needed for names left with every group by allowed_name_groups, other names have no variable for the group.
     """
-    not_in_df = import_from_template(file, sheet)
+    not_in_df = spec.sheet(sheet)
     for idx, not_in_row in not_in_df.iterrows():
-        prob += d_vars[(not_in_row["name"], not_in_row["group id"])] == 0
+        var = d_vars.get((not_in_row["name"], not_in_row["group id"]))
+        if var is not None:
+            prob += var == 0
     return prob
 
 
-def homogenous_constraint(prob, d_vars, file, sheet="Constraint - Homogenous"):
+def homogenous_constraint(prob, d_vars, spec, sheet="Constraint - Homogenous"):
     """
-    Add constraint to ensure all names in specified group have specified characteristic.
+    Add constraint to ensure all names in specified group have specified characteristic. Only needed for names left with every group by allowed_name_groups, other names without the characteristic have no variable for the group.
     """
-    person_df = import_from_template(file, "Person Setup")
-    hom_df = import_from_template(file, sheet)
+    person_df = spec.person_df
+    hom_df = spec.sheet(sheet)
     for idx, hom_row in hom_df.iterrows():
-        person_without_char_df = person_df.loc[person_df[hom_row["characteristic"]] != hom_row["value"]]
-        names_without_char = person_without_char_df["name"].to_list()
+        names_without_char = np.flatnonzero((person_df[hom_row["characteristic"]] != hom_row["value"]).to_numpy())
         # exclude names without char from specified group
-        for name in names_without_char:
-            prob += d_vars[(name, hom_row["group id"])] == 0
+        for var in d_vars.names_vars(names_without_char, d_vars.groups.get_loc(hom_row["group id"])):
+            prob += var == 0
     return prob
 
 
-def max_char_constraint(prob, d_vars, groups, file, elastic, sheet="Constraint - Maximum"):
+def max_char_constraint(prob, d_vars, groups, spec, elastic, sheet="Constraint - Maximum"):
     """
-    Add rigid or elastic maximum characterstic constraint based on elastic parameter. Constraint ensures or encourages no more than the maximum number of people with specified characteristic assigned to each group. With elastic constraint, allow maximum number to relax to zero to ensure the feasibility of the problem.
+    Add rigid or elastic maximum characterstic constraint based on elastic parameter. Constraint ensures or encourages no more than the maximum number of people with specified characteristic assigned to each group. With elastic constraint, a named slack variable "Max_Slack_<row>_<group index>" lets the count exceed the maximum at a penalty per person (see set_slack_penalty) to ensure the feasibility of the problem.
     """
-    person_df = import_from_template(file, "Person Setup")
-    max_df = import_from_template(file, sheet)
+    person_df = spec.person_df
+    max_df = spec.sheet(sheet)
     for idx, max_row in max_df.iterrows():
-        person_with_char_df = person_df.loc[person_df[max_row["characteristic"]] == max_row["value"]]
-        names_with_char = person_with_char_df["name"].to_list()
-        for group in groups:
+        names_with_char = np.flatnonzero((person_df[max_row["characteristic"]] == max_row["value"]).to_numpy())
+        for group_idx, group in enumerate(groups):
+            constraint_lhs = pulp.lpSum(d_vars.names_vars(names_with_char, group_idx))
             if elastic:
-                constraint_lhs = sum(d_vars[(name, group)] for name in names_with_char)
-                constraint_rhs = max_row["maximum"]
-                # sense value -1 means less than or equal to (<=)
-                constraint = pulp.LpConstraint(constraint_lhs, sense=-1, name=int(1000000 * random.random()), rhs=constraint_rhs)
-                # penalty-free target interval of 100% on left and 0% on right side of the rhs value ==> [0, constraint_rhs]
-                e_constraint = constraint.makeElasticSubProblem(penalty=1, proportionFreeBoundList=[1, 0])
-                prob.extend(e_constraint)
+                slack = pulp.LpVariable(f"{SLACK_PREFIX}{idx}_{group_idx}", lowBound=0)
+                prob += constraint_lhs - slack <= max_row["maximum"], f"Maximum_{idx}_{group_idx}"
+                prob.objective += slack
             else:
-                prob += sum(d_vars[(name, group)] for name in names_with_char) <= max_row["maximum"]
+                prob += constraint_lhs <= max_row["maximum"]
+    return prob
+
+
+def symmetry_breaking_constraint(prob, d_vars, names, spec):
+    """
+    Add constraint to order each class of interchangeable groups (same size, not referred to by any In, Not In, or Homogenous constraint) by the lowest-indexed name assigned to the group. A prefix count variable tracks the names up to each name assigned to a group, and a name can only be assigned to the next group in the class once a lower-indexed name is assigned to the group before it. Removes solutions that only relabel groups. Names without a variable for a group (With partners of names with In or Not In rows) are skipped.
+    """
+    for class_idx, class_groups in enumerate(interchangeable_groups(d_vars.encoded)):
+        for group_idx in range(len(class_groups) - 1):
+            group, next_group = d_vars.groups.get_loc(class_groups[group_idx]), d_vars.groups.get_loc(class_groups[group_idx + 1])
+            prev_count = 0
+            for name_idx in range(len(names)):
+                next_var, var = d_vars.var(name_idx, next_group), d_vars.var(name_idx, group)
+                if next_var is not None:
+                    prob += next_var <= prev_count
+                if var is None:
+                    continue
+                count = pulp.LpVariable(f"Prefix_Count_{class_idx}_{group_idx}_{name_idx}", lowBound=0)
+                prob += count == prev_count + var
+                prev_count = count
     return prob
 
 
-def add_constraints(prob, d_vars, file, elastic_max_char_constraint):
+def add_constraints(prob, d_vars, spec, elastic_max_char_constraint, symmetry_breaking=False):
     """
     Add all constraints to LP problem.
     """
 
-    names, groups = extract_names_groups_from_d_vars(d_vars)
+    with phase("names_groups"):
+        names, groups = extract_names_groups_from_d_vars(d_vars)
 
-    prob = one_group_per_name_constraint(prob, d_vars, names, groups)
-    prob = max_name_per_group_constraint(prob, d_vars, names, groups, file)
-    prob = with_constraint(prob, d_vars, groups, file)
-    prob = not_with_constraint(prob, d_vars, groups, file)
-    prob = in_constraint(prob, d_vars, file)
-    prob = not_in_constraint(prob, d_vars, file)
-    prob = homogenous_constraint(prob, d_vars, file)
-    prob = max_char_constraint(prob, d_vars, groups, file, elastic_max_char_constraint)
+    prob = add_constraint_family(prob, "one_group_per_name", one_group_per_name_constraint, d_vars, names, groups)
+    prob = add_constraint_family(prob, "max_name_per_group", max_name_per_group_constraint, d_vars, names, groups, spec)
+    prob = add_constraint_family(prob, "with", with_constraint, d_vars, groups, spec)
+    prob = add_constraint_family(prob, "not_with", not_with_constraint, d_vars, groups, spec)
+    prob = add_constraint_family(prob, "in", in_constraint, d_vars, spec)
+    prob = add_constraint_family(prob, "not_in", not_in_constraint, d_vars, spec)
+    prob = add_constraint_family(prob, "homogenous", homogenous_constraint, d_vars, spec)
+    prob = add_constraint_family(prob, "maximum", max_char_constraint, d_vars, groups, spec, elastic_max_char_constraint)
+    if symmetry_breaking:
+        prob = add_constraint_family(prob, "symmetry", symmetry_breaking_constraint, d_vars, names, spec)
 
     return prob
 
 
-def solve_lp_problem(prob, d_vars):
+def add_constraint_family(prob, family, add_family, *args):
     """
-    Solve the LP problem and create solution DataFrame with names and assigned groups.
+    Add one family of constraints with add_family(prob, *args). While profiling, time it as a phase and count the rows and the variables it adds (the first family adds the decision variables).
     """
-    prob.solve()
+    rows, variables = prob.numConstraints(), prob.numVariables()
+    with phase(family):
+        prob = add_family(prob, *args)
+    count(f"rows/{family}", prob.numConstraints() - rows)
+    count(f"variables/{family}", prob.numVariables() - variables)
+    return prob
+
+
+def build_lp_problem(spec, elastic, symmetry_breaking=False):
+    """
+    Setup the LP problem with all constraints and a rigid or elastic maximum characteristic constraint based on elastic parameter.
+    """
+    with phase("build"):
+        encoded = encode_problem_spec(spec)
+        prob, d_vars = setup_lp_problem(encoded, allowed_name_groups(encoded))
+        prob = add_constraints(prob, d_vars, spec, elastic_max_char_constraint=elastic, symmetry_breaking=symmetry_breaking)
+    return prob, d_vars
+
+
+def solve_lp_problem(prob, d_vars, solver=None, return_stats=False):
+    """
+    Solve the LP problem and create solution DataFrame with names and assigned groups. Use CBC with default settings unless solver specified (see make_solver). Status is "Feasible" instead of PuLP's "Optimal" for a solution found before the time limit but not proven optimal. With return_stats, also return dict of solve stats (see solve_stats).
+    """
+    solver = solver if solver is not None else make_solver()
+    start = time.perf_counter()
+    with phase("solve"):
+        prob.solve(solver)
+        wall_time = time.perf_counter() - start
+        log_text = read_solver_log(solver)
+        # time in the solver itself, the rest of the solve is PuLP writing the problem and reading the solution
+        solver_time = parse_solver_time(prob, solver, log_text)
+        if solver_time is not None:
+            record("solver", solver_time)
     status = pulp.LpStatus[prob.status]
-    # d_vars as dict with {(name, group): "Decision_Variable_(name, _group)"}
-    soln_name_group_tups = [k for k, v in list(d_vars.items()) if v.varValue == 1.0]
-    solution_df = pd.DataFrame(soln_name_group_tups, columns=["name", "group"])
+    if status == "Optimal" and prob.sol_status == pulp.LpSolutionIntegerFeasible:
+        status = "Feasible"
+    with phase("extract"):
+        solution_df = d_vars.solution_df()
+    stats = solve_stats(prob, solver, status, log_text, wall_time)
+    if return_stats:
+        return status, solution_df, stats
     return status, solution_df
 
 
-def run_lp_problem(file, elastic, unique_solutions):
+def run_lp_problem(spec, elastic, unique_solutions, backend="cbc", threads=None, time_limit=None, gap=None, seed=None, return_stats=False):
     """
-    Setup and solve the LP problem with a rigid or elastic maximum characteristic constraint based on elastic parameter.
+    Setup and solve the LP problem with a rigid or elastic maximum characteristic constraint based on elastic parameter. Accepts a problem spec or a template .xlsx filename. Solver options as in make_solver. With return_stats, also return dict of solve stats including the model build time.
     """
-    var_tups = create_name_group_tups(file)
-    prob, d_vars = setup_lp_problem(var_tups)
-    prob = add_constraints(prob, d_vars, file, elastic_max_char_constraint=elastic)
+    start = time.perf_counter()
+    spec = as_problem_spec(spec)
+    prob, d_vars = build_lp_problem(spec, elastic)
     prob = add_unique_solution_constraint(prob, d_vars, unique_solutions)
-    status, solution_df = solve_lp_problem(prob, d_vars)
+    build_time = time.perf_counter() - start
+    solver = make_solver(backend, threads=threads, time_limit=time_limit, gap=gap, seed=seed)
+    status, solution_df, stats = solve_lp_problem(prob, d_vars, solver, return_stats=True)
+    stats["build_time"] = build_time
+    if return_stats:
+        return status, solution_df, stats
     return status, solution_df
 
 
@@ -216,18 +566,93 @@ def run_lp_problem(file, elastic, unique_solutions):
 # Multiple Solution Functions #
 ###############################
 
+def slack_penalty(num_names, num_solutions, pair_weight=0):
+    """
+    Penalty per person above a maximum characteristic constraint. Exceeds the largest possible number of repeat assignments (one per name per earlier solution) plus the largest possible pair history penalty, so relaxing a maximum always costs more than repeating assignments or partners (lexicographic objective).
+    """
+    return num_names * num_solutions + pair_weight + 1
+
+
+def set_slack_penalty(prob, penalty):
+    """
+    Set objective coefficient of every elastic maximum characteristic slack variable.
+    """
+    for var in list(prob.objective.keys()):
+        if var.name.startswith(SLACK_PREFIX):
+            prob.objective[var] = penalty
+    return prob
+
+
+def add_solution_cut(prob, d_vars, solution_df, idx):
+    """
+    Add cut to penalize repeat student assignments from one earlier solution. A nonnegative repeat variable bounds the number of students assigned to the same group as in the earlier solution and adds one penalty point per repeat to the objective. Encourages group assignments to change between solutions.
+    """
+    # assignments without a variable cannot repeat
+    solution_d_vars = [d_vars.get((name, group)) for name, group in zip(solution_df["name"], solution_df["group"])]
+    solution_d_vars = [var for var in solution_d_vars if var is not None]
+    repeats = pulp.LpVariable(f"Repeat_Assignments_{idx}", lowBound=0)
+    prob += pulp.lpSum(solution_d_vars) - repeats <= 0, f"Unique_Solution_{idx}"
+    prob.objective += repeats
+    return prob
+
+
 def add_unique_solution_constraint(prob, d_vars, unique_solutions):
     """
-    Add elastic constraint to penalize repeat student assignments. Encourages group assignments to change between solutions.
+    Add cut to penalize repeat student assignments for each earlier solution. Encourages group assignments to change between solutions.
     """
     if unique_solutions:
-        for solution_df in unique_solutions:
-            solution_d_vars = [d_vars[(row["name"], row["group"])] for idx, row in solution_df.iterrows()]
-            # sense value -1 means less than or equal to (<=)
-            # encourage no repeat student assignments
-            constraint = pulp.LpConstraint(sum(solution_d_vars), sense=-1, name=int(1000000 * random.random()), rhs=0)
-            # penalty-free target interval of 0% on either side of rhs (0)
-            # penalize repeat student assignments
-            e_constraint = constraint.makeElasticSubProblem(penalty=1, proportionFreeBound=0)
-            prob.extend(e_constraint)
-    return prob
\ No newline at end of file
+        for idx, solution_df in enumerate(unique_solutions):
+            prob = add_solution_cut(prob, d_vars, solution_df, idx)
+        names, groups = extract_names_groups_from_d_vars(d_vars)
+        prob = set_slack_penalty(prob, slack_penalty(len(names), len(unique_solutions)))
+    return prob
+
+
+def add_pair_history_constraint(prob, d_vars, spec, history, repeat_vars=None):
+    """
+    Add repeat partner rows (see PairPenaltyRows) to penalize placing names in the same group as names they were grouped with before, weighted by the number of earlier groupings in pair history. Replaces the rows from an earlier call, reusing the repeat variables in repeat_vars dict with {(name index, group index): variable}. Return problem, repeat variables, and largest possible penalty.
+    """
+    from src.pair_history import pair_penalty_rows
+
+    encoded = encode_problem_spec(spec)
+    groups = encoded.groups
+    repeat_vars = repeat_vars if repeat_vars is not None else {}
+    for constraint_name in [name for name in prob.constraints.keys() if name.startswith(PAIR_PREFIX)]:
+        del prob.constraints[constraint_name]
+
+    rows = pair_penalty_rows(encoded, history)
+    entries = pd.DataFrame({"k": rows.entry_k, "j": rows.entry_j, "count": rows.entry_count}).groupby("k")
+    for k, partner_df in entries:
+        name_idx = rows.partner_names[k]
+        for group_idx, group in enumerate(groups):
+            # no row for groups the name cannot be in
+            name_var = d_vars.var(name_idx, group_idx)
+            if name_var is None:
+                continue
+            key = (name_idx, group_idx)
+            if key not in repeat_vars:
+                repeat_vars[key] = pulp.LpVariable(f"Repeat_Partners_{name_idx}_{group_idx}", lowBound=0)
+                prob.objective += repeat_vars[key]
+            big_m = rows.big_m[k, group_idx]
+            partners = pulp.lpSum(count * var for var, count in zip(
+                (d_vars.var(j, group_idx) for j in partner_df["j"]), partner_df["count"]) if var is not None)
+            prob += partners + big_m * name_var - repeat_vars[key] <= big_m, f"{PAIR_PREFIX}{name_idx}_{group_idx}"
+    return prob, repeat_vars, rows.total_weight
+
+
+########################
+# Relaxation Functions #
+########################
+
+def relaxed_max_char_constraints(spec, solution_df, sheet="Constraint - Maximum"):
+    """
+    Create DataFrame of maximum characteristic constraints exceeded by solution with one row per (constraint row, group): constraint index, characteristic, value, maximum, group, count of names with characteristic, and excess over the maximum. Empty when no constraint is relaxed.
+    """
+    max_df = spec.sheet(sheet)
+    df = pd.merge(spec.person_df, solution_df, on="name")
+    relaxed = []
+    for idx, max_row in max_df.iterrows():
+        counts = df.loc[df[max_row["characteristic"]] == max_row["value"]].groupby("group").size()
+        for group, count in counts[counts > max_row["maximum"]].items():
+            relaxed.append((idx, max_row["characteristic"], max_row["value"], max_row["maximum"], group, count, count - max_row["maximum"]))
+    return pd.DataFrame(relaxed, columns=["index", "characteristic", "value", "maximum", "group", "count", "excess"])
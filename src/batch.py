@@ -0,0 +1,230 @@
+import concurrent.futures
+import os
+import time
+
+import pandas as pd
+
+from src.problem_spec import load_problem_spec, spec_format
+
+
+# summary row for each job, in column order
+SUMMARY_COLUMNS = ["workbook", "status", "solutions", "excess", "load_time", "build_time", "solve_time", "wall_time",
+                   "output", "error"]
+
+# session engines, imported in the worker so scipy is only needed for the engines that use it
+ENGINES = ["pulp", "sparse", "heuristic"]
+
+
+####################
+# Helper Functions #
+####################
+
+def is_workbook(path):
+    """
+    Whether path is an input load_problem_spec reads: .xlsx or .json file, or directory of .csv or .parquet sheet files (see spec_format).
+    """
+    try:
+        spec_format(path)
+    except ValueError:
+        return False
+    return True
+
+
+def find_workbooks(path):
+    """
+    List inputs to solve from a directory (every .xlsx and .json file and every directory of .csv or .parquet sheet files, sorted) or a manifest file. A .csv manifest has a "filename" column and optional "num_solutions" and "time_limit" columns. Any other manifest lists one filename per line. Relative filenames in a manifest are relative to the manifest. Return list of job dicts with filename and any per-job options.
+    """
+    if os.path.isdir(path):
+        filenames = sorted(f for f in os.listdir(path) if not f.startswith("~$") and is_workbook(os.path.join(path, f)))
+        return [{"filename": os.path.join(path, f)} for f in filenames]
+
+    base_dir = os.path.dirname(path)
+    if path.endswith(".csv"):
+        manifest = pd.read_csv(path)
+        options = [column for column in ["num_solutions", "time_limit"] if column in manifest.columns]
+        jobs = []
+        for row in manifest.to_dict("records"):
+            job = {"filename": os.path.join(base_dir, str(row["filename"]))}
+            job.update({option: row[option] for option in options if pd.notna(row[option])})
+            jobs.append(job)
+        return jobs
+
+    with open(path) as f:
+        lines = [line.strip() for line in f]
+    return [{"filename": os.path.join(base_dir, line)} for line in lines if line and not line.startswith("#")]
+
+
+def output_filenames(output_dir, filenames):
+    """
+    Create groupings output filename in output directory for each input from its path below the common directory of all inputs and its format (e.g. "sectionA/roster.xlsx" --> "sectionA_roster_xlsx_groupings.xlsx", directory of CSV files "roster" --> "roster_csv_groupings.xlsx"), so inputs with the same name never share an output. Raise ValueError if two inputs still map to the same output.
+    """
+    paths = [os.path.abspath(filename) for filename in filenames]
+    base_dir = os.path.commonpath([os.path.dirname(path) for path in paths]) if paths else ""
+    outputs = []
+    for path in paths:
+        relative = os.path.relpath(path, base_dir)
+        try:
+            input_format = spec_format(path)
+        except ValueError:
+            # unreadable inputs fail in their own job
+            input_format = os.path.splitext(path)[1].lstrip(".") or "input"
+        stem = relative if os.path.isdir(path) else os.path.splitext(relative)[0]
+        outputs.append(os.path.join(output_dir, f"{stem.replace(os.sep, '_')}_{input_format}_groupings.xlsx"))
+
+    inputs_of = {}
+    for filename, output in zip(filenames, outputs):
+        inputs_of.setdefault(output, []).append(filename)
+    shared = [f"{inputs} --> {os.path.basename(output)}" for output, inputs in inputs_of.items() if len(inputs) > 1]
+    if shared:
+        raise ValueError(f"inputs with the same output file: {'; '.join(shared)}")
+    return outputs
+
+
+def make_session(spec, engine, time_limit, options):
+    """
+    Build elastic session of engine for spec with a time limit per solve.
+    """
+    if engine == "sparse":
+        from src.sparse_model import SparseSession
+        return SparseSession(spec, elastic=True, time_limit=time_limit, gap=options.get("gap"))
+    if engine == "heuristic":
+        from src.heuristic import DEFAULT_TIME_LIMIT, HeuristicSession
+        return HeuristicSession(spec, elastic=True, time_limit=time_limit if time_limit is not None else DEFAULT_TIME_LIMIT,
+                                seed=options.get("seed"))
+    from src.solver_session import SolverSession
+    return SolverSession(spec, elastic=True, msg=False, backend=options.get("backend", "cbc"), threads=options.get("threads", 1),
+                         time_limit=time_limit, gap=options.get("gap"), seed=options.get("seed"))
+
+
+def session_time_limit(session, time_limit, solves_left):
+    """
+    Set time limit in seconds of the next solve of a SolverSession or SparseSession to the time left. The heuristic engine always runs to its time limit, so it gets an equal share of the time left per solve.
+    """
+    if hasattr(session, "solver_options"):
+        session.solver_options["time_limit"] = time_limit
+    elif hasattr(session, "options"):
+        session.options["time_limit"] = time_limit
+    else:
+        session.time_limit = time_limit / solves_left
+
+
+################
+# Batch Worker #
+################
+
+def solve_workbook(job):
+    """
+    Solve one workbook job in a worker process and save its solutions. Job dict has filename, num_solutions, time_limit (seconds for the whole job, None for no limit), engine, output filename, and solver options. Each solve gets the time left of the job, and the job stops collecting solutions when time runs out. Never raises: errors are reported in the summary row.
+    """
+    from src.assign_groups import SOLVED_STATUSES, relaxed_max_char_constraints, solved_status
+    from src.infeasibility import find_infeasibilities
+
+    start = time.perf_counter()
+    row = {"workbook": job["filename"], "status": "Error", "solutions": 0, "excess": None, "load_time": None,
+           "build_time": None, "solve_time": 0.0, "wall_time": None, "output": None, "error": None}
+    try:
+        spec = load_problem_spec(job["filename"])
+        row["load_time"] = time.perf_counter() - start
+
+        conflicts = find_infeasibilities(spec)
+        if conflicts:
+            row.update({"status": "Infeasible", "error": "; ".join(conflicts)})
+            return row
+
+        session = make_session(spec, job["engine"], job["time_limit"], job["options"])
+        row["build_time"] = session.build_time
+        deadline = start + job["time_limit"] if job["time_limit"] is not None else None
+
+        solutions, statuses = [], []
+        status = "Not Solved"
+        for i in range(int(job["num_solutions"])):
+            if deadline is not None:
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    break
+                session_time_limit(session, remaining, int(job["num_solutions"]) - i)
+            status, solution_df = session.solve()
+            row["solve_time"] += session.last_stats["wall_time"]
+            if status not in SOLVED_STATUSES:
+                break
+            solutions.append(solution_df)
+            statuses.append(status)
+            session.add_solution(solution_df)
+
+        row["solutions"] = len(solutions)
+        row["status"] = solved_status(statuses) if len(solutions) == int(job["num_solutions"]) else (status if not solutions else "Partial")
+        if solutions:
+            row["excess"] = int(sum(relaxed_max_char_constraints(spec, solution_df)["excess"].sum() for solution_df in solutions))
+            row["output"] = job["output"]
+            with pd.ExcelWriter(row["output"]) as writer:
+                for idx, solution_df in enumerate(solutions):
+                    solution_df.sort_values("group").to_excel(writer, sheet_name=f"Solution_{idx}", index=False)
+    except Exception as e:
+        row.update({"status": "Error", "error": f"{type(e).__name__}: {e}"})
+    finally:
+        row["wall_time"] = time.perf_counter() - start
+    return row
+
+
+###############
+# Batch Solve #
+###############
+
+def crashed_row(job, error):
+    """
+    Summary row of a job whose worker process died.
+    """
+    row = {column: None for column in SUMMARY_COLUMNS}
+    row.update({"workbook": job["filename"], "status": "Crashed", "solutions": 0, "error": error})
+    return row
+
+
+def run_pool(jobs, workers, on_result=None):
+    """
+    Solve jobs in a pool of worker processes. Return dict with {job position: summary row} and list of positions of jobs lost when a worker process died.
+    """
+    rows = {}
+    lost = []
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(solve_workbook, job): pos for pos, job in enumerate(jobs)}
+        for future in concurrent.futures.as_completed(futures):
+            pos = futures[future]
+            try:
+                rows[pos] = future.result()
+            except concurrent.futures.process.BrokenProcessPool:
+                lost.append(pos)
+                continue
+            if on_result is not None:
+                on_result(rows[pos])
+    return rows, sorted(lost)
+
+
+def run_batch(jobs, output_dir, workers=None, num_solutions=1, time_limit=None, engine="pulp", on_result=None, **options):
+    """
+    Solve many workbooks in a pool of worker processes that import pandas, PuLP, and the solver code once. Per-job num_solutions and time_limit (seconds for the whole job) override the defaults. Each job saves to its own output file (see output_filenames). A bad workbook only fails its own job. Jobs lost when a worker process dies are retried one at a time in their own process, so a crash is blamed on the job that caused it. Call on_result with each summary row as jobs finish. Return summary DataFrame with one row per job in job order.
+    """
+    outputs = output_filenames(output_dir, [job["filename"] for job in jobs])
+    os.makedirs(output_dir, exist_ok=True)
+    jobs = [dict({"num_solutions": num_solutions, "time_limit": time_limit}, **job,
+                 engine=engine, output=output, options=options) for job, output in zip(jobs, outputs)]
+
+    rows, lost = run_pool(jobs, workers, on_result)
+    for pos in lost:
+        retry_rows, retry_lost = run_pool([jobs[pos]], 1, on_result)
+        rows[pos] = retry_rows.get(0) or crashed_row(jobs[pos], "worker process died")
+        if retry_lost and on_result is not None:
+            on_result(rows[pos])
+
+    return pd.DataFrame([rows[pos] for pos in range(len(jobs))], columns=SUMMARY_COLUMNS)
+
+
+def print_summary(summary):
+    """
+    Print counts by status and total times of batch summary.
+    """
+    counts = summary["status"].value_counts()
+    print(f"\n{len(summary)} workbook(s): " + ", ".join(f"{count} {status}" for status, count in counts.items()))
+    print(f"Total solve time {summary['solve_time'].fillna(0).sum():.1f}s, "
+          f"total job wall time {summary['wall_time'].fillna(0).sum():.1f}s")
+    for row in summary.loc[summary["error"].notna()].itertuples():
+        print(f"\t{row.workbook}: {row.status}: {row.error}")
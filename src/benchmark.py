@@ -0,0 +1,228 @@
+import concurrent.futures
+import datetime
+import itertools
+import os
+import shutil
+import subprocess
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+from src.generate import INFEASIBLE_KINDS, generate_problem_spec
+from src.problem_spec import (LOADERS, ProblemSpec, load_problem_spec, parse_problem_spec, validate_problem_spec,
+                              write_problem_spec)
+from src.profiling import enable_profiling, peak_memory_mb
+
+
+# result row for each benchmark case, in column order
+RESULT_COLUMNS = ["commit", "date", "engine", "num_names", "group_size", "density", "seed", "infeasible", "num_groups",
+                  "variables", "rows", "status", "detected", "solutions", "objective", "gap", "excess", "failed_rows",
+                  "generate_time", "check_time", "build_time", "solve_time", "verify_time", "wall_time",
+                  "peak_memory_mb", "solver_memory_mb", "error"]
+
+# result row for each (input format, number of students), in column order
+LOADER_COLUMNS = ["commit", "date", "format", "num_names", "bytes", "parse_time", "validate_time", "cached_time", "error"]
+
+# case columns, results of the same case on different commits are compared on these
+CASE_COLUMNS = ["engine", "num_names", "group_size", "density", "infeasible"]
+
+
+####################
+# Helper Functions #
+####################
+
+def current_commit():
+    """
+    Short hash of the checked out commit with a -dirty suffix for uncommitted changes. None outside a git repository.
+    """
+    try:
+        output = subprocess.run(["git", "describe", "--always", "--dirty"], capture_output=True, text=True, check=True)
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return output.stdout.strip()
+
+
+def best_time(func, repeats):
+    """
+    Shortest wall time in seconds of repeats calls of func.
+    """
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def input_size(path):
+    """
+    Size in bytes of input file or of all files in input directory.
+    """
+    if os.path.isdir(path):
+        return sum(os.path.getsize(os.path.join(path, name)) for name in os.listdir(path))
+    return os.path.getsize(path)
+
+
+def benchmark_cases(sizes, group_sizes=(5,), densities=(0.1,), repeats=1, infeasible_rate=0.0, seed=0):
+    """
+    Create list of benchmark case dicts for every combination of number of students, group size, and With/Not With density, repeats times each with seeds seed, seed + 1, ... A random infeasible_rate share of the cases gets a contradiction of a random kind (see INFEASIBLE_KINDS). The same seed gives the same cases.
+    """
+    rng = np.random.default_rng(seed)
+    cases = []
+    for num_names, group_size, density, repeat in itertools.product(sizes, group_sizes, densities, range(repeats)):
+        infeasible = str(rng.choice(INFEASIBLE_KINDS)) if rng.random() < infeasible_rate else None
+        cases.append({"num_names": num_names, "group_size": group_size, "density": density, "seed": seed + repeat,
+                      "infeasible": infeasible})
+    return cases
+
+
+####################
+# Benchmark Worker #
+####################
+
+def run_case(case):
+    """
+    Generate and solve one benchmark case in a fresh worker process, so peak memory belongs to the case alone. Runs the same steps as run_program.py and check_constraints.py: infeasibility check, model build, num_solutions solves, and verification of every solution. Never raises: errors are reported in the result row.
+    """
+    from src.assign_groups import SOLVED_STATUSES, relaxed_max_char_constraints, solved_status
+    from src.batch import make_session
+    from src.infeasibility import find_infeasibilities
+    from src.verify import verify_solutions
+
+    profiler = enable_profiling()
+    start = time.perf_counter()
+    row = {column: case.get(column) for column in RESULT_COLUMNS}
+    row.update({"status": "Error", "solutions": 0, "solve_time": 0.0})
+    try:
+        spec = generate_problem_spec(case["num_names"], case["group_size"], with_density=case["density"],
+                                     not_with_density=case["density"], infeasible=case["infeasible"], seed=case["seed"])
+        row["num_groups"] = len(spec.groups)
+        row["generate_time"] = time.perf_counter() - start
+
+        check_start = time.perf_counter()
+        conflicts = find_infeasibilities(spec)
+        row["check_time"] = time.perf_counter() - check_start
+        row["detected"] = bool(conflicts)
+        if conflicts:
+            row["status"] = "Infeasible"
+            return row
+
+        session = make_session(spec, case["engine"], case["time_limit"], case["options"])
+        counters = profiler.snapshot()["counters"]
+        row["build_time"] = session.build_time
+        row["variables"] = sum(value for name, value in counters.items() if name.startswith("variables/")) or None
+        row["rows"] = sum(value for name, value in counters.items() if name.startswith("rows/")) or None
+
+        solutions, statuses = [], []
+        status = "Not Solved"
+        for _ in range(case["num_solutions"]):
+            status, solution_df = session.solve()
+            row["solve_time"] += session.last_stats["wall_time"]
+            if status not in SOLVED_STATUSES:
+                break
+            statuses.append(status)
+            if not solutions:
+                row["objective"], row["gap"] = session.last_stats["objective"], session.last_stats["gap"]
+            solutions.append(solution_df)
+            session.add_solution(solution_df)
+
+        row["solutions"] = len(solutions)
+        row["status"] = solved_status(statuses) if len(solutions) == case["num_solutions"] else (status if not solutions else "Partial")
+        if solutions:
+            verify_start = time.perf_counter()
+            report = verify_solutions(spec, solutions)
+            row["verify_time"] = time.perf_counter() - verify_start
+            row["failed_rows"] = int((~report["ok"]).sum())
+            row["excess"] = int(sum(relaxed_max_char_constraints(spec, solution_df)["excess"].sum() for solution_df in solutions))
+    except Exception as e:
+        row.update({"status": "Error", "error": f"{type(e).__name__}: {e}"})
+    finally:
+        row["wall_time"] = time.perf_counter() - start
+        row["peak_memory_mb"] = peak_memory_mb()
+        row["solver_memory_mb"] = peak_memory_mb(children=True) or None
+    return row
+
+
+#################
+# Run Benchmark #
+#################
+
+def run_benchmark(cases, engine="pulp", num_solutions=1, time_limit=None, on_result=None, **options):
+    """
+    Run benchmark cases one after another, each in its own worker process so cases do not share memory or warm caches. Solver options as in batch.make_session. Call on_result with each result row as cases finish. Return results DataFrame with one row per case, tagged with the current commit and date.
+    """
+    commit = current_commit()
+    date = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    rows = []
+    for case in cases:
+        job = dict(case, engine=engine, num_solutions=num_solutions, time_limit=time_limit, options=options)
+        with concurrent.futures.ProcessPoolExecutor(max_workers=1) as executor:
+            try:
+                row = executor.submit(run_case, job).result()
+            except concurrent.futures.process.BrokenProcessPool:
+                row = {column: job.get(column) for column in RESULT_COLUMNS}
+                row.update({"status": "Crashed", "solutions": 0, "error": "worker process died"})
+        row.update({"commit": commit, "date": date})
+        rows.append(row)
+        if on_result is not None:
+            on_result(row)
+    return pd.DataFrame(rows, columns=RESULT_COLUMNS)
+
+
+def benchmark_loaders(sizes, formats=None, repeats=3, seed=0, on_result=None):
+    """
+    Write a generated problem with each number of students in every input format (see problem_spec.LOADERS) to a temporary directory and time parsing, schema validation, and loading from the spec cache, best of repeats. A format whose optional package is missing (pyarrow or fastparquet for Parquet) is reported with the error. Call on_result with each result row. Return results DataFrame with one row per (format, number of students).
+    """
+    commit = current_commit()
+    date = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    directory = tempfile.mkdtemp(prefix="loader_benchmark_")
+    rows = []
+    try:
+        for num_names in sizes:
+            spec = generate_problem_spec(num_names, seed=seed)
+            for format in formats or list(LOADERS):
+                path = os.path.join(directory, f"synthetic_{num_names}" + (f".{format}" if format in ["xlsx", "json"] else f"_{format}"))
+                row = {"commit": commit, "date": date, "format": format, "num_names": num_names}
+                try:
+                    write_problem_spec(spec, path, format)
+                    row["bytes"] = input_size(path)
+                    row["parse_time"] = best_time(lambda: parse_problem_spec(path, format), repeats)
+                    parsed = ProblemSpec(**parse_problem_spec(path, format))
+                    row["validate_time"] = best_time(lambda: validate_problem_spec(parsed), repeats)
+                    cache_dir = os.path.join(directory, ".cache")
+                    load_problem_spec(path, cache_dir)
+                    row["cached_time"] = best_time(lambda: load_problem_spec(path, cache_dir), repeats)
+                except ImportError as e:
+                    row["error"] = f"{type(e).__name__}: {str(e).splitlines()[0]}"
+                rows.append(row)
+                if on_result is not None:
+                    on_result(row)
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+    return pd.DataFrame(rows, columns=LOADER_COLUMNS)
+
+
+def save_results(results, filename, columns=RESULT_COLUMNS):
+    """
+    Append results to CSV file, so one file holds the benchmark runs of many commits.
+    """
+    if os.path.exists(filename):
+        results = pd.concat([pd.read_csv(filename), results], ignore_index=True)
+    elif os.path.dirname(filename):
+        os.makedirs(os.path.dirname(filename), exist_ok=True)
+    results.to_csv(filename, index=False, columns=[column for column in columns if column in results.columns])
+    return results
+
+
+def compare_results(results):
+    """
+    Median build time, solve time, wall time, and peak memory and worst verification result of each case by commit, one row per case and commit in order of first run, for comparing performance between commits.
+    """
+    results = results.assign(infeasible=results["infeasible"].fillna(""))
+    summary = results.groupby(CASE_COLUMNS + ["commit"], sort=False, dropna=False).agg(
+        runs=("status", "size"), optimal=("status", lambda status: int((status == "Optimal").sum())),
+        build_time=("build_time", "median"), solve_time=("solve_time", "median"), wall_time=("wall_time", "median"),
+        peak_memory_mb=("peak_memory_mb", "median"), failed_rows=("failed_rows", "max"))
+    return summary.reset_index().sort_values(CASE_COLUMNS, kind="stable").reset_index(drop=True)
@@ -0,0 +1,194 @@
+import concurrent.futures
+import copy
+import time
+
+import numpy as np
+from scipy import sparse
+from scipy.sparse import csgraph
+
+from src.assign_groups import SOLVED_STATUSES, slack_penalty, solved_status
+from src.encoding import encode_problem_spec
+from src.presolve import build_presolved_problem, presolve, presolve_stats
+from src.profiling import count, phase
+from src.sparse_model import milp_options, solve_sparse_problem
+
+
+####################
+# Helper Functions #
+####################
+
+def find_components(presolved):
+    """
+    Split the free units of presolved problem into connected components of the graph with an edge between each free unit and each of its allowed groups. Units of different components can never share a group, and every row of the model (capacity, Not With, maximum characteristic, symmetry breaking) and every objective term belongs to one group or one unit, so each component is an independent problem. Return list of arrays of free units, most allowed (unit, group) pairs first.
+    """
+    free_units = presolved.free_units
+    m, G = len(free_units), presolved.encoded.n_groups
+    unit_idx, group_idx = np.nonzero(presolved.allowed[free_units])
+    graph = sparse.coo_matrix((np.ones(len(unit_idx)), (unit_idx, m + group_idx)), shape=(m + G, m + G))
+    _, labels = csgraph.connected_components(graph, directed=False)
+
+    order = np.argsort(labels[:m], kind="stable")
+    splits = np.flatnonzero(np.diff(labels[:m][order])) + 1
+    components = np.split(free_units[order], splits) if m else []
+    return sorted(components, key=lambda units: -int(presolved.allowed[units].sum()))
+
+
+def component_problem(presolved, units):
+    """
+    Copy of presolved problem with only units in the model. The other free units are left out and keep the label -1.
+    """
+    component = copy.copy(presolved)
+    component.active = np.zeros(presolved.n_units, dtype=bool)
+    component.active[units] = True
+    return component
+
+
+def merge_stats(stats, wall_time, build_time):
+    """
+    Combine solve stats of the components: status of the first component without a solution, otherwise Optimal only if every component is, summed objective and nodes, largest gap, and wall time of the whole solve.
+    """
+    statuses = [s["status"] for s in stats]
+    failed = [status for status in statuses if status not in SOLVED_STATUSES]
+    objectives = [s["objective"] for s in stats]
+    gaps = [s["gap"] for s in stats if s["gap"] is not None]
+    nodes = [s["nodes"] for s in stats if s["nodes"] is not None]
+    return {
+        "backend": "highs",
+        "status": failed[0] if failed else solved_status(statuses),
+        "objective": sum(objectives) if None not in objectives else None,
+        "gap": max(gaps) if gaps else None,
+        "nodes": sum(nodes) if nodes else None,
+        "wall_time": wall_time,
+        "build_time": build_time,
+    }
+
+
+####################
+# Worker Functions #
+####################
+
+# component models sent once per worker process by init_worker
+_worker_models = None
+
+
+def init_worker(models):
+    global _worker_models
+    _worker_models = models
+
+
+def solve_component(model, options):
+    """
+    Solve one component model. Return status, array of group indices (-1 outside the component), and solve stats.
+    """
+    status, solution_df, stats = solve_sparse_problem(model, options, return_stats=True)
+    return status, model.encoded.encode_solution(solution_df), stats
+
+
+def solve_worker_component(idx, c, objective_offset, options):
+    """
+    Solve component model idx of the worker with objective vector c and constant objective_offset.
+    """
+    model = _worker_models[idx]
+    model.c = c
+    model.objective_offset = objective_offset
+    return solve_component(model, options)
+
+
+######################
+# Decomposed Session #
+######################
+
+class DecomposedSession(object):
+    """
+    Sparse matrix problem split into independent components after presolve, with the same interface as SparseSession. Each component is built and solved as its own smaller MILP, in a pool of jobs worker processes when there is more than one component, and the component solutions are merged into one solution. Solve time follows the largest component instead of the whole cohort. Without independent components the whole presolved problem is one component. Threads and seed are accepted for the same interface but not supported by scipy.
+    """
+
+    def __init__(self, spec, elastic, unique_solutions=None, symmetry_breaking=False,
+                 threads=None, time_limit=None, gap=None, seed=None, jobs=1, presolved=None):
+        start = time.perf_counter()
+        # split an already presolved problem, e.g. with units restricted to their sections by HierarchicalSession
+        self.encoded = presolved.encoded if presolved is not None else encode_problem_spec(spec)
+        self.elastic = elastic
+        self.options = milp_options(time_limit, gap)
+        self.jobs = jobs
+        self.presolved = presolved if presolved is not None else presolve(self.encoded)
+
+        self.components = find_components(self.presolved)
+        count("components", len(self.components))
+        problems = [component_problem(self.presolved, units) for units in self.components] if len(self.components) > 1 else [self.presolved]
+        with phase("build"):
+            self.models = [build_presolved_problem(problem, elastic, symmetry_breaking) for problem in problems]
+
+        self.presolve_stats = presolve_stats(self.presolved, self.models[0], elastic, symmetry_breaking)
+        self.presolve_stats.update({
+            "variables_after": sum(model.num_variables for model in self.models),
+            "rows_after": sum(model.num_rows for model in self.models),
+            "components": len(self.models),
+        })
+        self.group_classes = [[self.encoded.groups[g] for g in c] for model in self.models for c in model.group_classes]
+        self.build_time = time.perf_counter() - start
+        self.last_stats = None
+        self.num_solutions = 0
+        self.base_c = None
+        self.executor = None
+        for solution_df in unique_solutions or []:
+            self.add_solution(solution_df)
+
+    def add_solution(self, solution_df):
+        """
+        Penalize repeat student assignments from solution in the next solve of every component.
+        """
+        labels = self.encoded.encode_solution(solution_df)
+        self.num_solutions += 1
+        for model in self.models:
+            model.add_solution_penalty(labels)
+            model.set_slack_penalty(slack_penalty(self.encoded.n_names, self.num_solutions))
+        # names fixed by presolve are in every component, count their repeats once
+        for model in self.models[1:]:
+            model.objective_offset = 0.0
+
+    def randomize_objective(self, seed):
+        """
+        Replace the decision variable objective coefficients with random weights in [0, 1) like SparseSession.randomize_objective.
+        """
+        if self.base_c is None:
+            self.base_c = [model.c.copy() for model in self.models]
+        rng = np.random.default_rng(seed)
+        for model, base_c in zip(self.models, self.base_c):
+            model.c = base_c.copy()
+            model.c[:model.n_x] += rng.random(model.n_x)
+            model.set_slack_penalty(slack_penalty(self.encoded.n_names, self.num_solutions + 1))
+
+    def solve_components(self):
+        """
+        Solve every component, largest first, in the worker pool or in this process.
+        """
+        if self.jobs <= 1 or len(self.models) == 1:
+            return [solve_component(model, self.options) for model in self.models]
+
+        # models are sent to the workers once, later solves only send the objective vector
+        if self.executor is None:
+            self.executor = concurrent.futures.ProcessPoolExecutor(max_workers=min(self.jobs, len(self.models)),
+                                                                   initializer=init_worker, initargs=(self.models,))
+        futures = [self.executor.submit(solve_worker_component, idx, model.c, model.objective_offset, self.options)
+                   for idx, model in enumerate(self.models)]
+        return [future.result() for future in futures]
+
+    def solve(self):
+        """
+        Solve all components and merge their solutions. Return status and solution DataFrame with names and assigned groups.
+        """
+        start = time.perf_counter()
+        results = self.solve_components()
+        # names outside a component are -1 in its labels, fixed names have the same label in all
+        labels = np.max([component_labels for _, component_labels, _ in results], axis=0)
+        self.last_stats = merge_stats([stats for _, _, stats in results], time.perf_counter() - start, self.build_time)
+        return self.last_stats["status"], self.encoded.decode_solution(labels)
+
+    def close(self):
+        """
+        Shut down the worker pool.
+        """
+        if self.executor is not None:
+            self.executor.shutdown()
+            self.executor = None
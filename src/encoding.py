@@ -0,0 +1,144 @@
+import numpy as np
+import pandas as pd
+
+from src.problem_spec import as_problem_spec
+from src.profiling import phase
+
+
+####################
+# Helper Functions #
+####################
+
+def index_values(index, values, sheet, column):
+    """
+    Map values to integer positions in index. Raise ValueError naming the sheet for values not in index.
+    """
+    positions = index.get_indexer(values)
+    if (positions < 0).any():
+        unknown = pd.unique(np.asarray(values, dtype=object)[positions < 0])
+        raise ValueError(f"Unknown {column} {list(unknown)} in \"{sheet}\" sheet")
+    return positions.astype(np.int64)
+
+
+def encode_name_sets(df, name_index, sheet):
+    """
+    Encode each row of names in a With/Not With sheet as a set of name indices. Return flat array of name indices, array of set ids (one per name index), and the sheet row of each set. Skip rows with fewer than two names.
+    """
+    stacked = df.stack().dropna()
+    if stacked.empty:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+
+    rows = stacked.index.get_level_values(0).to_numpy()
+    members = index_values(name_index, stacked.to_numpy(), sheet, "name")
+
+    # keep rows with at least two names
+    row_labels, set_ids, counts = np.unique(rows, return_inverse=True, return_counts=True)
+    keep_sets = counts >= 2
+    keep = keep_sets[set_ids]
+    new_ids = np.cumsum(keep_sets) - 1
+
+    return members[keep], new_ids[set_ids[keep]], row_labels[keep_sets]
+
+
+def char_masks(person_df, char_df):
+    """
+    Create boolean matrix with one row per characteristic row and one column per name. True where the name has the specified characteristic value.
+    """
+    masks = np.zeros((len(char_df), len(person_df)), dtype=bool)
+    for row, (char, value) in enumerate(zip(char_df["characteristic"], char_df["value"])):
+        masks[row] = (person_df[char] == value).to_numpy()
+    return masks
+
+
+###################
+# Encoded Problem #
+###################
+
+class EncodedProblem(object):
+    """
+    Integer-encoded problem spec. Names and groups are mapped to integer indices in the order of the "Person Setup" and "Grouping Setup" sheets and every constraint sheet is stored as NumPy arrays of those indices.
+
+    Name sets from the With/Not With sheets are stored flat: with_members[k] belongs to set with_set_ids[k], and with_rows[s] is the sheet row of set s.
+    """
+
+    def __init__(self, spec):
+        spec = as_problem_spec(spec)
+        self.spec = spec
+
+        self.names = spec.names
+        self.groups = spec.groups
+        self.name_index = pd.Index(self.names)
+        self.group_index = pd.Index(self.groups)
+        self.n_names = len(self.names)
+        self.n_groups = len(self.groups)
+
+        self.sizes = spec.group_df["size"].to_numpy(dtype=np.int64)
+
+        self.with_members, self.with_set_ids, self.with_rows = encode_name_sets(
+            spec.with_df, self.name_index, "Constraint - With")
+        self.not_with_members, self.not_with_set_ids, self.not_with_rows = encode_name_sets(
+            spec.not_with_df, self.name_index, "Constraint - Not With")
+
+        self.in_names = index_values(self.name_index, spec.in_df["name"], "Constraint - In", "name")
+        self.in_groups = index_values(self.group_index, spec.in_df["group id"], "Constraint - In", "group id")
+        self.in_rows = spec.in_df.index.to_numpy()
+
+        self.not_in_names = index_values(self.name_index, spec.not_in_df["name"], "Constraint - Not In", "name")
+        self.not_in_groups = index_values(self.group_index, spec.not_in_df["group id"], "Constraint - Not In", "group id")
+        self.not_in_rows = spec.not_in_df.index.to_numpy()
+
+        self.hom_groups = index_values(self.group_index, spec.hom_df["group id"], "Constraint - Homogenous", "group id")
+        self.hom_masks = char_masks(spec.person_df, spec.hom_df)
+        self.hom_rows = spec.hom_df.index.to_numpy()
+
+        self.max_masks = char_masks(spec.person_df, spec.max_df)
+        self.max_limits = spec.max_df["maximum"].to_numpy(dtype=np.int64)
+        self.max_rows = spec.max_df.index.to_numpy()
+
+    def __repr__(self):
+        return f"EncodedProblem(names={self.n_names}, groups={self.n_groups})"
+
+    @property
+    def num_with_sets(self):
+        return len(self.with_rows)
+
+    @property
+    def num_not_with_sets(self):
+        return len(self.not_with_rows)
+
+    def with_pairs(self):
+        """
+        Create (k, 2) array of consecutive name index pairs within each With set. Assigning each pair together assigns each set together.
+        """
+        same_set = self.with_set_ids[1:] == self.with_set_ids[:-1]
+        return np.column_stack([self.with_members[:-1][same_set], self.with_members[1:][same_set]])
+
+    def encode_solution(self, solution_df):
+        """
+        Encode solution DataFrame as array of group indices with one entry per name. Names missing from the solution are labeled -1.
+        """
+        labels = np.full(self.n_names, -1, dtype=np.int64)
+        name_idx = self.name_index.get_indexer(solution_df["name"])
+        group_idx = self.group_index.get_indexer(solution_df["group"])
+        found = (name_idx >= 0) & (group_idx >= 0)
+        labels[name_idx[found]] = group_idx[found]
+        return labels
+
+    def decode_solution(self, labels):
+        """
+        Create solution DataFrame with names and assigned groups from array of group indices. Skip names labeled -1.
+        """
+        labels = np.asarray(labels)
+        assigned = np.flatnonzero(labels >= 0)
+        return pd.DataFrame({
+            "name": self.name_index[assigned].to_numpy(),
+            "group": self.group_index[labels[assigned]].to_numpy(),
+        })
+
+
+def encode_problem_spec(spec):
+    """
+    Create integer-encoded problem from problem spec or template .xlsx filename.
+    """
+    with phase("encode"):
+        return EncodedProblem(spec)
@@ -0,0 +1,135 @@
+import numpy as np
+import pandas as pd
+
+from src.problem_spec import ProblemSpec
+
+
+# columns of the With/Not With sheets
+NAME_COLUMNS = [f"name {i}" for i in range(1, 7)]
+
+# contradictions added to make a generated problem infeasible, each one found by find_infeasibilities
+INFEASIBLE_KINDS = ["capacity", "with_not_with", "in_not_in"]
+
+
+####################
+# Helper Functions #
+####################
+
+def group_sizes(num_names, group_size, spare_seats=0):
+    """
+    Create array of sizes of ceil(num_names / group_size) groups as equal as possible with spare_seats extra seats per group.
+    """
+    num_groups = max(int(np.ceil(num_names / group_size)), 1)
+    sizes = np.full(num_groups, num_names // num_groups, dtype=np.int64)
+    sizes[:num_names % num_groups] += 1
+    return sizes + spare_seats
+
+
+def plant_groups(sizes, num_names, rng):
+    """
+    Assign names to groups at random within group sizes. Every generated constraint agrees with this assignment, so it proves the problem feasible. Return array of group index per name.
+    """
+    seats = np.repeat(np.arange(len(sizes)), sizes)
+    return rng.permutation(seats)[:num_names]
+
+
+def name_rows(names, members, num_rows, together, rng, max_row_size=3):
+    """
+    Create With (together) or Not With sheet with num_rows rows of 2 to max_row_size names. Names of a With row share a planted group and names of a Not With row are in different planted groups.
+    """
+    rows = []
+    for _ in range(num_rows):
+        size = int(rng.integers(2, max_row_size + 1))
+        if together:
+            group_members = members[rng.integers(len(members))]
+            size = min(size, len(group_members))
+            picked = rng.choice(group_members, size, replace=False) if size >= 2 else []
+        else:
+            size = min(size, len(members))
+            picked = [rng.choice(members[g]) for g in rng.choice(len(members), size, replace=False)] if size >= 2 else []
+        if len(picked):
+            rows.append(list(names[picked]) + [np.nan] * (len(NAME_COLUMNS) - len(picked)))
+    return pd.DataFrame(rows, columns=NAME_COLUMNS, dtype=object)
+
+
+def add_infeasibility(spec, kind, rng):
+    """
+    Add contradiction kind (see INFEASIBLE_KINDS) to problem spec in place: too few seats, a With row repeated as a Not With row, or an In row repeated as a Not In row.
+    """
+    if kind == "capacity":
+        sizes = spec.group_df["size"].to_numpy().copy()
+        deficit = int(sizes.sum()) - len(spec.person_df) + 1
+        while deficit > 0:
+            largest = int(np.argmax(sizes))
+            sizes[largest] -= 1
+            deficit -= 1
+        spec.group_df["size"] = sizes
+    elif kind == "with_not_with":
+        if spec.with_df.empty:
+            spec.with_df = pd.DataFrame([list(spec.person_df["name"][:2]) + [np.nan] * 4], columns=NAME_COLUMNS, dtype=object)
+        row = spec.with_df.iloc[[int(rng.integers(len(spec.with_df)))]]
+        spec.not_with_df = pd.concat([spec.not_with_df, row], ignore_index=True)
+    elif kind == "in_not_in":
+        if spec.in_df.empty:
+            spec.in_df = pd.DataFrame({"name": spec.person_df["name"][:1], "group id": spec.group_df["group id"][:1]})
+        row = spec.in_df.iloc[[int(rng.integers(len(spec.in_df)))]]
+        spec.not_in_df = pd.concat([spec.not_in_df, row], ignore_index=True)
+    else:
+        raise ValueError(f"Unknown infeasible kind \"{kind}\", use one of {INFEASIBLE_KINDS}")
+    return spec
+
+
+#########################
+# Generate Problem Spec #
+#########################
+
+def generate_problem_spec(num_names, group_size=5, char_rates=(0.5, 0.3, 0.1), with_density=0.1, not_with_density=0.1,
+                          in_rate=0.02, not_in_rate=0.02, num_hom=1, num_max=None, spare_seats=0, infeasible=None, seed=None):
+    """
+    Generate a synthetic problem spec with num_names students in groups of about group_size.
+
+    Each characteristic k is set for a random char_rates[k] share of students. With and Not With rows of 2 or 3 names cover about with_density and not_with_density of the students, In and Not In rows cover in_rate and not_in_rate of the students, num_hom groups are Homogenous on not having a random characteristic, and num_max characteristics (default all) get the tightest Maximum that still allows the planted assignment. All constraints agree with a hidden random assignment, so the problem is feasible. With infeasible set to one of INFEASIBLE_KINDS, a contradiction is added on top. The same seed gives the same spec.
+    """
+    rng = np.random.default_rng(seed)
+    sizes = group_sizes(num_names, group_size, spare_seats)
+    num_groups = len(sizes)
+    names = np.array([f"Student {idx:0{len(str(num_names))}d}" for idx in range(1, num_names + 1)], dtype=object)
+    group_ids = np.arange(1, num_groups + 1)
+    planted = plant_groups(sizes, num_names, rng)
+    members = [np.flatnonzero(planted == g) for g in range(num_groups)]
+
+    chars = [f"char {k}" for k in range(1, len(char_rates) + 1)]
+    person_df = pd.DataFrame({"name": names})
+    for char, rate in zip(chars, char_rates):
+        person_df[char] = (rng.random(num_names) < rate).astype(np.int64)
+
+    # homogenous groups are planted without the characteristic, so the maximums below stay tight
+    hom_groups = rng.choice(num_groups, min(num_hom, num_groups), replace=False)
+    hom_chars = rng.choice(chars, len(hom_groups))
+    for g, char in zip(hom_groups, hom_chars):
+        person_df.loc[members[g], char] = 0
+    hom_df = pd.DataFrame({"group id": group_ids[hom_groups], "characteristic": hom_chars, "value": 0})
+
+    # tightest maximum per group that the planted assignment satisfies
+    max_chars = chars[:num_max] if num_max is not None else chars
+    maximums = [int(np.bincount(planted, weights=person_df[char], minlength=num_groups).max()) for char in max_chars]
+    max_df = pd.DataFrame({"maximum": maximums, "characteristic": max_chars, "value": 1})
+
+    # an average row has 2.5 names
+    with_df = name_rows(names, members, int(round(with_density * num_names / 2.5)), True, rng)
+    not_with_df = name_rows(names, members, int(round(not_with_density * num_names / 2.5)), False, rng)
+
+    in_names = rng.choice(num_names, int(round(in_rate * num_names)), replace=False)
+    in_df = pd.DataFrame({"name": names[in_names], "group id": group_ids[planted[in_names]]})
+    not_in_names = rng.choice(num_names, int(round(not_in_rate * num_names)), replace=False)
+    # any group but the planted one
+    other_groups = (planted[not_in_names] + rng.integers(1, max(num_groups, 2), len(not_in_names))) % num_groups
+    not_in_df = pd.DataFrame({"name": names[not_in_names], "group id": group_ids[other_groups]})
+    if num_groups == 1:
+        not_in_df = not_in_df.iloc[:0]
+
+    spec = ProblemSpec(person_df, pd.DataFrame({"group id": group_ids, "size": sizes}), with_df, not_with_df,
+                       in_df, not_in_df, hom_df, max_df, source=f"synthetic_{num_names}_names_seed_{seed}")
+    if infeasible is not None:
+        add_infeasibility(spec, infeasible, rng)
+    return spec
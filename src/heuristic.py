@@ -0,0 +1,474 @@
+import copy
+import math
+import time
+
+import numpy as np
+import pandas as pd
+
+from src.assign_groups import slack_penalty
+from src.encoding import encode_problem_spec
+from src.presolve import build_presolved_problem, presolve, propagate_fixings
+from src.profiling import phase
+from src.sparse_model import solve_sparse_problem
+
+
+# penalty per unit of violation of a hard constraint (group size, Not With, and rigid Maximum) relative to the elastic Maximum penalty
+HARD_WEIGHT = 1000
+
+# penalty per repeat assignment, same as the LP problem
+SOFT_WEIGHT = 1
+
+DEFAULT_TIME_LIMIT = 10.0
+
+
+####################
+# Helper Functions #
+####################
+
+def over(value):
+    """
+    Amount above zero.
+    """
+    return value if value > 0 else 0
+
+
+def unit_repeats(presolved, unique_solutions):
+    """
+    Count repeat assignments of each free unit to each group over earlier solutions. Return (free units x groups) matrix.
+    """
+    encoded = presolved.encoded
+    free_units = presolved.free_units
+    unit_rank = np.full(presolved.n_units, -1, dtype=np.int64)
+    unit_rank[free_units] = np.arange(len(free_units))
+
+    ranks = unit_rank[presolved.unit_of]
+
+    repeats = np.zeros((len(free_units), encoded.n_groups))
+    for solution_df in unique_solutions:
+        labels = encoded.encode_solution(solution_df)
+        assigned = (labels >= 0) & (ranks >= 0)
+        np.add.at(repeats, (ranks[assigned], labels[assigned]), 1)
+    return repeats
+
+
+def fixed_repeats(presolved, unique_solutions):
+    """
+    Count repeat assignments of the names of units fixed by presolve over earlier solutions. They repeat in every solution, so they are a constant of the objective, as in PresolvedModel.add_solution_penalty.
+    """
+    encoded = presolved.encoded
+    fixed = presolved.fixed[presolved.unit_of]
+    return sum(int(((encoded.encode_solution(solution_df) == fixed) & (fixed >= 0)).sum()) for solution_df in unique_solutions)
+
+
+################
+# Search State #
+################
+
+class SearchState(object):
+    """
+    Assignment of the free units of a presolved problem to groups with incrementally updated group loads, characteristic counts, and Not With counts. In, Not In, Homogenous, and With constraints always hold because units only move between their allowed groups.
+    """
+
+    def __init__(self, presolved, elastic, repeats, num_solutions=0):
+        encoded = presolved.encoded
+        self.presolved = presolved
+        self.elastic = elastic
+        self.n_groups = encoded.n_groups
+        # elastic Maximum penalty outweighs every repeat assignment like the LP problem
+        self.max_weight = slack_penalty(encoded.n_names, num_solutions) if elastic else HARD_WEIGHT
+        self.hard_weight = HARD_WEIGHT * self.max_weight if elastic else HARD_WEIGHT
+
+        free_units = presolved.free_units
+        self.free_units = free_units
+        self.m = len(free_units)
+        self.weights = presolved.weights[free_units]
+        self.allowed = presolved.allowed[free_units]
+        self.allowed_groups = [np.flatnonzero(row) for row in self.allowed]
+        self.repeats = repeats
+
+        # characteristic rows with nonzero count for each free unit
+        counts = presolved.max_counts[:, free_units]
+        self.unit_max = [[(int(r), int(counts[r, k])) for r in np.flatnonzero(counts[:, k])] for k in range(self.m)]
+
+        # Not With sets of each free unit (fixed members already removed from allowed groups)
+        unit_rank = np.full(presolved.n_units, -1, dtype=np.int64)
+        unit_rank[free_units] = np.arange(self.m)
+        ranks = unit_rank[presolved.not_with_units]
+        self.unit_sets = [[] for k in range(self.m)]
+        for rank, set_id in zip(ranks, presolved.not_with_set_ids):
+            if rank >= 0:
+                self.unit_sets[rank].append(int(set_id))
+        self.n_sets = encoded.num_not_with_sets
+
+        self.capacity = presolved.capacity.astype(np.int64)
+        self.limits = presolved.max_limits.astype(np.int64)
+
+        self.labels = np.full(self.m, -1, dtype=np.int64)
+        self.load = np.zeros(self.n_groups, dtype=np.int64)
+        self.char_load = np.zeros_like(self.limits)
+        self.nw_count = np.zeros((self.n_sets, self.n_groups), dtype=np.int64)
+
+    def penalties(self):
+        """
+        Compute penalty totals from scratch. Return dict of violations by constraint type and repeat assignments.
+        """
+        labels = self.labels
+        assigned = labels >= 0
+        return {
+            "size": int(np.maximum(self.load - self.capacity, 0).sum()),
+            "not_with": int(np.maximum(self.nw_count - 1, 0).sum()),
+            "maximum": int(np.maximum(self.char_load - self.limits, 0).sum()),
+            "repeats": float(self.repeats[np.flatnonzero(assigned), labels[assigned]].sum()),
+        }
+
+    def objective(self, penalties):
+        return (self.hard_weight * (penalties["size"] + penalties["not_with"])
+                + self.max_weight * penalties["maximum"]
+                + SOFT_WEIGHT * penalties["repeats"])
+
+    def violated_groups(self):
+        """
+        Boolean array marking groups with a violated group size, Maximum, or Not With constraint.
+        """
+        return ((self.load > self.capacity)
+                | (self.char_load > self.limits).any(axis=0)
+                | (self.nw_count > 1).any(axis=0))
+
+    def hard_violations(self, penalties):
+        return penalties["size"] + penalties["not_with"] + (0 if self.elastic else penalties["maximum"])
+
+    def add_deltas(self, k):
+        """
+        Penalty change of adding unit k to each group, vectorized over groups. Not allowed groups are infinite.
+        """
+        w = self.weights[k]
+        delta = self.hard_weight * (np.maximum(self.load + w - self.capacity, 0) - np.maximum(self.load - self.capacity, 0))
+        for r, c in self.unit_max[k]:
+            row = self.char_load[r]
+            delta = delta + self.max_weight * (np.maximum(row + c - self.limits[r], 0) - np.maximum(row - self.limits[r], 0))
+        for s in self.unit_sets[k]:
+            delta = delta + self.hard_weight * (self.nw_count[s] >= 1)
+        delta = delta + SOFT_WEIGHT * self.repeats[k]
+        return np.where(self.allowed[k], delta, np.inf)
+
+    def move_delta(self, k, b):
+        """
+        Penalty change of moving unit k from its group to group b.
+        """
+        a = self.labels[k]
+        w = self.weights[k]
+        load, capacity = self.load, self.capacity
+        delta = self.hard_weight * (over(load[a] - w - capacity[a]) - over(load[a] - capacity[a])
+                               + over(load[b] + w - capacity[b]) - over(load[b] - capacity[b]))
+        for r, c in self.unit_max[k]:
+            row, limit = self.char_load[r], self.limits[r]
+            delta += self.max_weight * (over(row[a] - c - limit[a]) - over(row[a] - limit[a])
+                                        + over(row[b] + c - limit[b]) - over(row[b] - limit[b]))
+        for s in self.unit_sets[k]:
+            row = self.nw_count[s]
+            delta += self.hard_weight * (int(row[b] >= 1) - int(row[a] >= 2))
+        delta += SOFT_WEIGHT * (self.repeats[k, b] - self.repeats[k, a])
+        return delta
+
+    def assign(self, k, b):
+        """
+        Move unit k to group b (from its current group, if any) and update loads and counts.
+        """
+        a = self.labels[k]
+        w = self.weights[k]
+        if a >= 0:
+            self.load[a] -= w
+            for r, c in self.unit_max[k]:
+                self.char_load[r, a] -= c
+            for s in self.unit_sets[k]:
+                self.nw_count[s, a] -= 1
+        self.load[b] += w
+        for r, c in self.unit_max[k]:
+            self.char_load[r, b] += c
+        for s in self.unit_sets[k]:
+            self.nw_count[s, b] += 1
+        self.labels[k] = b
+
+    def name_labels(self):
+        """
+        Create array of group indices with one entry per name from fixed units and the current assignment of the free units.
+        """
+        presolved = self.presolved
+        unit_labels = presolved.fixed.copy()
+        unit_labels[self.free_units] = self.labels
+        return unit_labels[presolved.unit_of]
+
+
+#######################
+# Greedy Construction #
+#######################
+
+def greedy_construction(state, rng):
+    """
+    Assign free units one at a time to the allowed group with the smallest penalty increase. Place large units and units with few allowed groups first. Break ties randomly, preferring groups with more remaining capacity.
+    """
+    num_allowed = state.allowed.sum(axis=1)
+    order = np.lexsort((rng.random(state.m), num_allowed, -state.weights))
+    for k in order:
+        delta = state.add_deltas(k)
+        tie_break = 1e-3 * rng.random(state.n_groups) - 1e-6 * (state.capacity - state.load)
+        state.assign(k, int(np.argmin(delta + tie_break)))
+    return state
+
+
+#######################
+# Simulated Annealing #
+#######################
+
+def simulated_annealing(state, rng, deadline, start_temp=2.0, end_temp=0.02, stall_limit=None):
+    """
+    Improve assignment with unit moves and swaps accepted by the Metropolis rule until the deadline. Temperature decreases geometrically with elapsed time. Stop early when no constraint is violated and no repeat assignment is left, or after stall_limit moves without improvement. Keep the best assignment found.
+    """
+    m = state.m
+    if m == 0:
+        return state, 0
+
+    penalties = state.penalties()
+    current = state.objective(penalties)
+    best = current
+    best_labels = state.labels.copy()
+
+    stall_limit = stall_limit or max(20000, 50 * m)
+    start = time.perf_counter()
+    span = max(deadline - start, 1e-9)
+    temp = start_temp
+    iterations = 0
+    since_best = 0
+
+    violated = []
+    while best > 0 and since_best < stall_limit:
+        if iterations % 256 == 0:
+            now = time.perf_counter()
+            if now >= deadline:
+                break
+            temp = start_temp * (end_temp / start_temp) ** ((now - start) / span)
+            violated = np.flatnonzero(state.violated_groups())
+        iterations += 1
+        since_best += 1
+
+        # focus half of the moves on units in groups with a violated constraint
+        if len(violated) and rng.random() < 0.5:
+            members = np.flatnonzero(state.labels == violated[rng.integers(len(violated))])
+            if not len(members):
+                continue
+            k = int(members[rng.integers(len(members))])
+        else:
+            k = int(rng.integers(m))
+        groups = state.allowed_groups[k]
+        if len(groups) < 2:
+            continue
+        a = state.labels[k]
+        b = int(groups[rng.integers(len(groups))])
+        if b == a:
+            continue
+
+        if rng.random() < 0.5:
+            # move
+            delta = state.move_delta(k, b)
+            if delta <= 0 or rng.random() < math.exp(-delta / temp):
+                state.assign(k, b)
+                current += delta
+        else:
+            # swap with a unit in group b allowed in group a
+            members = np.flatnonzero(state.labels == b) if state.load[b] else []
+            if not len(members):
+                continue
+            j = int(members[rng.integers(len(members))])
+            if not state.allowed[j, a]:
+                continue
+            delta = state.move_delta(k, b)
+            state.assign(k, b)
+            delta += state.move_delta(j, a)
+            if delta <= 0 or rng.random() < math.exp(-delta / temp):
+                state.assign(j, a)
+                current += delta
+            else:
+                state.assign(k, a)
+
+        if current < best - 1e-9:
+            best = current
+            best_labels = state.labels.copy()
+            since_best = 0
+
+    # restore best assignment
+    for k in np.flatnonzero(state.labels != best_labels):
+        state.assign(int(k), int(best_labels[k]))
+    return state, iterations
+
+
+###############
+# MILP Polish #
+###############
+
+def polish_neighborhood(state, rng, max_units):
+    """
+    Choose free units to reoptimize: every unit in a group with a violated constraint, then units of randomly chosen groups up to max_units.
+    """
+    groups = list(np.flatnonzero(state.violated_groups()))
+    for g in rng.permutation(state.n_groups):
+        if np.isin(state.labels, groups).sum() >= max_units:
+            break
+        if g not in groups:
+            groups.append(int(g))
+    return np.flatnonzero(np.isin(state.labels, groups))
+
+
+def milp_polish(state, rng, time_limit, max_units=200):
+    """
+    Fix the free units outside a neighborhood to their current groups and solve the rest of the presolved problem exactly with the sparse engine. Return labels for the free units, or None when the sub-problem is not solved.
+    """
+    presolved = state.presolved
+    neighborhood = polish_neighborhood(state, rng, max_units)
+    outside = np.setdiff1d(np.arange(state.m), neighborhood)
+
+    sub = copy.copy(presolved)
+    sub.allowed = presolved.allowed.copy()
+    sub.fixed = presolved.fixed.copy()
+    sub.capacity = presolved.capacity.copy()
+    sub.max_limits = presolved.max_limits.copy()
+    sub.infeasible = []
+    units = state.free_units[outside]
+    sub.allowed[units] = False
+    sub.allowed[units, state.labels[outside]] = True
+    propagate_fixings(sub)
+    if sub.infeasible:
+        return None
+
+    model = build_presolved_problem(sub, state.elastic, symmetry_breaking=False)
+    unit_rank = np.full(presolved.n_units, -1, dtype=np.int64)
+    unit_rank[state.free_units] = np.arange(state.m)
+    model.c[:model.n_x] += SOFT_WEIGHT * state.repeats[unit_rank[model.col_units], model.col_groups]
+    model.set_slack_penalty(state.max_weight)
+
+    status, solution_df = solve_sparse_problem(model, options={"time_limit": max(time_limit, 0.1)})
+    # keep best solution found within the time limit even if not proven optimal
+    if solution_df.empty:
+        return None
+    return state.presolved.encoded.encode_solution(solution_df)
+
+
+###################
+# Heuristic Solve #
+###################
+
+def solve_heuristic(presolved, elastic, unique_solutions=None, time_limit=DEFAULT_TIME_LIMIT, polish=False, rng=None):
+    """
+    Assign students to groups with greedy construction followed by simulated annealing and an optional MILP polish, all within time_limit seconds. Return status, solution DataFrame with names and assigned groups, and dict of search stats.
+
+    Status is "Feasible" when no hard constraint is violated (group size, Not With, and Maximum unless elastic), since the search never proves a solution optimal, "Infeasible" when presolve proves the problem infeasible, and "Not Solved" otherwise.
+    """
+    start = time.perf_counter()
+    deadline = start + time_limit
+    rng = rng if rng is not None else np.random.default_rng()
+    encoded = presolved.encoded
+
+    if presolved.infeasible:
+        return "Infeasible", pd.DataFrame(columns=["name", "group"]), {
+            "backend": "heuristic", "status": "Infeasible", "objective": None, "gap": None, "nodes": None,
+            "wall_time": time.perf_counter() - start, "build_time": None, "infeasible": presolved.infeasible}
+
+    unique_solutions = unique_solutions or []
+    state = SearchState(presolved, elastic, unit_repeats(presolved, unique_solutions), len(unique_solutions))
+    greedy_construction(state, rng)
+    greedy_penalties = state.penalties()
+
+    search_deadline = deadline - (0.2 * time_limit if polish else 0)
+    state, iterations = simulated_annealing(state, rng, search_deadline)
+    penalties = state.penalties()
+
+    polished = False
+    if polish and state.objective(penalties) > 0:
+        labels = milp_polish(state, rng, deadline - time.perf_counter())
+        if labels is not None:
+            candidate = copy.copy(state)
+            candidate.labels = state.labels.copy()
+            candidate.load = state.load.copy()
+            candidate.char_load = state.char_load.copy()
+            candidate.nw_count = state.nw_count.copy()
+            unit_labels = np.full(presolved.n_units, -1, dtype=np.int64)
+            unit_labels[presolved.unit_of] = labels
+            for k, g in enumerate(unit_labels[state.free_units]):
+                if g != candidate.labels[k]:
+                    candidate.assign(k, int(g))
+            candidate_penalties = candidate.penalties()
+            if candidate.objective(candidate_penalties) < state.objective(penalties):
+                state, penalties, polished = candidate, candidate_penalties, True
+
+    status = "Feasible" if state.hard_violations(penalties) == 0 else "Not Solved"
+    solution_df = encoded.decode_solution(state.name_labels())
+    # report the repeats of every name so the objective matches the other engines
+    offset = fixed_repeats(presolved, unique_solutions)
+    penalties["repeats"] += offset
+    greedy_penalties["repeats"] += offset
+    stats = {
+        "backend": "heuristic",
+        "status": status,
+        "objective": state.objective(penalties),
+        "gap": None,
+        "nodes": None,
+        "wall_time": time.perf_counter() - start,
+        "build_time": None,
+        "greedy_objective": state.objective(greedy_penalties),
+        "iterations": iterations,
+        "polished": polished,
+        **penalties,
+    }
+    return status, solution_df, stats
+
+
+#####################
+# Heuristic Session #
+#####################
+
+class HeuristicSession(object):
+    """
+    Heuristic engine for very large cohorts with the same interface as SolverSession. Encode and presolve once, then each solve runs greedy construction and simulated annealing within time_limit seconds from a new random start.
+    """
+
+    def __init__(self, spec, elastic, unique_solutions=None, time_limit=DEFAULT_TIME_LIMIT, polish=False, seed=None):
+        start = time.perf_counter()
+        self.encoded = encode_problem_spec(spec)
+        self.elastic = elastic
+        self.time_limit = time_limit
+        self.polish = polish
+        self.rng = np.random.default_rng(seed)
+        self.presolved = presolve(self.encoded)
+        self.presolve_stats = None
+        self.group_classes = []
+        self.unique_solutions = list(unique_solutions or [])
+        self.last_stats = None
+        self.build_time = time.perf_counter() - start
+
+    def add_solution(self, solution_df):
+        """
+        Penalize repeat student assignments from solution in the next solve.
+        """
+        self.unique_solutions.append(solution_df)
+
+    def reset(self):
+        """
+        Forget all collected solutions. Same as SolverSession.reset.
+        """
+        self.unique_solutions = []
+        self.last_stats = None
+
+    def randomize_objective(self, seed):
+        """
+        Reseed the search. Each solve already starts from a random assignment, so a new seed is enough for independent solves to find different solutions.
+        """
+        self.rng = np.random.default_rng(seed)
+
+    def solve(self):
+        """
+        Solve with all penalties added so far. Return status and solution DataFrame with names and assigned groups.
+        """
+        with phase("search"):
+            status, solution_df, self.last_stats = solve_heuristic(self.presolved, self.elastic, self.unique_solutions,
+                                                                   self.time_limit, self.polish, self.rng)
+        self.last_stats["build_time"] = self.build_time
+        return status, solution_df
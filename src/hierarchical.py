@@ -0,0 +1,260 @@
+import copy
+import time
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+from src.assign_groups import SOLVED_STATUSES, relaxed_max_char_constraints
+from src.decompose import DecomposedSession
+from src.encoding import encode_problem_spec
+from src.incremental import excess, expand_groups, free_names, solve_neighborhood
+from src.presolve import presolve, propagate_fixings
+from src.profiling import count, phase
+
+
+# students per section when neither the number of sections nor a "section" column is given
+DEFAULT_SECTION_SIZE = 250
+
+# repair rounds spent on lowering the maximum excess of a complete solution (a solution with names left over is always repaired)
+EXCESS_REPAIR_ROUNDS = 2
+
+
+####################
+# Helper Functions #
+####################
+
+def section_groups(spec, num_sections=None):
+    """
+    Section of each group. Sections come from the optional "section" column of "Grouping Setup". Without it, groups are split in sheet order into num_sections sections (default one per DEFAULT_SECTION_SIZE students) with about the same number of seats each. Return array with the section index of each group and list of section labels.
+    """
+    group_df = spec.group_df
+    if "section" in group_df.columns:
+        if group_df["section"].isna().any():
+            raise ValueError(f"\"Grouping Setup\" group id(s) {group_df.loc[group_df['section'].isna(), 'group id'].to_list()} have no section")
+        section_of_group, sections = pd.factorize(group_df["section"])
+        return section_of_group.astype(np.int64), list(sections)
+
+    sizes = group_df["size"].to_numpy(dtype=np.int64)
+    if num_sections is None:
+        num_sections = -(-len(spec.names) // DEFAULT_SECTION_SIZE)
+    num_sections = int(np.clip(num_sections, 1, max(len(sizes), 1)))
+    seats_before = np.cumsum(sizes) - sizes
+    # very uneven group sizes can leave a section without groups
+    _, section_of_group = np.unique(seats_before * num_sections // max(int(sizes.sum()), 1), return_inverse=True)
+    return section_of_group.astype(np.int64), list(range(1, int(section_of_group.max(initial=-1)) + 2))
+
+
+def section_matrix(section_of_group, n_sections):
+    """
+    Sparse (groups x sections) membership matrix.
+    """
+    n_groups = len(section_of_group)
+    return sparse.csr_matrix((np.ones(n_groups, dtype=np.int64), (np.arange(n_groups), section_of_group)), shape=(n_groups, n_sections))
+
+
+def format_section_stats(stats):
+    """
+    Format section assignment stats as one line.
+    """
+    if stats["fallback"]:
+        return f"Sections: restricting to {stats['sections']} sections failed, solving the cohort as one problem"
+    return (f"Sections: {stats['sections']} sections of {stats['min_names']} to {stats['max_names']} students, "
+            f"{stats['over_maximum']:g} above section maximums, assigned in {stats['wall_time']:.2f}s")
+
+
+######################
+# Section Assignment #
+######################
+
+def assign_sections(presolved, section_of_group, n_sections):
+    """
+    Assign each free unit of presolved problem (one With set or single name) to a section, one unit at a time: units with the fewest allowed sections first, then larger units first. A unit only goes to a section with one of its allowed groups (In, Not In, Homogenous, and size) and seats left, and not to a section with as many names of one of its Not With rows as groups. Among those, it goes to the section that keeps the names with each Maximum characteristic within the sum of the section's group maximums and closest to the section's share of seats, and fills the sections evenly. Units fixed by presolve keep the section of their group. Each unit only looks at every section once, so the assignment takes linear time in the number of units, where an exact MILP over every (unit, section) pair grows with the number of students times the number of sections. Return array with the section index of each unit and dict of stats.
+    """
+    start = time.perf_counter()
+    S = n_sections
+    onehot = section_matrix(section_of_group, S)
+    weights = presolved.weights
+    unit_sections = np.full(presolved.n_units, -1, dtype=np.int64)
+    fixed = presolved.fixed >= 0
+    unit_sections[fixed] = section_of_group[presolved.fixed[fixed]]
+    free_units = presolved.free_units
+
+    with phase("sections"):
+        # sections with an allowed group of each free unit
+        allowed_sections = np.asarray(onehot.T @ presolved.allowed[free_units].T.astype(np.int64)).T > 0
+        capacity = np.bincount(section_of_group, weights=presolved.capacity, minlength=S)
+        seats = np.maximum(capacity, 1)
+        left = capacity.copy()
+        n_section_groups = np.bincount(section_of_group, minlength=S)
+        R = presolved.max_counts.shape[0]
+        limits = np.asarray(onehot.T @ presolved.max_limits.T).T.reshape(R, S)
+        free_counts = presolved.max_counts[:, free_units].sum(axis=1)
+        shares = np.maximum(free_counts[:, None] * capacity[None, :] / max(capacity.sum(), 1), 1)
+        counts = np.zeros((R, S))
+
+        # names of each Not With row per section, rows of each unit
+        nw_counts = np.zeros((presolved.encoded.num_not_with_sets, S), dtype=np.int64)
+        unit_sets = pd.Series(presolved.not_with_set_ids).groupby(presolved.not_with_units).agg(list).to_dict()
+
+        order = np.lexsort((-weights[free_units], allowed_sections.sum(axis=1)))
+        for rank in order:
+            unit = free_units[rank]
+            unit_counts = presolved.max_counts[:, unit]
+            sets = unit_sets.get(unit, [])
+            ok = allowed_sections[rank] & (left >= weights[unit])
+            if sets:
+                ok &= (nw_counts[sets] < n_section_groups).all(axis=0)
+            if not ok.any():
+                # no section fits, its group solve fails and the repair step places the unit
+                ok = allowed_sections[rank] if allowed_sections[rank].any() else np.ones(S, dtype=bool)
+            after = counts + unit_counts[:, None]
+            # names above section maximums, then above shares, then fullest sections last
+            score = ((np.maximum(after - limits, 0).sum(axis=0) * (free_counts.sum() + 1.0) * S)
+                     + (unit_counts[:, None] * after / shares).sum(axis=0) - left / seats)
+            section = int(np.flatnonzero(ok)[np.argmin(score[ok])])
+            unit_sections[unit] = section
+            left[section] -= weights[unit]
+            counts[:, section] += unit_counts
+            if sets:
+                nw_counts[sets, section] += 1
+
+    section_names = np.bincount(unit_sections, weights=weights, minlength=S)
+    stats = {"sections": S, "min_names": int(section_names.min()), "max_names": int(section_names.max()),
+             "over_maximum": float(np.maximum(counts - limits, 0).sum()), "wall_time": time.perf_counter() - start}
+    return unit_sections, stats
+
+
+def restrict_to_sections(presolved, unit_sections, section_of_group):
+    """
+    Copy of presolved problem with each free unit only allowed in the groups of its section, so each section is an independent component (see decompose.find_components). Units left with a single group are fixed.
+    """
+    restricted = copy.copy(presolved)
+    for attr in ["allowed", "fixed", "capacity", "max_limits"]:
+        setattr(restricted, attr, getattr(presolved, attr).copy())
+    restricted.infeasible = list(presolved.infeasible)
+    free = presolved.free & (unit_sections >= 0)
+    restricted.allowed[free] &= section_of_group[None, :] == unit_sections[free, None]
+    propagate_fixings(restricted)
+    return restricted
+
+
+##########
+# Repair #
+##########
+
+def is_duplicate(labels, earlier):
+    """
+    Whether array of group indices assigns every name to the same group as one of the earlier solutions (list of arrays of group indices).
+    """
+    return any(np.array_equal(labels, earlier_labels) for earlier_labels in earlier)
+
+
+def repair_solution(spec, encoded, labels, free_groups, time_limit=None, gap=None, earlier=(), status="Feasible"):
+    """
+    Repair merged section solution (array of group indices, -1 for names left over by a failed section solve) with section status across section boundaries. Re-solve the names of free_groups and every name without a group with all other names fixed in their groups, repeating as few assignments of the earlier solutions (list of arrays of group indices) as possible (see incremental.solve_neighborhood), freeing more groups (see incremental.expand_groups) until every name has a group and the solution is not the same as an earlier solution. A complete solution is only replaced by one with less maximum excess, within EXCESS_REPAIR_ROUNDS rounds. A repaired solution is only optimal for its neighborhood, so its status is "Feasible". Return status, solution DataFrame, and dict with rounds, number of free names and groups, and whether the solution is the same as an earlier solution.
+    """
+    missing = bool((labels < 0).any())
+    base_excess = excess(spec, encoded.decode_solution(labels))
+    all_groups = set(range(encoded.n_groups))
+    rounds = 0
+    while True:
+        rounds += 1
+        free = free_names(encoded, labels, {"names": set()}, free_groups)
+        with phase("repair"):
+            repair_status, solution_df, _ = solve_neighborhood(spec, encoded, labels, free, time_limit, gap, earlier)
+        solved = repair_status in SOLVED_STATUSES
+        # with every group free the neighborhood is the whole cohort and a duplicate cannot be avoided
+        duplicate = solved and is_duplicate(encoded.encode_solution(solution_df), earlier)
+        if solved and (missing or excess(spec, solution_df) < base_excess) and (not duplicate or free_groups >= all_groups):
+            status = "Feasible"
+            break
+        if free_groups >= all_groups or (not missing and rounds >= EXCESS_REPAIR_ROUNDS):
+            if missing:
+                status = repair_status
+            else:
+                # keep the section solution
+                solution_df = encoded.decode_solution(labels)
+                duplicate = is_duplicate(labels, earlier)
+            break
+        free_groups = expand_groups(encoded, labels, free, free_groups)
+    return status, solution_df, {"rounds": rounds, "free_names": int(free.sum()), "free_groups": len(free_groups), "duplicate": duplicate}
+
+
+########################
+# Hierarchical Session #
+########################
+
+class HierarchicalSession(DecomposedSession):
+    """
+    Two-level solve for multi-section cohorts with the same interface as SparseSession. Students are first assigned to sections (see assign_sections), then each section is solved as its own small MILP over the groups of that section, in a pool of jobs worker processes (see DecomposedSession). A repair step re-solves the groups of any section that failed, and of groups above a maximum, together with other groups across section boundaries (see repair_solution). The MILPs grow with the section size instead of the cohort, so solve time grows about linearly with the number of students. With more than one section the solution is not proven optimal for the cohort, so its status is "Feasible".
+
+    Example:
+
+        session = HierarchicalSession(spec, elastic=True, num_sections=6, jobs=4)
+        status, solution_df = session.solve()
+    """
+
+    def __init__(self, spec, elastic, unique_solutions=None, num_sections=None, symmetry_breaking=False,
+                 threads=None, time_limit=None, gap=None, seed=None, jobs=1):
+        start = time.perf_counter()
+        encoded = encode_problem_spec(spec)
+        presolved = presolve(encoded)
+        self.section_of_group, self.sections = section_groups(encoded.spec, num_sections)
+        self.unit_sections, self.section_stats = assign_sections(presolved, self.section_of_group, len(self.sections))
+        restricted = restrict_to_sections(presolved, self.unit_sections, self.section_of_group)
+        # restricting can only fail through bin packing of large With sets, solve the sections of the cohort as one problem then
+        self.infeasible = bool(presolved.infeasible)
+        self.section_stats["fallback"] = bool(restricted.infeasible and not self.infeasible)
+        if self.section_stats["fallback"]:
+            count("sections/fallback")
+            restricted = presolved
+        self.time_limit = time_limit
+        self.gap = gap
+        self.repair_stats = None
+        # sections restrict the groups of each name unless the cohort is solved as one problem
+        self.exact = restricted is presolved or len(self.sections) == 1
+        self.earlier = []
+        super().__init__(spec, elastic, unique_solutions, symmetry_breaking, threads, time_limit, gap, seed, jobs, presolved=restricted)
+        self.presolve_stats["sections"] = 1 if self.section_stats["fallback"] else len(self.sections)
+        self.build_time = time.perf_counter() - start
+
+    def add_solution(self, solution_df):
+        """
+        Penalize repeat student assignments from solution in the next solve of every section and in the repair step.
+        """
+        super().add_solution(solution_df)
+        self.earlier.append(self.encoded.encode_solution(solution_df))
+
+    def solve(self):
+        """
+        Solve all sections, merge their solutions, and repair the groups of failed sections and groups above a maximum. Return status and solution DataFrame with names and assigned groups.
+        """
+        start = time.perf_counter()
+        status, solution_df = super().solve()
+        self.repair_stats = None
+        if status in SOLVED_STATUSES and not self.exact:
+            status = self.last_stats["status"] = "Feasible"
+        if self.infeasible:
+            return status, solution_df
+
+        spec = self.encoded.spec
+        labels = self.encoded.encode_solution(solution_df)
+        missing = labels < 0
+        free_groups = set(np.flatnonzero(np.isin(self.section_of_group, self.unit_sections[self.presolved.unit_of[missing]])).tolist())
+        if missing.any() and not free_groups:
+            # names without a section
+            free_groups = set(range(self.encoded.n_groups))
+        if self.elastic:
+            relaxed = relaxed_max_char_constraints(spec, solution_df)
+            free_groups |= set(self.encoded.group_index.get_indexer(relaxed["group"].unique()).tolist())
+        if not free_groups:
+            return status, solution_df
+
+        status, solution_df, self.repair_stats = repair_solution(spec, self.encoded, labels, free_groups, self.time_limit, self.gap,
+                                                                 self.earlier, status)
+        moved = self.encoded.encode_solution(solution_df) != labels
+        self.repair_stats["moved"] = int((moved & ~missing).sum())
+        # the objective of the section solves no longer holds for the repaired solution
+        self.last_stats.update({"status": status, "objective": None, "wall_time": time.perf_counter() - start})
+        return status, solution_df
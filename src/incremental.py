@@ -0,0 +1,289 @@
+import hashlib
+import os
+import pickle
+import time
+
+import numpy as np
+import pandas as pd
+
+from src.assign_groups import SOLVED_STATUSES, relaxed_max_char_constraints, slack_penalty
+from src.encoding import encode_problem_spec
+from src.problem_spec import DEFAULT_CACHE_DIR, ProblemSpec
+from src.profiling import count, phase
+
+
+# name sheets compared as sets of names per row
+NAME_SHEETS = {"with_df": "Constraint - With", "not_with_df": "Constraint - Not With"}
+
+
+####################
+# Helper Functions #
+####################
+
+def name_sets(df):
+    """
+    Set of frozensets of the names in each With or Not With row with at least two names.
+    """
+    stacked = df.stack().dropna()
+    if stacked.empty:
+        return set()
+    rows = stacked.groupby(level=0).agg(frozenset)
+    return set(row for row in rows if len(row) >= 2)
+
+
+def row_set(df, columns):
+    """
+    Set of row tuples of columns.
+    """
+    return set(df[columns].itertuples(index=False, name=None))
+
+
+def excess(spec, solution_df):
+    """
+    Number of people above maximum characteristic constraints in solution.
+    """
+    return int(relaxed_max_char_constraints(spec, solution_df)["excess"].sum())
+
+
+#############
+# Spec Diff #
+#############
+
+def diff_problem_specs(old_spec, new_spec):
+    """
+    Compare two versions of a problem spec. Return dict with list of changes (one string each), set of names (of the new spec) and set of group ids the changes refer to, and whether a change affects every group (a changed Maximum row or characteristic column), in which case nothing can stay fixed.
+    """
+    changes, names, groups, is_global = [], set(), set(), False
+    new_names = set(new_spec.names)
+    old_names = set(old_spec.names)
+
+    # roster
+    added = [name for name in new_spec.names if name not in old_names]
+    removed = [name for name in old_spec.names if name not in new_names]
+    if added:
+        changes.append(f"added {added} to \"Person Setup\"")
+        names.update(added)
+    if removed:
+        changes.append(f"removed {removed} from \"Person Setup\"")
+
+    # characteristics used by Homogenous and Maximum rows
+    chars = set(old_spec.hom_df["characteristic"]) | set(new_spec.hom_df["characteristic"]) | \
+        set(old_spec.max_df["characteristic"]) | set(new_spec.max_df["characteristic"])
+    if not chars <= set(old_spec.person_df.columns) & set(new_spec.person_df.columns):
+        changes.append("changed characteristic columns of \"Person Setup\"")
+        is_global = True
+    elif chars:
+        common = [name for name in new_spec.names if name in old_names]
+        old_values = old_spec.person_df.set_index("name").loc[common, sorted(chars)]
+        new_values = new_spec.person_df.set_index("name").loc[common, sorted(chars)]
+        changed = old_values.index[(old_values != new_values).any(axis=1).to_numpy()].to_list()
+        if changed:
+            changes.append(f"changed characteristics of {changed}")
+            names.update(changed)
+
+    # groups
+    old_sizes, new_sizes = old_spec.groups_size_dict, new_spec.groups_size_dict
+    added_groups = [group for group in new_sizes if group not in old_sizes]
+    removed_groups = [group for group in old_sizes if group not in new_sizes]
+    resized = [group for group in new_sizes if group in old_sizes and new_sizes[group] != old_sizes[group]]
+    for label, changed in [("added groups", added_groups), ("removed groups", removed_groups), ("resized groups", resized)]:
+        if changed:
+            changes.append(f"{label} {changed} in \"Grouping Setup\"")
+    groups.update(added_groups + resized)
+
+    # constraint rows added or removed
+    for attr, sheet in NAME_SHEETS.items():
+        changed = name_sets(getattr(old_spec, attr)) ^ name_sets(getattr(new_spec, attr))
+        if changed:
+            changes.append(f"{len(changed)} row(s) of \"{sheet}\" added or removed")
+            names.update(name for row in changed for name in row)
+    for attr, sheet in [("in_df", "Constraint - In"), ("not_in_df", "Constraint - Not In")]:
+        changed = row_set(getattr(old_spec, attr), ["name", "group id"]) ^ row_set(getattr(new_spec, attr), ["name", "group id"])
+        if changed:
+            changes.append(f"{len(changed)} row(s) of \"{sheet}\" added or removed")
+            names.update(name for name, _ in changed)
+            # an In group needs a free seat
+            if attr == "in_df":
+                groups.update(group for _, group in changed)
+    hom_columns = ["group id", "characteristic", "value"]
+    changed = row_set(old_spec.hom_df, hom_columns) ^ row_set(new_spec.hom_df, hom_columns)
+    if changed:
+        changes.append(f"{len(changed)} row(s) of \"Constraint - Homogenous\" added or removed")
+        groups.update(group for group, _, _ in changed)
+    max_columns = ["maximum", "characteristic", "value"]
+    changed = row_set(old_spec.max_df, max_columns) ^ row_set(new_spec.max_df, max_columns)
+    if changed:
+        changes.append(f"{len(changed)} row(s) of \"Constraint - Maximum\" added or removed")
+        is_global = True
+
+    return {"changes": changes, "names": names & new_names, "groups": groups & set(new_sizes), "global": is_global}
+
+
+################
+# Neighborhood #
+################
+
+def free_names(encoded, labels, diff, free_groups):
+    """
+    Boolean array of the names to re-solve: names the changes refer to, names without a previous group (new students or students of removed groups), and every name previously in a freed group.
+    """
+    free = labels < 0
+    free[encoded.name_index.get_indexer(list(diff["names"]))] = True
+    free |= np.isin(labels, list(free_groups))
+    return free
+
+
+def expand_groups(encoded, labels, free, free_groups):
+    """
+    Free as many more groups as are free already (at least one), the groups with the most seats left over by the fixed names first, for a neighborhood without a good enough solution.
+    """
+    fixed_counts = np.bincount(labels[~free & (labels >= 0)], minlength=encoded.n_groups)
+    spare = encoded.sizes - fixed_counts
+    candidates = [g for g in np.argsort(-spare, kind="stable").tolist() if g not in free_groups]
+    return free_groups | set(candidates[:max(len(free_groups), 1)])
+
+
+def pinned_spec(spec, encoded, labels, free):
+    """
+    Copy of problem spec with an In row for every name that is not free, in its previous group. Presolve fixes these names and leaves them out of the model.
+    """
+    pinned = np.flatnonzero(~free & (labels >= 0))
+    pinned_df = pd.DataFrame({"name": encoded.name_index[pinned].to_numpy(), "group id": encoded.group_index[labels[pinned]].to_numpy()})
+    return ProblemSpec(spec.person_df, spec.group_df, spec.with_df, spec.not_with_df,
+                       pd.concat([spec.in_df, pinned_df], ignore_index=True), spec.not_in_df, spec.hom_df, spec.max_df,
+                       source=spec.source)
+
+
+def solve_neighborhood(spec, encoded, labels, free, time_limit=None, gap=None, earlier=()):
+    """
+    Solve spec with the names that are not free fixed in their previous groups, rewarding each free name that stays in its previous group so as few names as possible move. Each free name in its group of an earlier solution (list of arrays of group indices) costs more than moving every name, so the neighborhood repeats as few assignments as it can. Symmetry breaking is off because it could relabel groups and move names for nothing. A solution is only optimal with the other names pinned, so its status is "Feasible" unless every name is free. The objective in the solve stats is that of the whole problem (repeats plus penalized excess), without the rewards for staying. Return status, solution DataFrame, and solve stats.
+    """
+    from src.sparse_model import SparseSession
+
+    session = SparseSession(pinned_spec(spec, encoded, labels, free), elastic=True, symmetry_breaking=False,
+                            time_limit=time_limit, gap=gap)
+    model = session.model
+    stay = np.flatnonzero(free & (labels >= 0))
+    cols, _ = model.x_columns(stay, labels[stay])
+    np.add.at(model.c, cols[cols >= 0], -1)
+    repeat_weight = int(free.sum()) + 1
+    for earlier_labels in earlier:
+        repeat = np.flatnonzero(free & (earlier_labels >= 0))
+        cols, _ = model.x_columns(repeat, earlier_labels[repeat])
+        np.add.at(model.c, cols[cols >= 0], repeat_weight)
+    # one person above a maximum still costs more than moving every name and repeating every assignment
+    model.set_slack_penalty(slack_penalty(encoded.n_names, len(earlier) * repeat_weight + 1))
+    status, solution_df = session.solve()
+    count("variables/incremental", model.num_variables)
+    stats = dict(session.last_stats)
+    if status in SOLVED_STATUSES:
+        new_labels = encoded.encode_solution(solution_df)
+        repeats = sum(int(((new_labels == earlier_labels) & (earlier_labels >= 0)).sum()) for earlier_labels in earlier)
+        stats["objective"] = repeats + slack_penalty(encoded.n_names, len(earlier)) * excess(spec, solution_df)
+        if not free.all():
+            status = stats["status"] = "Feasible"
+    return status, solution_df, stats
+
+
+#####################
+# Incremental Solve #
+#####################
+
+def incremental_solve(old_spec, old_solution_df, new_spec, time_limit=None, gap=None):
+    """
+    Re-solve new_spec after edits to old_spec, starting from old_solution_df. Names the edits do not affect stay fixed in their previous groups and only the neighborhood of the changes is solved: the names and groups the changes refer to and every name in those groups. A neighborhood that is infeasible or relaxes more maximums than the old solution is grown (see expand_groups) until it holds every group. The status is "Feasible" unless every name was free (see solve_neighborhood). Return status, solution DataFrame, and dict with the changes, number of free names and groups, rounds, number of moved names, solve stats, and wall time.
+
+    Example:
+
+        status, solution_df, info = incremental_solve(old_spec, old_solution_df, new_spec)
+        print(f"{info['moved']} students moved")
+    """
+    start = time.perf_counter()
+    with phase("diff"):
+        diff = diff_problem_specs(old_spec, new_spec)
+    encoded = encode_problem_spec(new_spec)
+    labels = encoded.encode_solution(old_solution_df)
+    base_excess = excess(old_spec, old_solution_df)
+
+    all_groups = set(range(encoded.n_groups))
+    if diff["global"]:
+        free_groups = all_groups
+    else:
+        affected = encoded.name_index.get_indexer(list(diff["names"]))
+        free_groups = set(encoded.group_index.get_indexer(list(diff["groups"])).tolist())
+        free_groups |= set(labels[affected][labels[affected] >= 0].tolist())
+
+    rounds = 0
+    while True:
+        rounds += 1
+        free = free_names(encoded, labels, diff, free_groups)
+        with phase("incremental"):
+            status, solution_df, stats = solve_neighborhood(new_spec, encoded, labels, free, time_limit, gap)
+        if free_groups >= all_groups or (status in SOLVED_STATUSES and excess(new_spec, solution_df) <= base_excess):
+            break
+        free_groups = expand_groups(encoded, labels, free, free_groups)
+
+    new_labels = encoded.encode_solution(solution_df)
+    kept = labels >= 0
+    info = {
+        "changes": diff["changes"],
+        "free_names": int(free.sum()),
+        "free_groups": len(free_groups),
+        "rounds": rounds,
+        "moved": int((new_labels[kept] != labels[kept]).sum()) if status in SOLVED_STATUSES else None,
+        "stats": stats,
+        "wall_time": time.perf_counter() - start,
+    }
+    return status, solution_df, info
+
+
+def format_incremental_info(info, n_names, n_groups):
+    """
+    Format incremental solve summary as one line.
+    """
+    moved = f"{info['moved']} moved" if info["moved"] is not None else "no solution"
+    return (f"Incremental: {info['free_names']} of {n_names} students free in {info['free_groups']} of {n_groups} groups "
+            f"after {info['rounds']} round(s), {moved}, wall time {info['wall_time']:.2f}s")
+
+
+############
+# Last Run #
+############
+
+def last_run_path(filename, cache_dir=DEFAULT_CACHE_DIR):
+    """
+    Create path for the spec and first solution of the last run on input filename, keyed by its absolute path.
+    """
+    key = hashlib.sha256(os.path.abspath(filename).encode()).hexdigest()
+    return os.path.join(cache_dir, f"last_run_{key}.pkl")
+
+
+def read_last_run(filename, cache_dir=DEFAULT_CACHE_DIR):
+    """
+    Read spec and first solution DataFrame of the last run on input filename. Return None if missing or unreadable.
+    """
+    path = last_run_path(filename, cache_dir)
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, "rb") as f:
+            spec, solution_df = pickle.load(f)
+    except Exception:
+        return None
+    return spec, solution_df
+
+
+def write_last_run(filename, spec, solution_df, cache_dir=DEFAULT_CACHE_DIR):
+    """
+    Write spec and first solution of this run on input filename for a later incremental run. Write to temporary file first so concurrent runs never read a partial file.
+    """
+    path = last_run_path(filename, cache_dir)
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as f:
+            pickle.dump((spec, solution_df), f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, path)
+    except OSError:
+        # incremental runs are an optimization only, e.g. read-only directory
+        pass
@@ -0,0 +1,227 @@
+import numpy as np
+
+from src.encoding import encode_problem_spec
+
+
+####################
+# Helper Functions #
+####################
+
+class UnionFind(object):
+    """
+    Disjoint sets over integers 0 to n - 1 with path halving and union by size.
+    """
+
+    def __init__(self, n):
+        self.parent = np.arange(n)
+        self.size = np.ones(n, dtype=np.int64)
+
+    def find(self, item):
+        parent = self.parent
+        while parent[item] != item:
+            parent[item] = parent[parent[item]]
+            item = parent[item]
+        return item
+
+    def union(self, a, b):
+        root_a, root_b = self.find(a), self.find(b)
+        if root_a == root_b:
+            return root_a
+        if self.size[root_a] < self.size[root_b]:
+            root_a, root_b = root_b, root_a
+        self.parent[root_b] = root_a
+        self.size[root_a] += self.size[root_b]
+        return root_a
+
+    def roots(self):
+        """
+        Array with the root of each item.
+        """
+        return np.array([self.find(item) for item in range(len(self.parent))], dtype=np.int64)
+
+
+def format_rows(rows):
+    """
+    Format sorted unique sheet rows as "row 3" or "rows 3, 5".
+    """
+    rows = sorted(set(int(row) for row in rows))
+    return ("row " if len(rows) == 1 else "rows ") + ", ".join(str(row) for row in rows)
+
+
+def name_list(encoded, name_idx):
+    return [encoded.names[idx] for idx in name_idx]
+
+
+#################
+# Static Checks #
+#################
+
+def check_total_capacity(encoded, conflicts):
+    """
+    Total group size must hold every student.
+    """
+    total = int(encoded.sizes.sum())
+    if total < encoded.n_names:
+        conflicts.append(f"\"Grouping Setup\" sizes add up to {total} but \"Person Setup\" has {encoded.n_names} students")
+
+
+def check_with_units(encoded, unit_of, with_rows_of_unit, conflicts):
+    """
+    Names assigned together by overlapping With rows must fit in the largest group.
+    """
+    weights = np.bincount(unit_of, minlength=encoded.n_names)
+    largest = int(encoded.sizes.max()) if encoded.n_groups else 0
+    for unit in np.flatnonzero(weights > largest):
+        # a single name without With rows, e.g. no groups at all
+        if unit not in with_rows_of_unit:
+            conflicts.append(f"\"Person Setup\" name {name_list(encoded, np.flatnonzero(unit_of == unit))[0]} does not fit "
+                             f"in the largest group size {largest}")
+            continue
+        conflicts.append(f"\"Constraint - With\" {format_rows(with_rows_of_unit[unit])} put {weights[unit]} students together "
+                         f"but the largest group size is {largest}")
+
+
+def check_with_not_with(encoded, unit_of, with_rows_of_unit, conflicts):
+    """
+    Not With set must not contain two names assigned together by With rows, and must not have more names than there are groups.
+    """
+    n = encoded.n_names
+    set_ids = encoded.not_with_set_ids
+    keys = set_ids * n + unit_of[encoded.not_with_members]
+    unique_keys, counts = np.unique(keys, return_counts=True)
+    for key in unique_keys[counts > 1]:
+        set_id, unit = divmod(int(key), n)
+        together = encoded.not_with_members[keys == key]
+        # the same name twice in one row
+        if unit not in with_rows_of_unit:
+            conflicts.append(f"\"Constraint - Not With\" row {encoded.not_with_rows[set_id]} lists {name_list(encoded, together)[0]} "
+                             f"more than once")
+            continue
+        conflicts.append(f"\"Constraint - Not With\" row {encoded.not_with_rows[set_id]} separates {name_list(encoded, together)} "
+                         f"but \"Constraint - With\" {format_rows(with_rows_of_unit[unit])} put them together")
+
+    set_sizes = np.bincount(set_ids, minlength=encoded.num_not_with_sets)
+    for set_id in np.flatnonzero(set_sizes > encoded.n_groups):
+        conflicts.append(f"\"Constraint - Not With\" row {encoded.not_with_rows[set_id]} separates {set_sizes[set_id]} students "
+                         f"but there are only {encoded.n_groups} groups")
+
+
+def check_in(encoded, unit_of, conflicts):
+    """
+    In rows must not send names assigned together to different groups, must not contradict Not In or Homogenous rows, and must not overfill a group.
+    """
+    n, G = encoded.n_names, encoded.n_groups
+    in_units = unit_of[encoded.in_names]
+
+    # in rows on one unit to different groups
+    order = np.lexsort([encoded.in_groups, in_units])
+    units_sorted, groups_sorted = in_units[order], encoded.in_groups[order]
+    split = np.flatnonzero(units_sorted[1:] != units_sorted[:-1]) + 1
+    for positions in np.split(np.arange(len(order)), split):
+        if len(positions) and groups_sorted[positions[0]] != groups_sorted[positions[-1]]:
+            rows = encoded.in_rows[order[positions]]
+            conflicts.append(f"\"Constraint - In\" {format_rows(rows)} put students who must be together "
+                             f"in groups {sorted(set(encoded.groups[g] for g in groups_sorted[positions]))}")
+
+    # in and not in on the same (unit, group)
+    in_keys = in_units * G + encoded.in_groups
+    not_in_keys = unit_of[encoded.not_in_names] * G + encoded.not_in_groups
+    for in_pos in np.flatnonzero(np.isin(in_keys, not_in_keys)):
+        not_in_rows = encoded.not_in_rows[not_in_keys == in_keys[in_pos]]
+        conflicts.append(f"\"Constraint - In\" row {encoded.in_rows[in_pos]} and \"Constraint - Not In\" {format_rows(not_in_rows)} "
+                         f"disagree on {encoded.names[encoded.in_names[in_pos]]} in group {encoded.groups[encoded.in_groups[in_pos]]}")
+
+    # in to a homogenous group for a unit with a name without the characteristic
+    for hom_pos, (group_idx, mask) in enumerate(zip(encoded.hom_groups, encoded.hom_masks)):
+        excluded_units = np.zeros(n, dtype=bool)
+        excluded_units[unit_of[~mask]] = True
+        for in_pos in np.flatnonzero((encoded.in_groups == group_idx) & excluded_units[in_units]):
+            conflicts.append(f"\"Constraint - In\" row {encoded.in_rows[in_pos]} assigns {encoded.names[encoded.in_names[in_pos]]} "
+                             f"to group {encoded.groups[group_idx]} but \"Constraint - Homogenous\" row {encoded.hom_rows[hom_pos]} "
+                             f"excludes that student or a student who must be with them")
+
+    # names sent to each group by in rows (whole units) must fit in the group
+    unit_groups = np.unique(in_units * G + encoded.in_groups)
+    units, groups = np.divmod(unit_groups, G)
+    weights = np.bincount(unit_of, minlength=n)
+    in_load = np.bincount(groups, weights=weights[units], minlength=G).astype(np.int64)
+    for group_idx in np.flatnonzero(in_load > encoded.sizes):
+        rows = encoded.in_rows[encoded.in_groups == group_idx]
+        conflicts.append(f"\"Constraint - In\" {format_rows(rows)} put {in_load[group_idx]} students in group "
+                         f"{encoded.groups[group_idx]} of size {encoded.sizes[group_idx]}")
+
+
+def check_homogenous_capacity(encoded, conflicts):
+    """
+    Homogenous group only takes students with the characteristic, so its usable size is the smaller of its size and the number of such students. Usable sizes must hold every student.
+    """
+    if not len(encoded.hom_groups):
+        return
+    usable = encoded.sizes.copy()
+    for group_idx in np.unique(encoded.hom_groups):
+        eligible = encoded.hom_masks[encoded.hom_groups == group_idx].all(axis=0)
+        usable[group_idx] = min(usable[group_idx], eligible.sum())
+    # only blame the Homogenous rows when the sizes alone would hold every student
+    if usable.sum() < encoded.n_names <= encoded.sizes.sum():
+        limited = np.flatnonzero(usable < encoded.sizes)
+        rows = encoded.hom_rows[np.isin(encoded.hom_groups, limited)]
+        details = ", ".join(f"group {encoded.groups[g]} {usable[g]} of {encoded.sizes[g]}" for g in limited)
+        conflicts.append(f"\"Constraint - Homogenous\" {format_rows(rows)} leave {int(usable.sum())} usable places "
+                         f"for {encoded.n_names} students ({details})")
+
+
+def check_allowed_groups(encoded, unit_of, conflicts):
+    """
+    Every unit of names assigned together needs at least one group that is large enough and not excluded by Not In or Homogenous rows.
+    """
+    n, G = encoded.n_names, encoded.n_groups
+    weights = np.bincount(unit_of, minlength=n)
+    excluded = [unit_of[encoded.not_in_names] * G + encoded.not_in_groups]
+    for group_idx, mask in zip(encoded.hom_groups, encoded.hom_masks):
+        excluded.append(np.unique(unit_of[~mask]) * G + group_idx)
+    keys = np.unique(np.concatenate(excluded))
+    units, groups = np.divmod(keys, G)
+
+    # only count exclusions of groups large enough for the unit
+    large_enough = encoded.sizes[groups] >= weights[units]
+    n_excluded = np.bincount(units[large_enough], minlength=n)
+    n_too_small = np.searchsorted(np.sort(encoded.sizes), weights, side="left")
+    roots = np.unique(unit_of)
+    for unit in roots[n_excluded[roots] + n_too_small[roots] >= G]:
+        names = np.flatnonzero(unit_of == unit)
+        not_in_rows = encoded.not_in_rows[np.isin(encoded.not_in_names, names)]
+        hom_rows = encoded.hom_rows[(~encoded.hom_masks[:, names]).any(axis=1)] if len(encoded.hom_rows) else []
+        sources = [f"\"Constraint - Not In\" {format_rows(not_in_rows)}" if len(not_in_rows) else "",
+                   f"\"Constraint - Homogenous\" {format_rows(hom_rows)}" if len(hom_rows) else "",
+                   "group sizes" if n_too_small[unit] else ""]
+        conflicts.append(f"no allowed group for {name_list(encoded, names)} ({', '.join(s for s in sources if s)})")
+
+
+########################
+# Infeasibility Report #
+########################
+
+def find_infeasibilities(spec):
+    """
+    Statically check problem spec or template .xlsx filename for constraint rows that make every grouping infeasible, without building or solving the LP problem. Names assigned together by With rows are merged with union-find, so every check runs in near-linear time in the number of names and constraint rows. Return list of conflicts, each naming the conflicting sheet rows. Empty list does not prove feasibility.
+    """
+    encoded = encode_problem_spec(spec)
+    conflicts = []
+
+    # merge overlapping with rows into units of names assigned together
+    union_find = UnionFind(encoded.n_names)
+    for a, b in encoded.with_pairs():
+        union_find.union(a, b)
+    unit_of = union_find.roots()
+    with_rows_of_unit = {}
+    for member, set_id in zip(encoded.with_members, encoded.with_set_ids):
+        with_rows_of_unit.setdefault(int(unit_of[member]), set()).add(int(encoded.with_rows[set_id]))
+
+    check_total_capacity(encoded, conflicts)
+    check_with_units(encoded, unit_of, with_rows_of_unit, conflicts)
+    check_with_not_with(encoded, unit_of, with_rows_of_unit, conflicts)
+    check_in(encoded, unit_of, conflicts)
+    check_homogenous_capacity(encoded, conflicts)
+    check_allowed_groups(encoded, unit_of, conflicts)
+
+    return conflicts
@@ -0,0 +1,114 @@
+import glob
+import hashlib
+import json
+import os
+import pickle
+
+from src.problem_spec import DEFAULT_CACHE_DIR
+from src.profiling import count, phase
+
+
+# bump to invalidate cached models after changing the SparseModel layout
+MODEL_CACHE_VERSION = 1
+
+# cached models kept in the cache directory, least recently used are removed (a model of 5000 students is about 1 GB)
+MODEL_CACHE_SIZE = 2
+
+
+####################
+# Helper Functions #
+####################
+
+def model_key(spec, options):
+    """
+    Create sha256 hex digest of the spec file digest and dict of model options, e.g. engine, elastic, presolve, and symmetry_breaking. None for a spec that was not loaded from a file (e.g. generated), which is never cached.
+    """
+    if getattr(spec, "digest", None) is None:
+        return None
+    key = json.dumps({"version": MODEL_CACHE_VERSION, "spec": spec.digest, **options}, sort_keys=True)
+    return hashlib.sha256(key.encode()).hexdigest()
+
+
+def model_cache_path(key, cache_dir=DEFAULT_CACHE_DIR):
+    """
+    Create path for cached model keyed by model key.
+    """
+    return os.path.join(cache_dir, f"model_v{MODEL_CACHE_VERSION}_{key}.pkl")
+
+
+def checkpoint_path(key, cache_dir=DEFAULT_CACHE_DIR):
+    """
+    Create path for solution checkpoint (JSON lines, see streaming.JsonLinesSolutionWriter) keyed by model key.
+    """
+    return os.path.join(cache_dir, f"checkpoint_{key}.jsonl")
+
+
+def prune_model_cache(cache_dir, keep=MODEL_CACHE_SIZE):
+    """
+    Remove all but the keep most recently used cached models.
+    """
+    paths = sorted(glob.glob(os.path.join(cache_dir, "model_v*.pkl")), key=os.path.getmtime, reverse=True)
+    for path in paths[keep:]:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+###############
+# Model Cache #
+###############
+
+def read_cached_model(key, cache_dir=DEFAULT_CACHE_DIR):
+    """
+    Read pickled model from cache and mark it as used. Return None if missing or unreadable (e.g. written by another scipy version).
+    """
+    path = model_cache_path(key, cache_dir)
+    if key is None or not os.path.exists(path):
+        return None
+    with phase("model_cache"):
+        try:
+            with open(path, "rb") as f:
+                model = pickle.load(f)
+            os.utime(path)
+        except Exception:
+            return None
+    count("model_cache_hits")
+    return model
+
+
+def write_cached_model(model, key, cache_dir=DEFAULT_CACHE_DIR):
+    """
+    Write pickled model to cache and remove least recently used models. Write to temporary file first so concurrent runs never read a partial file. Does nothing without key.
+    """
+    if key is None:
+        return
+    path = model_cache_path(key, cache_dir)
+    with phase("model_cache"):
+        try:
+            os.makedirs(cache_dir, exist_ok=True)
+            tmp_path = f"{path}.{os.getpid()}.tmp"
+            with open(tmp_path, "wb") as f:
+                pickle.dump(model, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, path)
+        except OSError:
+            # cache is an optimization only, e.g. read-only directory or full disk
+            return
+    prune_model_cache(cache_dir)
+
+
+def cached_model(build, key, cache_dir=DEFAULT_CACHE_DIR):
+    """
+    Return model cached under key or build it with build() and cache it. Set cache_dir or key to None to always build.
+
+    Example:
+
+        model, stats = cached_model(lambda: build_model(encoded, elastic), key)
+    """
+    if cache_dir is None or key is None:
+        return build()
+    model = read_cached_model(key, cache_dir)
+    if model is None:
+        model = build()
+        write_cached_model(model, key, cache_dir)
+    return model
@@ -0,0 +1,204 @@
+import numpy as np
+import pandas as pd
+
+
+# seconds per solve with pair history unless a time limit is given, proving the fewest repeated partners optimal can take long
+DEFAULT_TIME_LIMIT = 10
+
+
+####################
+# Helper Functions #
+####################
+
+def pair_keys(name_0, name_1):
+    """
+    Combine two arrays of name indices into one int64 key per unordered pair.
+    """
+    lo, hi = np.minimum(name_0, name_1).astype(np.int64), np.maximum(name_0, name_1).astype(np.int64)
+    return (lo << 32) | hi
+
+
+def split_pair_keys(keys):
+    """
+    Split pair keys into arrays of lower and higher name index.
+    """
+    return keys >> 32, keys & 0xFFFFFFFF
+
+
+def group_pairs(name_idx, group_codes):
+    """
+    Create arrays of name indices of every pair of names with the same group code.
+    """
+    order = np.argsort(group_codes, kind="stable")
+    name_idx, group_codes = name_idx[order], group_codes[order]
+    starts = np.flatnonzero(np.r_[True, group_codes[1:] != group_codes[:-1]])
+    sizes = np.diff(np.r_[starts, len(group_codes)])
+    name_0, name_1 = [], []
+    for size in np.unique(sizes[sizes > 1]):
+        i, j = np.triu_indices(size, k=1)
+        group_starts = starts[sizes == size]
+        name_0.append(name_idx[(group_starts[:, None] + i).ravel()])
+        name_1.append(name_idx[(group_starts[:, None] + j).ravel()])
+    if not name_0:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+    return np.concatenate(name_0), np.concatenate(name_1)
+
+
+################
+# Pair History #
+################
+
+class PairHistory(object):
+    """
+    Number of groupings in which each two students were in the same group. Stored as sparse sorted pair keys with counts over a growing list of names, so the size grows with the number of distinct pairs and not with the number of groupings. Update after each grouping and save to an .npz file between terms. Names are compared as strings.
+
+    Example:
+
+        history = PairHistory.load("history.npz")
+        history.update(solution_df)
+        history.save("history.npz")
+    """
+
+    def __init__(self, names=None, keys=None, counts=None, num_groupings=0):
+        self.names = [str(name) for name in names] if names is not None else []
+        self.name_pos = {name: idx for idx, name in enumerate(self.names)}
+        self.keys = np.asarray(keys, dtype=np.int64) if keys is not None else np.zeros(0, dtype=np.int64)
+        self.counts = np.asarray(counts, dtype=np.int64) if counts is not None else np.zeros(0, dtype=np.int64)
+        self.num_groupings = int(num_groupings)
+
+    def __repr__(self):
+        return f"PairHistory(names={len(self.names)}, pairs={self.num_pairs}, groupings={self.num_groupings})"
+
+    @property
+    def num_pairs(self):
+        return len(self.keys)
+
+    def name_indices(self, names, add=False):
+        """
+        Map names to history name indices. With add, append unknown names, otherwise map them to -1.
+        """
+        positions = np.empty(len(names), dtype=np.int64)
+        for k, name in enumerate(names):
+            name = str(name)
+            if name not in self.name_pos and add:
+                self.name_pos[name] = len(self.names)
+                self.names.append(name)
+            positions[k] = self.name_pos.get(name, -1)
+        return positions
+
+    def update(self, solution_df):
+        """
+        Add one to the count of every pair of names in the same group in solution DataFrame.
+        """
+        name_idx = self.name_indices(solution_df["name"].to_numpy(), add=True)
+        group_codes, _ = pd.factorize(solution_df["group"])
+        name_0, name_1 = group_pairs(name_idx, group_codes)
+        keys, inverse = np.unique(np.concatenate([self.keys, pair_keys(name_0, name_1)]), return_inverse=True)
+        new_counts = np.concatenate([self.counts, np.ones(len(name_0), dtype=np.int64)])
+        self.keys = keys
+        self.counts = np.bincount(inverse.ravel(), weights=new_counts, minlength=len(keys)).astype(np.int64)
+        self.num_groupings += 1
+        return self
+
+    def pair_counts(self, names):
+        """
+        Create arrays of indices into names of each pair with history and its count. Pairs with a name not in names are skipped.
+        """
+        positions = np.full(len(self.names), -1, dtype=np.int64)
+        history_idx = self.name_indices(names)
+        found = history_idx >= 0
+        positions[history_idx[found]] = np.flatnonzero(found)
+        name_0, name_1 = split_pair_keys(self.keys)
+        name_0, name_1 = positions[name_0], positions[name_1]
+        keep = (name_0 >= 0) & (name_1 >= 0)
+        return name_0[keep], name_1[keep], self.counts[keep]
+
+    def repeated_pairs(self, solution_df):
+        """
+        Count pairs of names in the same group in solution DataFrame weighted by the number of earlier groupings that had them together.
+        """
+        name_idx = self.name_indices(solution_df["name"].to_numpy())
+        group_codes, _ = pd.factorize(solution_df["group"])
+        known = name_idx >= 0
+        name_0, name_1 = group_pairs(name_idx[known], group_codes[known])
+        pos = np.searchsorted(self.keys, pair_keys(name_0, name_1)).clip(max=max(self.num_pairs - 1, 0))
+        found = self.keys[pos] == pair_keys(name_0, name_1) if self.num_pairs else np.zeros(len(pos), dtype=bool)
+        return int(self.counts[pos[found]].sum())
+
+    def save(self, filename):
+        """
+        Save history to compressed .npz file.
+        """
+        np.savez_compressed(filename, names=np.array(self.names, dtype=str), keys=self.keys, counts=self.counts,
+                            num_groupings=self.num_groupings)
+
+    @classmethod
+    def load(cls, filename):
+        """
+        Load history saved with save. Missing file gives an empty history.
+        """
+        try:
+            data = np.load(filename)
+        except FileNotFoundError:
+            return cls()
+        with data:
+            return cls(data["names"].tolist(), data["keys"], data["counts"], data["num_groupings"])
+
+
+#########################
+# Pair Penalty Encoding #
+#########################
+
+class PairPenaltyRows(object):
+    """
+    Repeat partner rows for the pair history penalty. For each name i with history partners (partner_names[k]) and each group g:
+
+        sum_j count[i, j] * x[j, g] + big_m[k, g] * x[i, g] - repeats[k, g] <= big_m[k, g]
+
+    so repeats[k, g] is at least the number of earlier groupings name i shared with the names in group g when i is in group g, and free otherwise. big_m[k, g] is the sum of the size[g] largest counts of i, the most group g can hold without i. The number of rows is names with history times groups, whatever the number of earlier groupings. Entries are stored flat: name entry_k[e] has partner entry_j[e] with count entry_count[e].
+    """
+
+    def __init__(self, encoded, history):
+        n, G = encoded.n_names, encoded.n_groups
+        name_0, name_1, counts = history.pair_counts(encoded.names)
+        name_i = np.concatenate([name_0, name_1])
+        name_j = np.concatenate([name_1, name_0])
+        count = np.concatenate([counts, counts])
+
+        self.partner_names = np.unique(name_i)
+        self.n_groups = G
+        rank = np.full(n, -1, dtype=np.int64)
+        rank[self.partner_names] = np.arange(len(self.partner_names))
+        self.entry_k = rank[name_i]
+        self.entry_j = name_j
+        self.entry_count = count
+
+        # sum of the largest size counts of each name, for a group of earlier partners without the name
+        order = np.lexsort([-count, self.entry_k])
+        sorted_k, sorted_count = self.entry_k[order], count[order]
+        starts = np.searchsorted(sorted_k, np.arange(len(self.partner_names)))
+        degree = np.bincount(sorted_k, minlength=len(self.partner_names))
+        cumulative = np.r_[0, np.cumsum(sorted_count)]
+        take = np.minimum(encoded.sizes[None, :], degree[:, None])
+        self.big_m = (cumulative[starts[:, None] + take] - cumulative[starts[:, None]]).astype(float)
+
+    def __repr__(self):
+        return f"PairPenaltyRows(names={len(self.partner_names)}, entries={len(self.entry_k)}, rows={self.num_rows})"
+
+    @property
+    def num_rows(self):
+        return len(self.partner_names) * self.n_groups
+
+    @property
+    def total_weight(self):
+        """
+        Largest possible sum of repeats, each repeated pair counted once from each name.
+        """
+        return int(self.entry_count.sum())
+
+
+def pair_penalty_rows(encoded, history):
+    """
+    Encode pair history as repeat partner rows for the names and groups of integer-encoded problem.
+    """
+    return PairPenaltyRows(encoded, history)
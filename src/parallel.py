@@ -0,0 +1,131 @@
+import concurrent.futures
+
+import numpy as np
+
+from src.assign_groups import SOLVED_STATUSES, relaxed_max_char_constraints
+from src.encoding import encode_problem_spec
+from src.problem_spec import as_problem_spec
+
+
+# independent solves per requested solution
+DEFAULT_OVERSAMPLE = 2
+
+
+####################
+# Helper Functions #
+####################
+
+def canonical_labels(labels):
+    """
+    Relabel array of group indices by order of first appearance so partitions that only differ by group labels get the same labels. Names labeled -1 stay -1.
+    """
+    labels = np.asarray(labels)
+    canonical = np.full(len(labels), -1, dtype=np.int64)
+    assigned = labels >= 0
+    groups, first = np.unique(labels[assigned], return_index=True)
+    rank = np.empty(len(groups), dtype=np.int64)
+    rank[np.argsort(first)] = np.arange(len(groups))
+    canonical[assigned] = rank[np.searchsorted(groups, labels[assigned])]
+    return canonical
+
+
+def partition_key(labels):
+    """
+    Hashable key equal for partitions that only differ by group labels.
+    """
+    return canonical_labels(labels).tobytes()
+
+
+def partition_distance(labels_a, labels_b):
+    """
+    Count pairs of names together in exactly one of two partitions. Zero when the partitions only differ by group labels.
+    """
+    def pairs(counts):
+        return int((counts * (counts - 1) // 2).sum())
+
+    assigned = (labels_a >= 0) & (labels_b >= 0)
+    a, b = labels_a[assigned], labels_b[assigned]
+    _, both = np.unique(a * (b.max(initial=0) + 1) + b, return_counts=True)
+    return pairs(np.bincount(a)) + pairs(np.bincount(b)) - 2 * pairs(both)
+
+
+####################
+# Worker Functions #
+####################
+
+# session built once per worker process by init_worker
+_worker_session = None
+
+
+def init_worker(session_factory, spec):
+    """
+    Build the elastic model once in each worker process.
+    """
+    global _worker_session
+    _worker_session = session_factory(spec, elastic=True)
+
+
+def solve_randomized(seed):
+    """
+    Solve the worker's model with an objective randomized by seed. Return seed, status, solution DataFrame, and solve stats.
+    """
+    _worker_session.randomize_objective(seed)
+    status, solution_df = _worker_session.solve()
+    return seed, status, solution_df, _worker_session.last_stats
+
+
+##################
+# Parallel Solve #
+##################
+
+def select_diverse(candidates, num_solutions):
+    """
+    Pick up to num_solutions candidates, fewest relaxed maximums first. Among candidates with equal excess, pick the one farthest (most pairs of names split differently) from the candidates already picked.
+    """
+    remaining = sorted(candidates, key=lambda candidate: candidate["excess"])
+    selected = []
+    while remaining and len(selected) < num_solutions:
+        best_excess = remaining[0]["excess"]
+        tier = [candidate for candidate in remaining if candidate["excess"] == best_excess]
+        if selected:
+            pick = max(tier, key=lambda candidate: min(partition_distance(candidate["labels"], other["labels"]) for other in selected))
+        else:
+            pick = tier[0]
+        selected.append(pick)
+        remaining.remove(pick)
+    return selected
+
+
+def solve_parallel(spec, session_factory, num_solutions, jobs, seed=None, oversample=DEFAULT_OVERSAMPLE):
+    """
+    Solve num_solutions * oversample independent problems with randomized objectives in a pool of jobs worker processes, drop duplicate partitions (same groups up to relabeling), and keep the best num_solutions diverse solutions. session_factory(spec, elastic=True) builds a session with a randomize_objective method in each worker.
+
+    Return list of solution DataFrames and dict with the number of solves, optimal solves, unique partitions, and the solve stats of each kept solution.
+    """
+    spec = as_problem_spec(spec)
+    encoded = encode_problem_spec(spec)
+    seeds = np.random.SeedSequence(seed).generate_state(num_solutions * oversample)
+
+    with concurrent.futures.ProcessPoolExecutor(max_workers=jobs, initializer=init_worker,
+                                                initargs=(session_factory, spec)) as executor:
+        results = list(executor.map(solve_randomized, [int(s) for s in seeds]))
+
+    candidates = {}
+    for task_seed, status, solution_df, solve_stats in results:
+        if status not in SOLVED_STATUSES:
+            continue
+        labels = encoded.encode_solution(solution_df)
+        key = partition_key(labels)
+        if key not in candidates:
+            excess = int(relaxed_max_char_constraints(spec, solution_df)["excess"].sum())
+            candidates[key] = {"seed": task_seed, "solution_df": solution_df, "labels": labels, "excess": excess,
+                               "stats": solve_stats}
+
+    selected = select_diverse(list(candidates.values()), num_solutions)
+    stats = {
+        "solves": len(results),
+        "optimal": sum(result[1] == "Optimal" for result in results),
+        "unique": len(candidates),
+        "solve_stats": [candidate["stats"] for candidate in selected],
+    }
+    return [candidate["solution_df"] for candidate in selected], stats
@@ -0,0 +1,244 @@
+import datetime
+import multiprocessing
+import os
+import queue
+import shutil
+import signal
+import tempfile
+import time
+
+import pandas as pd
+
+from src.benchmark import save_results
+from src.problem_spec import as_problem_spec
+
+
+# solver configurations raced by default, in order of priority when fewer are raced
+DEFAULT_PORTFOLIO = [
+    {"engine": "pulp", "backend": "cbc", "seed": 0},
+    {"engine": "sparse"},
+    {"engine": "pulp", "backend": "highs", "seed": 0},
+    {"engine": "pulp", "backend": "cbc", "seed": 1},
+    {"engine": "pulp", "backend": "cbc", "seed": 2},
+    {"engine": "sparse", "presolve": False},
+]
+
+# seconds to wait past the time limit for solvers to report before cancelling them
+DEADLINE_GRACE = 5.0
+
+# relative gap at which a solve without a requested gap counts as proven optimal
+PROVEN_GAP = 1e-6
+
+# race log row for each configuration of each race, in column order
+RACE_COLUMNS = ["date", "workbook", "num_names", "race", "config", "winner", "status", "objective", "gap", "wall_time"]
+
+
+####################
+# Helper Functions #
+####################
+
+def default_portfolio(num_configs=None):
+    """
+    First num_configs configurations of DEFAULT_PORTFOLIO, one per CPU (at least two) by default.
+    """
+    num_configs = num_configs if num_configs is not None else max(os.cpu_count() or 1, 2)
+    return [dict(config) for config in DEFAULT_PORTFOLIO[:num_configs]]
+
+
+def config_label(config):
+    """
+    Short label of solver configuration, e.g. "pulp/cbc seed=1" or "sparse presolve=False".
+    """
+    options = " ".join(f"{key}={value}" for key, value in config.items() if key not in ["engine", "backend"])
+    engine = f"{config['engine']}/{config['backend']}" if "backend" in config else config["engine"]
+    return f"{engine} {options}".strip()
+
+
+def is_proven(status, stats, gap=None):
+    """
+    Whether a solve found a solution proven optimal within the requested relative gap.
+    """
+    tolerance = gap if gap is not None else PROVEN_GAP
+    return status == "Optimal" and (stats["gap"] is None or stats["gap"] <= tolerance + PROVEN_GAP)
+
+
+def is_better(stats, best_stats):
+    """
+    Whether a solve has a lower objective than the best one so far. Objectives of every engine count the repeats of names fixed by presolve, so they compare across configurations.
+    """
+    if best_stats is None:
+        return True
+    if stats["objective"] is None:
+        return False
+    return best_stats["objective"] is None or stats["objective"] < best_stats["objective"]
+
+
+def cancel_process(process):
+    """
+    Stop worker process and the solver programs it started. Each worker leads its own process group, so one signal reaches the CBC or HiGHS program too.
+    """
+    if not process.is_alive():
+        process.join()
+        return
+    try:
+        os.killpg(process.pid, signal.SIGTERM)
+    except (AttributeError, ProcessLookupError, PermissionError):
+        # no process groups on Windows
+        process.terminate()
+    process.join(1.0)
+    if process.is_alive():
+        try:
+            os.killpg(process.pid, signal.SIGKILL)
+        except (AttributeError, ProcessLookupError, PermissionError):
+            process.kill()
+        process.join()
+
+
+###############
+# Race Worker #
+###############
+
+def race_worker(results, idx, spec, elastic, unique_solutions, config, time_limit, gap, work_dir):
+    """
+    Solve the problem with one configuration in its own process group and put (idx, status, solution DataFrame, solve stats) or (idx, "Error", None, message) on the results queue. Solver output is discarded and temporary solver files go to work_dir, which the race removes afterwards.
+    """
+    if hasattr(os, "setsid"):
+        os.setsid()
+    devnull = os.open(os.devnull, os.O_WRONLY)
+    os.dup2(devnull, 1)
+    os.environ["TMPDIR"] = os.environ["TMP"] = tempfile.tempdir = work_dir
+
+    options = {key: value for key, value in config.items() if key != "engine"}
+    try:
+        if config["engine"] == "sparse":
+            from src.sparse_model import run_sparse_problem
+            status, solution_df, stats = run_sparse_problem(spec, elastic, unique_solutions, time_limit=time_limit, gap=gap,
+                                                            return_stats=True, **options)
+        else:
+            from src.assign_groups import run_lp_problem
+            status, solution_df, stats = run_lp_problem(spec, elastic, unique_solutions, time_limit=time_limit, gap=gap,
+                                                        return_stats=True, **options)
+        results.put((idx, status, solution_df, stats))
+    except Exception as e:
+        results.put((idx, "Error", None, f"{type(e).__name__}: {e}"))
+
+
+##############
+# Race Solve #
+##############
+
+def race_lp_problem(spec, elastic, unique_solutions, configs=None, time_limit=None, gap=None, log_file=None, return_stats=False):
+    """
+    Race solver configurations (dicts with engine "pulp" or "sparse" and the options of run_lp_problem or run_sparse_problem, see DEFAULT_PORTFOLIO) on the same problem, each in its own process. Return the first solution proven optimal within gap and cancel the other solves. With a time limit (seconds per configuration), wait at most DEADLINE_GRACE seconds longer and return the best solution reported by then. Same arguments and return value as run_lp_problem, with the winning configuration label and the status of every configuration in the stats.
+
+    With log_file, append one row per configuration to this CSV file (see RACE_COLUMNS) to see which configurations win.
+
+    Example:
+
+        status, solution_df = race_lp_problem(spec, True, [], configs=[{"engine": "pulp", "seed": 0}, {"engine": "sparse"}])
+    """
+    from src.assign_groups import SOLVED_STATUSES
+
+    start = time.perf_counter()
+    spec = as_problem_spec(spec)
+    configs = configs if configs is not None else default_portfolio()
+    labels = [config_label(config) for config in configs]
+    deadline = start + time_limit + DEADLINE_GRACE if time_limit is not None else None
+
+    work_dir = tempfile.mkdtemp(prefix="race_")
+    results = multiprocessing.Queue()
+    processes = [multiprocessing.Process(target=race_worker, daemon=True,
+                                         args=(results, idx, spec, elastic, unique_solutions or [], config, time_limit, gap,
+                                               os.path.join(work_dir, str(idx))))
+                 for idx, config in enumerate(configs)]
+    for idx, process in enumerate(processes):
+        os.makedirs(os.path.join(work_dir, str(idx)))
+        process.start()
+
+    outcomes = {}
+    best = None
+    try:
+        while len(outcomes) < len(processes):
+            timeout = max(deadline - time.perf_counter(), 0) if deadline is not None else None
+            try:
+                idx, status, solution_df, stats = results.get(timeout=timeout)
+            except queue.Empty:
+                break
+            outcomes[idx] = (status, stats)
+            if status == "Error":
+                continue
+            stats["wall_time"] = time.perf_counter() - start
+            if status in SOLVED_STATUSES and (best is None or is_better(stats, best[3])):
+                best = (idx, status, solution_df, stats)
+            if is_proven(status, stats, gap):
+                best = (idx, status, solution_df, stats)
+                break
+    finally:
+        for process in processes:
+            cancel_process(process)
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    if best is None:
+        status, solution_df = "Not Solved", pd.DataFrame(columns=["name", "group"])
+        stats = {"backend": None, "status": status, "objective": None, "gap": None, "nodes": None,
+                 "wall_time": time.perf_counter() - start, "build_time": None}
+        winner = None
+    else:
+        winner, status, solution_df, stats = best
+        stats = dict(stats)
+    stats["winner"] = labels[winner] if winner is not None else None
+    stats["race"] = {label: (outcomes[idx][0] if idx in outcomes else "Cancelled") for idx, label in enumerate(labels)}
+
+    if log_file is not None:
+        date = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        rows = []
+        for idx, label in enumerate(labels):
+            row_status, row_stats = outcomes.get(idx, ("Cancelled", None))
+            row_stats = row_stats if isinstance(row_stats, dict) else {}
+            rows.append({"date": date, "workbook": spec.source, "num_names": len(spec.names), "race": len(labels),
+                         "config": label, "winner": idx == winner, "status": row_status, "objective": row_stats.get("objective"),
+                         "gap": row_stats.get("gap"), "wall_time": row_stats.get("wall_time")})
+        save_results(pd.DataFrame(rows, columns=RACE_COLUMNS), log_file, RACE_COLUMNS)
+
+    if return_stats:
+        return status, solution_df, stats
+    return status, solution_df
+
+
+################
+# Race Session #
+################
+
+class RaceSession(object):
+    """
+    Race solver configurations for each solution (see race_lp_problem), with the same interface as SolverSession except randomize_objective, so races cannot run in the randomized parallel solves (-j N). Each race rebuilds the model with one uniqueness cut per collected solution in every worker process, so racing pays off when solve time is much longer than build time.
+    """
+
+    # no presolve or symmetry report, same interface as SolverSession
+    presolve_stats = None
+    group_classes = []
+
+    def __init__(self, spec, elastic, unique_solutions=None, configs=None, time_limit=None, gap=None, log_file=None):
+        self.spec = as_problem_spec(spec)
+        self.elastic = elastic
+        self.configs = configs if configs is not None else default_portfolio()
+        self.time_limit = time_limit
+        self.gap = gap
+        self.log_file = log_file
+        self.unique_solutions = list(unique_solutions or [])
+        self.build_time = 0.0
+        self.last_stats = None
+
+    def add_solution(self, solution_df):
+        """
+        Penalize repeat student assignments from solution in the next race.
+        """
+        self.unique_solutions.append(solution_df)
+
+    def solve(self):
+        """
+        Race the configurations on the problem with all cuts added so far. Return status and solution DataFrame with names and assigned groups.
+        """
+        status, solution_df, self.last_stats = race_lp_problem(self.spec, self.elastic, self.unique_solutions, self.configs,
+                                                               self.time_limit, self.gap, self.log_file, return_stats=True)
+        return status, solution_df
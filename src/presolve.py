@@ -0,0 +1,389 @@
+import numpy as np
+from scipy import sparse
+from scipy.sparse.csgraph import connected_components
+
+from src.profiling import count, phase
+from src.sparse_model import RowBlocks, SparseModel
+from src.symmetry import group_classes, presolved_group_signatures, spec_group_signatures, symmetry_breaking_rows
+
+
+####################
+# Helper Functions #
+####################
+
+def with_units(encoded):
+    """
+    Merge names in With sets into units (connected components of the With pairs, same result as union-find). Return array with the unit index of each name and the number of units.
+    """
+    n = encoded.n_names
+    pairs = encoded.with_pairs()
+    graph = sparse.coo_matrix((np.ones(len(pairs)), (pairs[:, 0], pairs[:, 1])), shape=(n, n))
+    n_units, unit_of = connected_components(graph, directed=False)
+    return unit_of.astype(np.int64), n_units
+
+
+def unit_char_counts(masks, unit_of, n_units):
+    """
+    Count names with characteristic in each unit. Return matrix with one row per characteristic row and one column per unit.
+    """
+    if not len(masks):
+        return np.zeros((0, n_units), dtype=np.int64)
+    # (units x names) membership matrix times (names x rows) characteristic matrix
+    membership = sparse.csr_matrix((np.ones(len(unit_of), dtype=np.int64), (unit_of, np.arange(len(unit_of)))),
+                                   shape=(n_units, len(unit_of)))
+    return np.asarray(membership @ masks.T.astype(np.int64)).T
+
+
+def expand_unit_columns(units, col_units):
+    """
+    Expand each unit in units to the columns of that unit where col_units is sorted. Return entry position in units and column index for every (entry, column) combination.
+    """
+    starts = np.searchsorted(col_units, units, side="left")
+    ends = np.searchsorted(col_units, units, side="right")
+    lengths = ends - starts
+    entries = np.repeat(np.arange(len(units)), lengths)
+    offsets = np.arange(lengths.sum()) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+    return entries, np.repeat(starts, lengths) + offsets
+
+
+def count_lp_problem(encoded, elastic, symmetry_breaking=False):
+    """
+    Count variables and rows of the LP problem without presolve as built by build_lp_problem. Symmetry breaking adds one prefix count column and two rows per name and class group but the last (see symmetry_breaking_rows).
+    """
+    n, G = encoded.n_names, encoded.n_groups
+    n_max = len(encoded.max_limits)
+    classes = group_classes(spec_group_signatures(encoded)) if symmetry_breaking else []
+    n_aux = sum(len(groups) - 1 for groups in classes) * n
+    num_variables = n * G + (n_max * G if elastic else 0) + n_aux
+    num_rows = (n + G
+                + len(encoded.with_pairs()) * G
+                + encoded.num_not_with_sets * G
+                + len(encoded.in_names)
+                + len(encoded.not_in_names)
+                + int((~encoded.hom_masks).sum())
+                + n_max * G
+                + 2 * n_aux)
+    return num_variables, num_rows
+
+
+####################
+# Presolve Problem #
+####################
+
+class PresolvedProblem(object):
+    """
+    Reduced problem over units of names that must be assigned together. A unit is one With set (or a single name) weighted by its number of names. Units with a single allowed group are fixed to that group and removed from the model, with the capacity and maximum characteristic limits of the group reduced accordingly.
+    """
+
+    def __init__(self, encoded):
+        self.encoded = encoded
+        n_groups = encoded.n_groups
+
+        self.unit_of, self.n_units = with_units(encoded)
+        self.weights = np.bincount(self.unit_of, minlength=self.n_units)
+        self.fixed = np.full(self.n_units, -1, dtype=np.int64)
+        self.allowed = np.ones((self.n_units, n_groups), dtype=bool)
+        self.capacity = encoded.sizes.copy()
+        self.max_counts = unit_char_counts(encoded.max_masks, self.unit_of, self.n_units)
+        self.max_limits = np.repeat(encoded.max_limits[:, None], n_groups, axis=1)
+        self.not_with_units = self.unit_of[encoded.not_with_members]
+        self.not_with_set_ids = encoded.not_with_set_ids.copy()
+        # units in the model, all but the units of other components when decomposed
+        self.active = np.ones(self.n_units, dtype=bool)
+        # reasons the problem is infeasible
+        self.infeasible = []
+
+    def __repr__(self):
+        return f"PresolvedProblem(units={self.n_units}, free_units={len(self.free_units)}, allowed_pairs={self.num_allowed_pairs})"
+
+    @property
+    def free(self):
+        return (self.fixed < 0) & self.active
+
+    @property
+    def free_units(self):
+        return np.flatnonzero(self.free)
+
+    @property
+    def num_fixed_names(self):
+        return int(self.weights[self.fixed >= 0].sum())
+
+    @property
+    def num_allowed_pairs(self):
+        return int(self.allowed[self.free].sum())
+
+    def unit_names(self, unit):
+        """
+        List names in unit.
+        """
+        return [self.encoded.names[idx] for idx in np.flatnonzero(self.unit_of == unit)]
+
+    def add_infeasible(self, reason):
+        self.infeasible.append(reason)
+
+
+def apply_fixings(presolved):
+    """
+    Remove allowed groups using the In, Not In, and Homogenous constraints. In constraints apply to every name in the unit of the specified name.
+    """
+    encoded = presolved.encoded
+    unit_of = presolved.unit_of
+    allowed = presolved.allowed
+
+    # not in
+    allowed[unit_of[encoded.not_in_names], encoded.not_in_groups] = False
+
+    # homogenous: unit with any name without characteristic not allowed in group
+    for group_idx, mask in zip(encoded.hom_groups, encoded.hom_masks):
+        allowed[np.unique(unit_of[~mask]), group_idx] = False
+
+    # in: unit only allowed in its In group, no group at all with In to different groups
+    in_mask = np.zeros_like(allowed)
+    in_mask[unit_of[encoded.in_names], encoded.in_groups] = True
+    has_in = in_mask.any(axis=1)
+    allowed[has_in] &= in_mask[has_in]
+    allowed[in_mask.sum(axis=1) > 1] = False
+
+    # not with: two names in one set that must be assigned together
+    pair_keys = presolved.not_with_set_ids * presolved.n_units + presolved.not_with_units
+    keys, counts = np.unique(pair_keys, return_counts=True)
+    for key in keys[counts > 1]:
+        set_id, unit = divmod(int(key), presolved.n_units)
+        presolved.add_infeasible(
+            f"\"Constraint - Not With\" row {encoded.not_with_rows[set_id]} separates names assigned together by \"Constraint - With\": {presolved.unit_names(unit)}")
+
+
+def propagate_fixings(presolved):
+    """
+    Repeatedly fix units with a single allowed group. After each round, remove groups without capacity for a unit and groups holding a fixed Not With partner from the remaining units.
+    """
+    encoded = presolved.encoded
+    n_groups = encoded.n_groups
+    allowed = presolved.allowed
+    weights = presolved.weights
+    n_sets = encoded.num_not_with_sets
+
+    while True:
+        free = presolved.fixed < 0
+
+        # capacity
+        allowed[free] &= weights[free, None] <= presolved.capacity[None, :]
+
+        # not with: group holding a fixed name of the set blocked for the other names
+        if n_sets:
+            set_units = presolved.not_with_units
+            set_groups = presolved.fixed[set_units]
+            on_fixed = set_groups >= 0
+            occupied = np.bincount(presolved.not_with_set_ids[on_fixed] * n_groups + set_groups[on_fixed],
+                                   minlength=n_sets * n_groups).reshape(n_sets, n_groups)
+            for set_id, group_idx in zip(*np.nonzero(occupied > 1)):
+                presolved.add_infeasible(
+                    f"\"Constraint - Not With\" row {encoded.not_with_rows[set_id]} has names fixed together in group {encoded.groups[group_idx]}")
+            membership = sparse.csr_matrix((np.ones(len(set_units)), (set_units, presolved.not_with_set_ids)),
+                                           shape=(presolved.n_units, n_sets))
+            blocked = np.asarray(membership @ (occupied > 0).astype(np.int64)) > 0
+            allowed[free] &= ~blocked[free]
+
+        n_allowed = allowed.sum(axis=1)
+        for unit in np.flatnonzero(free & (n_allowed == 0)):
+            presolved.add_infeasible(f"no allowed group for {presolved.unit_names(unit)}")
+        if presolved.infeasible:
+            return presolved
+
+        newly = np.flatnonzero(free & (n_allowed == 1))
+        if not len(newly):
+            return presolved
+
+        groups = allowed[newly].argmax(axis=1)
+        presolved.fixed[newly] = groups
+        presolved.capacity -= np.bincount(groups, weights=weights[newly], minlength=n_groups).astype(np.int64)
+        # units fixed in the same round can overfill a group together
+        for group_idx in np.flatnonzero(presolved.capacity < 0):
+            presolved.add_infeasible(f"names fixed in group {encoded.groups[group_idx]} exceed its size by {-presolved.capacity[group_idx]}")
+        onehot = sparse.csr_matrix((np.ones(len(newly), dtype=np.int64), (np.arange(len(newly)), groups)),
+                                   shape=(len(newly), n_groups))
+        presolved.max_limits -= np.asarray(presolved.max_counts[:, newly] @ onehot, dtype=np.int64).reshape(presolved.max_limits.shape)
+
+
+def presolve(encoded):
+    """
+    Presolve integer-encoded problem: merge With sets into weighted units, remove allowed groups using the In, Not In, and Homogenous constraints, and fix units with a single allowed group.
+    """
+    with phase("presolve"):
+        presolved = PresolvedProblem(encoded)
+        apply_fixings(presolved)
+        if not presolved.infeasible:
+            propagate_fixings(presolved)
+    return presolved
+
+
+###################
+# Presolved Model #
+###################
+
+class PresolvedModel(SparseModel):
+    """
+    Matrix form of presolved problem. Columns are the allowed (unit, group) pairs of the free units, sorted by unit then group, followed by any slack columns.
+    """
+
+    def __init__(self, presolved, col_units, col_groups, c, A, row_lb, row_ub, var_lb, var_ub, integrality):
+        super().__init__(presolved.encoded, c, A, row_lb, row_ub, var_lb, var_ub, integrality)
+        self.presolved = presolved
+        self.col_units = col_units
+        self.col_groups = col_groups
+        if presolved.infeasible:
+            self.infeasible = "; ".join(presolved.infeasible)
+
+    @property
+    def n_x(self):
+        return len(self.col_units)
+
+    def labels_from_x(self, x):
+        presolved = self.presolved
+        unit_labels = presolved.fixed.copy()
+        chosen = np.flatnonzero(x[:self.n_x] > 0.5)
+        unit_labels[self.col_units[chosen]] = self.col_groups[chosen]
+        return unit_labels[presolved.unit_of]
+
+    def x_columns(self, name_idx, group_idx):
+        n_groups = self.encoded.n_groups
+        units = self.presolved.unit_of[name_idx]
+        fixed = self.presolved.fixed[units]
+        keys = units * n_groups + group_idx
+        col_keys = self.col_units * n_groups + self.col_groups
+        pos = np.searchsorted(col_keys, keys).clip(max=max(len(col_keys) - 1, 0))
+        found = (col_keys[pos] == keys) & (fixed < 0) if len(col_keys) else np.zeros(len(keys), dtype=bool)
+        # fixed units are in their group, free units are never in a group without a column
+        return np.where(found, pos, -1), (fixed == group_idx).astype(float)
+
+    def add_solution_penalty(self, labels):
+        n_groups = self.encoded.n_groups
+        assigned = np.flatnonzero(labels >= 0)
+        keys = self.presolved.unit_of[assigned] * n_groups + labels[assigned]
+        col_keys = self.col_units * n_groups + self.col_groups
+        pos = np.searchsorted(col_keys, keys).clip(max=max(len(col_keys) - 1, 0))
+        found = col_keys[pos] == keys if len(col_keys) else np.zeros(len(keys), dtype=bool)
+        # each name of the unit in the same group adds one repeat
+        np.add.at(self.c, pos[found], 1)
+        # names of fixed units in the same group repeat in every solution, so the objective matches the unpresolved model
+        self.objective_offset += int((self.presolved.fixed[self.presolved.unit_of[assigned]] == labels[assigned]).sum())
+
+
+def build_presolved_problem(presolved, elastic, symmetry_breaking=False):
+    """
+    Build the matrix form of the presolved problem with a rigid or elastic maximum characteristic constraint based on elastic parameter. Rows that no assignment of the free units can violate are left out.
+    """
+    encoded = presolved.encoded
+    G = encoded.n_groups
+    weights = presolved.weights
+
+    free_units = presolved.free_units
+    unit_rank = np.full(presolved.n_units, -1, dtype=np.int64)
+    unit_rank[free_units] = np.arange(len(free_units))
+    free_idx, col_groups = np.nonzero(presolved.allowed[free_units])
+    col_units = free_units[free_idx]
+    n_x = len(col_units)
+
+    # maximum characteristic rows: only (max row, group) pairs whose limit free units can exceed
+    max_rows, max_units = np.nonzero(presolved.max_counts[:, free_units])
+    max_units = free_units[max_units]
+    entries, max_cols = expand_unit_columns(max_units, col_units)
+    max_keys = max_rows[entries] * G + col_groups[max_cols]
+    max_vals = presolved.max_counts[max_rows[entries], max_units[entries]]
+    limits = presolved.max_limits.ravel()
+    totals = np.bincount(max_keys, weights=max_vals, minlength=limits.size)
+    kept_keys = np.flatnonzero(totals > limits)
+    n_slack = len(kept_keys) if elastic else 0
+
+    # symmetry breaking adds auxiliary prefix count columns after the slack columns
+    classes = group_classes(presolved_group_signatures(presolved)) if symmetry_breaking else []
+    n_aux, symmetry_block = symmetry_breaking_rows(col_units, col_groups, G, classes, n_x + n_slack)
+    n_cols = n_x + n_slack + n_aux
+
+    blocks = RowBlocks(n_cols)
+
+    # one group per unit
+    blocks.add(unit_rank[col_units], np.arange(n_x), 1, 1, 1, len(free_units), name="one_group_per_name")
+
+    # group capacity weighted by unit size, only where allowed units could exceed it
+    totals = np.bincount(col_groups, weights=weights[col_units], minlength=G)
+    kept = totals > presolved.capacity
+    group_rank = np.cumsum(kept) - 1
+    in_kept = kept[col_groups]
+    blocks.add(group_rank[col_groups[in_kept]], np.flatnonzero(in_kept), weights[col_units[in_kept]],
+               -np.inf, presolved.capacity[kept], int(kept.sum()), name="max_name_per_group")
+
+    # not with: only (set, group) rows with at least two allowed free units
+    set_units = presolved.not_with_units
+    free_members = presolved.free[set_units]
+    entries, nw_cols = expand_unit_columns(set_units[free_members], col_units)
+    nw_keys = presolved.not_with_set_ids[free_members][entries] * G + col_groups[nw_cols]
+    keys, inverse, counts = np.unique(nw_keys, return_inverse=True, return_counts=True)
+    row_rank = np.cumsum(counts >= 2) - 1
+    in_kept = (counts >= 2)[inverse]
+    blocks.add(row_rank[inverse[in_kept]], nw_cols[in_kept], 1, -np.inf, 1, int((counts >= 2).sum()), name="not_with")
+
+    # maximum characteristic
+    key_rank = np.full(limits.size, -1, dtype=np.int64)
+    key_rank[kept_keys] = np.arange(len(kept_keys))
+    in_kept = key_rank[max_keys] >= 0
+    rows, cols, vals = key_rank[max_keys[in_kept]], max_cols[in_kept], max_vals[in_kept]
+    if elastic:
+        rows = np.concatenate([rows, np.arange(n_slack)])
+        cols = np.concatenate([cols, n_x + np.arange(n_slack)])
+        vals = np.concatenate([vals, -np.ones(n_slack)])
+    blocks.add(rows, cols, vals, -np.inf, limits[kept_keys], len(kept_keys), name="maximum")
+
+    # symmetry breaking: order interchangeable groups by lowest-indexed free unit
+    blocks.add(*symmetry_block, name="symmetry")
+
+    A, row_lb, row_ub = blocks.to_csr()
+    count("variables/decision", n_x)
+    count("variables/slack", n_slack)
+    count("variables/symmetry", n_aux)
+
+    var_lb = np.zeros(n_cols)
+    var_ub = np.concatenate([np.ones(n_x), np.full(n_slack + n_aux, np.inf)])
+    c = np.concatenate([np.zeros(n_x), np.ones(n_slack), np.zeros(n_aux)])
+    integrality = np.concatenate([np.ones(n_x), np.zeros(n_slack + n_aux)])
+
+    model = PresolvedModel(presolved, col_units, col_groups, c, A, row_lb, row_ub, var_lb, var_ub, integrality)
+    model.group_classes = classes
+    model.slack_cols = n_x + np.arange(n_slack)
+
+    # rigid limit already exceeded by fixed units alone
+    if not elastic and (limits < 0).any():
+        r, g = divmod(int(np.flatnonzero(limits < 0)[0]), G)
+        reason = f"\"Constraint - Maximum\" row {encoded.max_rows[r]} exceeded in group {encoded.groups[g]} by fixed names"
+        model.infeasible = reason if model.infeasible is None else f"{model.infeasible}; {reason}"
+
+    return model
+
+
+######################
+# Presolve Reporting #
+######################
+
+def presolve_stats(presolved, model, elastic, symmetry_breaking=False):
+    """
+    Create dict of variable and row counts before and after presolve, both with or both without symmetry breaking.
+    """
+    num_variables, num_rows = count_lp_problem(presolved.encoded, elastic, symmetry_breaking)
+    return {
+        "variables_before": num_variables,
+        "rows_before": num_rows,
+        "variables_after": model.num_variables,
+        "rows_after": model.num_rows,
+        "units": presolved.n_units,
+        "fixed_names": presolved.num_fixed_names,
+    }
+
+
+def format_presolve_stats(stats):
+    """
+    Format presolve stats as one line.
+    """
+    return (f"Presolve: {stats['variables_before']} --> {stats['variables_after']} variables, "
+            f"{stats['rows_before']} --> {stats['rows_after']} rows "
+            f"({stats['units']} units, {stats['fixed_names']} names fixed"
+            + (f", {stats['components']} independent components)" if stats.get("components", 1) > 1 else ")"))
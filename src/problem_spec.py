@@ -0,0 +1,394 @@
+import hashlib
+import json
+import os
+import pickle
+
+import pandas as pd
+
+from src.profiling import count, phase
+
+
+# attribute name --> template sheet name
+SHEET_NAMES = {
+    "person_df": "Person Setup",
+    "group_df": "Grouping Setup",
+    "with_df": "Constraint - With",
+    "not_with_df": "Constraint - Not With",
+    "in_df": "Constraint - In",
+    "not_in_df": "Constraint - Not In",
+    "hom_df": "Constraint - Homogenous",
+    "max_df": "Constraint - Maximum",
+}
+
+# instruction line above the column headers of each template sheet
+SHEET_INSTRUCTIONS = {
+    "Person Setup": "Enter names and characteristic values (1 = has characteristic, 0 = does not have characteristic)",
+    "Grouping Setup": "Enter group IDs and sizes",
+    "Constraint - With": "Enter names in a row to ensure assigned to group together",
+    "Constraint - Not With": "Enter names in a row to ensure assigned to different groups",
+    "Constraint - In": "Enter names to assign to specific group",
+    "Constraint - Not In": "Enter names to not assign to specific group",
+    "Constraint - Homogenous": "Enter values to ensure all names in specified group have specified characteristic and characteristic value",
+    "Constraint - Maximum": "Enter values to ensure no more than maximum number of people with specified characteristic and characteristic value assigned to each group",
+}
+
+# columns each sheet must have, With and Not With sheets may have more name columns
+SHEET_COLUMNS = {
+    "Person Setup": ["name"],
+    "Grouping Setup": ["group id", "size"],
+    "Constraint - With": ["name 1", "name 2"],
+    "Constraint - Not With": ["name 1", "name 2"],
+    "Constraint - In": ["name", "group id"],
+    "Constraint - Not In": ["name", "group id"],
+    "Constraint - Homogenous": ["group id", "characteristic", "value"],
+    "Constraint - Maximum": ["maximum", "characteristic", "value"],
+}
+
+# sheets that cannot be left out of a directory or JSON document, missing constraint sheets have no rows
+REQUIRED_SHEETS = ["Person Setup", "Grouping Setup"]
+
+# template sheet name --> file stem in a directory of CSV or Parquet files (e.g. "constraint_not_with.csv") or key in a JSON document
+SHEET_FILES = {name: name.lower().replace(" - ", "_").replace(" ", "_") for name in SHEET_NAMES.values()}
+
+# bump to invalidate cached specs after changing the ProblemSpec layout
+CACHE_VERSION = 2
+
+DEFAULT_CACHE_DIR = ".cache"
+
+
+################
+# Problem Spec #
+################
+
+class ProblemSpec(object):
+    """
+    In-memory problem specification with one DataFrame per template sheet. Parse the template once and pass the spec to every constraint function instead of re-reading the .xlsx file.
+    """
+
+    def __init__(self, person_df, group_df, with_df, not_with_df, in_df, not_in_df, hom_df, max_df, source=None, digest=None):
+        self.person_df = person_df
+        self.group_df = group_df
+        self.with_df = with_df
+        self.not_with_df = not_with_df
+        self.in_df = in_df
+        self.not_in_df = not_in_df
+        self.hom_df = hom_df
+        self.max_df = max_df
+        # file the spec was parsed from and hash of its contents
+        self.source = source
+        self.digest = digest
+
+    def __repr__(self):
+        return f"ProblemSpec(source={self.source!r}, names={len(self.names)}, groups={len(self.groups)})"
+
+    @property
+    def names(self):
+        return self.person_df["name"].to_list()
+
+    @property
+    def groups(self):
+        return self.group_df["group id"].to_list()
+
+    @property
+    def groups_size_dict(self):
+        """
+        Dict of group sizes with {group id: size}.
+        """
+        return pd.Series(self.group_df["size"].values, index=self.group_df["group id"]).to_dict()
+
+    def sheet(self, sheet_name):
+        """
+        Return DataFrame for template sheet name (e.g. "Constraint - With").
+        """
+        for attr, name in SHEET_NAMES.items():
+            if name == sheet_name:
+                return getattr(self, attr)
+        raise KeyError(f"Unknown template sheet \"{sheet_name}\"")
+
+
+####################
+# Helper Functions #
+####################
+
+def hash_file(file, sha=None):
+    """
+    Create sha256 hex digest of file contents, or of the name and contents of every sheet file in a directory.
+    """
+    if os.path.isdir(file):
+        sha = hashlib.sha256()
+        for name in sorted(os.listdir(file)):
+            if os.path.splitext(name)[0] in SHEET_FILES.values():
+                sha.update(name.encode())
+                hash_file(os.path.join(file, name), sha)
+        return sha.hexdigest()
+
+    digest = sha if sha is not None else hashlib.sha256()
+    with open(file, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def cache_path(digest, cache_dir):
+    """
+    Create path for cached spec keyed by file digest.
+    """
+    return os.path.join(cache_dir, f"spec_v{CACHE_VERSION}_{digest}.pkl")
+
+
+def read_cached_spec(path):
+    """
+    Read pickled spec from cache. Return None if missing or unreadable (e.g. written by another pandas version).
+    """
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, "rb") as f:
+            spec = pickle.load(f)
+    except Exception:
+        return None
+    return spec if isinstance(spec, ProblemSpec) else None
+
+
+def write_cached_spec(spec, path):
+    """
+    Write pickled spec to cache. Write to temporary file first so concurrent runs never read a partial file.
+    """
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as f:
+        pickle.dump(spec, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp_path, path)
+
+
+###########
+# Loaders #
+###########
+
+def parse_template(file):
+    """
+    Parse all sheets of template .xlsx file in a single pass. Exclude one-row header.
+    """
+    sheets = pd.read_excel(file, sheet_name=list(SHEET_NAMES.values()), header=1)
+    return {attr: sheets[name] for attr, name in SHEET_NAMES.items()}
+
+
+def write_template(spec, file):
+    """
+    Write problem spec to template .xlsx file with the one-row instruction header of each sheet, so the file can be read by load_problem_spec and edited like the template.
+    """
+    with pd.ExcelWriter(file, engine="openpyxl") as writer:
+        for attr, sheet_name in SHEET_NAMES.items():
+            getattr(spec, attr).to_excel(writer, sheet_name=sheet_name, startrow=1, index=False)
+            writer.sheets[sheet_name].cell(row=1, column=1, value=SHEET_INSTRUCTIONS[sheet_name])
+
+
+def template_sheets(sheets):
+    """
+    Map dict of {sheet name: DataFrame} to ProblemSpec attributes. Missing constraint sheets get no rows. Raise ValueError for a missing Person Setup or Grouping Setup sheet or an unknown sheet.
+    """
+    unknown = [name for name in sheets if name not in SHEET_COLUMNS]
+    if unknown:
+        raise ValueError(f"Unknown sheet(s) {unknown}, expected sheets {list(SHEET_COLUMNS)} or files {list(SHEET_FILES.values())}")
+    missing = [name for name in REQUIRED_SHEETS if name not in sheets]
+    if missing:
+        raise ValueError(f"Missing sheet(s) {missing}")
+    frames = {}
+    for attr, name in SHEET_NAMES.items():
+        df = sheets.get(name, pd.DataFrame(columns=SHEET_COLUMNS[name]))
+        # JSON sheet without rows has no columns either
+        frames[attr] = df if len(df.columns) or len(df) else pd.DataFrame(columns=SHEET_COLUMNS[name])
+    return frames
+
+
+def parse_sheet_files(path, extension, read):
+    """
+    Parse a directory with one file per sheet named after the sheet (see SHEET_FILES) with reader read. Files have a header row only, no instruction row.
+    """
+    sheets = {}
+    for name, stem in SHEET_FILES.items():
+        file = os.path.join(path, stem + extension)
+        if os.path.exists(file):
+            sheets[name] = read(file)
+    return template_sheets(sheets)
+
+
+def parse_csv_dir(path):
+    """
+    Parse directory of CSV files, one per sheet (e.g. "person_setup.csv", "constraint_with.csv").
+    """
+    return parse_sheet_files(path, ".csv", pd.read_csv)
+
+
+def write_csv_dir(spec, path):
+    """
+    Write spec to directory of CSV files, one per sheet, that parse_csv_dir reads back.
+    """
+    os.makedirs(path, exist_ok=True)
+    for attr, name in SHEET_NAMES.items():
+        getattr(spec, attr).to_csv(os.path.join(path, SHEET_FILES[name] + ".csv"), index=False)
+
+
+def parse_parquet_dir(path):
+    """
+    Parse directory of Parquet files, one per sheet (e.g. "person_setup.parquet"). Requires pyarrow or fastparquet.
+    """
+    return parse_sheet_files(path, ".parquet", pd.read_parquet)
+
+
+def write_parquet_dir(spec, path):
+    """
+    Write spec to directory of Parquet files, one per sheet, that parse_parquet_dir reads back. Requires pyarrow or fastparquet.
+    """
+    os.makedirs(path, exist_ok=True)
+    for attr, name in SHEET_NAMES.items():
+        # object columns of With sheets mix names and missing values
+        df = getattr(spec, attr)
+        df.astype({column: "string" for column in df.columns if df[column].dtype == object}).to_parquet(
+            os.path.join(path, SHEET_FILES[name] + ".parquet"), index=False)
+
+
+def parse_json(file):
+    """
+    Parse JSON document with one key per sheet (sheet name or file stem, e.g. "Person Setup" or "person_setup") and a list of row records, or a dict of column lists, as value.
+    """
+    with open(file) as f:
+        document = json.load(f)
+    sheet_names = {stem: name for name, stem in SHEET_FILES.items()}
+    return template_sheets({sheet_names.get(key, key): pd.DataFrame(rows) for key, rows in document.items()})
+
+
+def write_json(spec, file):
+    """
+    Write spec to JSON document with one key per sheet name and a list of row records as value, that parse_json reads back.
+    """
+    sheets = [f"{json.dumps(name)}: {getattr(spec, attr).to_json(orient='records')}" for attr, name in SHEET_NAMES.items()]
+    with open(file, "w") as f:
+        f.write("{" + ", ".join(sheets) + "}")
+
+
+# input format --> (parse function, write function)
+LOADERS = {
+    "xlsx": (parse_template, write_template),
+    "csv": (parse_csv_dir, write_csv_dir),
+    "parquet": (parse_parquet_dir, write_parquet_dir),
+    "json": (parse_json, write_json),
+}
+
+
+def spec_format(path):
+    """
+    Detect input format of template path: .xlsx file, .json file, or directory of .csv or .parquet sheet files.
+    """
+    if os.path.isdir(path):
+        extensions = {os.path.splitext(name)[1] for name in os.listdir(path)
+                      if os.path.splitext(name)[0] in SHEET_FILES.values()}
+        for extension in [".csv", ".parquet"]:
+            if extension in extensions:
+                return extension[1:]
+        raise ValueError(f"No sheet files {[stem + '.csv' for stem in SHEET_FILES.values()]} (or .parquet) in directory \"{path}\"")
+    extension = os.path.splitext(path)[1].lower().lstrip(".")
+    if extension not in ["xlsx", "json"]:
+        raise ValueError(f"Unknown input format of \"{path}\", expected .xlsx file, .json file, or directory of .csv or .parquet files")
+    return extension
+
+
+def parse_problem_spec(path, format=None):
+    """
+    Parse template path in format (detected by default, see spec_format) into dict of ProblemSpec attributes.
+    """
+    parse, _ = LOADERS[format or spec_format(path)]
+    return parse(path)
+
+
+def write_problem_spec(spec, path, format=None):
+    """
+    Write problem spec to path in format: "xlsx" or "json" file or "csv" or "parquet" directory. By default the format follows the extension of path, and a path without extension is a CSV directory.
+    """
+    if format is None:
+        extension = os.path.splitext(path)[1].lower().lstrip(".")
+        format = extension if extension in LOADERS else "csv"
+    _, write = LOADERS[format]
+    write(spec, path)
+
+
+#####################
+# Schema Validation #
+#####################
+
+def validate_problem_spec(spec):
+    """
+    Check the columns of every sheet, unique names and group ids, whole nonnegative group sizes, and that Homogenous and Maximum characteristics are Person Setup columns. Raise ValueError listing every problem. Names in constraint rows are checked when the spec is encoded.
+    """
+    problems = []
+    for attr, name in SHEET_NAMES.items():
+        missing = [column for column in SHEET_COLUMNS[name] if column not in getattr(spec, attr).columns]
+        # a With or Not With sheet with a single name column has no rows to enforce
+        if name in ["Constraint - With", "Constraint - Not With"] and missing == ["name 2"]:
+            missing = []
+        if missing:
+            problems.append(f"\"{name}\" sheet has no column(s) {missing}")
+    if problems:
+        raise ValueError("Invalid problem spec: " + "; ".join(problems))
+
+    names = spec.person_df["name"]
+    if names.isna().any():
+        problems.append(f"\"Person Setup\" rows {list(names.index[names.isna()])} have no name")
+    if names.duplicated().any():
+        problems.append(f"\"Person Setup\" repeats name(s) {list(pd.unique(names[names.duplicated()]))}")
+    group_ids = spec.group_df["group id"]
+    if group_ids.duplicated().any():
+        problems.append(f"\"Grouping Setup\" repeats group id(s) {list(pd.unique(group_ids[group_ids.duplicated()]))}")
+    sizes = pd.to_numeric(spec.group_df["size"], errors="coerce")
+    if (sizes.isna() | (sizes < 0) | (sizes % 1 != 0)).any():
+        problems.append("\"Grouping Setup\" sizes must be whole numbers of at least 0")
+    for attr in ["hom_df", "max_df"]:
+        unknown = [char for char in pd.unique(getattr(spec, attr)["characteristic"].dropna()) if char not in spec.person_df.columns]
+        if unknown:
+            problems.append(f"\"{SHEET_NAMES[attr]}\" characteristic(s) {unknown} not in \"Person Setup\" columns")
+    if problems:
+        raise ValueError("Invalid problem spec: " + "; ".join(problems))
+    return spec
+
+
+#####################
+# Load Problem Spec #
+#####################
+
+def load_problem_spec(file, cache_dir=DEFAULT_CACHE_DIR):
+    """
+    Load problem spec from template .xlsx file, .json document, or directory of .csv or .parquet sheet files (see spec_format) and validate it once. With cache_dir, reuse the spec cached for input with identical contents and skip parsing and validation entirely. Set cache_dir to None to always parse the input.
+    """
+    with phase("load"):
+        digest = hash_file(file)
+
+        if cache_dir is not None:
+            path = cache_path(digest, cache_dir)
+            spec = read_cached_spec(path)
+            if spec is not None:
+                count("spec_cache_hits")
+                spec.source = file
+                return spec
+
+        with phase("parse"):
+            spec = ProblemSpec(**parse_problem_spec(file), source=file, digest=digest)
+        with phase("validate"):
+            validate_problem_spec(spec)
+
+        if cache_dir is not None:
+            try:
+                write_cached_spec(spec, path)
+            except OSError:
+                # cache is an optimization only, e.g. read-only directory
+                pass
+
+    return spec
+
+
+def as_problem_spec(file_or_spec, cache_dir=DEFAULT_CACHE_DIR):
+    """
+    Return problem spec unchanged or load it from template filename (see load_problem_spec).
+    """
+    if isinstance(file_or_spec, ProblemSpec):
+        return file_or_spec
+    return load_problem_spec(file_or_spec, cache_dir=cache_dir)
@@ -0,0 +1,147 @@
+import contextlib
+import json
+import sys
+import time
+
+try:
+    import resource
+except ImportError:
+    # not available on Windows
+    resource = None
+
+
+# profiler collecting phase timers and counters, None while profiling is off
+_profiler = None
+
+
+####################
+# Helper Functions #
+####################
+
+def peak_memory_mb(children=False):
+    """
+    Peak resident memory of this process in MB, or with children of its largest finished child process (e.g. the CBC solver). None where the resource module is not available.
+    """
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_CHILDREN if children else resource.RUSAGE_SELF).ru_maxrss
+    # bytes on macOS, kilobytes elsewhere
+    return peak / (1 << 20) if sys.platform == "darwin" else peak / (1 << 10)
+
+
+############
+# Profiler #
+############
+
+class Profiler(object):
+    """
+    Wall time and number of calls per phase and named counters. Nested phases are recorded under "parent/child" names, so "build/with" is the With constraint part of "build".
+    """
+
+    def __init__(self):
+        self.phases = {}
+        self.counters = {}
+        self.stack = []
+
+    def __repr__(self):
+        return f"Profiler(phases={len(self.phases)}, counters={len(self.counters)})"
+
+    def full_name(self, name):
+        return "/".join(self.stack + [name])
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        full_name = self.full_name(name)
+        self.stack.append(name)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stack.pop()
+            self.record(full_name, time.perf_counter() - start, nested=False)
+
+    def record(self, name, seconds, nested=True):
+        """
+        Add time measured elsewhere (e.g. from a solver log) to phase name, under the current phase if nested.
+        """
+        name = self.full_name(name) if nested else name
+        calls, total = self.phases.get(name, (0, 0.0))
+        self.phases[name] = (calls + 1, total + seconds)
+
+    def count(self, name, value=1):
+        self.counters[name] = self.counters.get(name, 0) + value
+
+    def snapshot(self):
+        """
+        Create JSON-serializable dict of phases, counters, and peak memory so far.
+        """
+        return {
+            "phases": {name: {"calls": calls, "seconds": round(seconds, 6)} for name, (calls, seconds) in self.phases.items()},
+            "counters": dict(self.counters),
+            "peak_memory_mb": peak_memory_mb(),
+        }
+
+    def reset(self):
+        """
+        Clear phases and counters, e.g. between solutions.
+        """
+        self.phases = {}
+        self.counters = {}
+
+
+#######################
+# Profiling Functions #
+#######################
+
+def enable_profiling():
+    """
+    Start collecting phase timers and counters in a new profiler. Return the profiler.
+    """
+    global _profiler
+    _profiler = Profiler()
+    return _profiler
+
+
+def disable_profiling():
+    global _profiler
+    _profiler = None
+
+
+def get_profiler():
+    return _profiler
+
+
+@contextlib.contextmanager
+def phase(name):
+    """
+    Time the enclosed block as phase name while profiling is on. Does nothing otherwise.
+    """
+    if _profiler is None:
+        yield
+    else:
+        with _profiler.phase(name):
+            yield
+
+
+def record(name, seconds):
+    """
+    Add time measured elsewhere to phase name under the current phase while profiling is on.
+    """
+    if _profiler is not None:
+        _profiler.record(name, seconds)
+
+
+def count(name, value=1):
+    """
+    Add value to counter name while profiling is on.
+    """
+    if _profiler is not None:
+        _profiler.count(name, value)
+
+
+def write_trace(filename, trace):
+    """
+    Write profile trace dict to JSON file.
+    """
+    with open(filename, "w") as f:
+        json.dump(trace, f, indent=2, default=str)
@@ -0,0 +1,436 @@
+import collections
+import concurrent.futures
+import http.server
+import json
+import os
+import threading
+import time
+import urllib.error
+import urllib.request
+
+
+# local connections only by default, the service reads any file path it is sent
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+
+# parsed specs and built models kept in memory, least recently used are evicted
+SPEC_CACHE_SIZE = 16
+MODEL_CACHE_SIZE = 4
+
+# requests waiting for a worker thread, more are refused with 503 until the queue drains
+DEFAULT_MAX_QUEUE = 16
+
+# latest latencies per endpoint used for the metrics percentiles
+LATENCY_WINDOW = 1000
+
+# request keys passed to batch.make_session as solver options
+SOLVER_OPTIONS = ["backend", "threads", "gap", "seed"]
+
+
+class ServiceError(Exception):
+    """
+    Request refused by the service (queue full) or failed, with the message of the service.
+    """
+
+
+####################
+# Helper Functions #
+####################
+
+def file_key(filename):
+    """
+    Cache key of input file or directory from its absolute path, modification time, and size, so an edited file is parsed again.
+    """
+    stat = os.stat(filename)
+    return (os.path.abspath(filename), stat.st_mtime_ns, stat.st_size)
+
+
+def percentile(values, q):
+    """
+    q-th percentile (0 to 100) of list of values by nearest rank. None for no values.
+    """
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(int(len(values) * q / 100), len(values) - 1)]
+
+
+def solution_record(solution_df):
+    """
+    Dict with lists of names and groups of solution DataFrame, as sent in requests and responses.
+    """
+    return {"name": solution_df["name"].tolist(), "group": solution_df["group"].tolist()}
+
+
+#############
+# LRU Cache #
+#############
+
+class LRUCache(object):
+    """
+    Thread-safe dict of at most maxsize items that evicts the least recently used item, with hit, miss, and eviction counts for the service metrics.
+    """
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self.items = collections.OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self.items)
+
+    def get(self, key):
+        """
+        Return item of key and mark it as used, or None if missing.
+        """
+        with self.lock:
+            if key not in self.items:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.items.move_to_end(key)
+            return self.items[key]
+
+    def pop(self, key):
+        """
+        Remove and return item of key, or None if missing. Used to check out an item no other request may use at the same time.
+        """
+        with self.lock:
+            if key not in self.items:
+                self.misses += 1
+                return None
+            self.hits += 1
+            return self.items.pop(key)
+
+    def put(self, key, value):
+        """
+        Add or replace item of key and evict the least recently used items above maxsize.
+        """
+        with self.lock:
+            self.items[key] = value
+            self.items.move_to_end(key)
+            while len(self.items) > self.maxsize:
+                self.items.popitem(last=False)
+                self.evictions += 1
+
+    def stats(self):
+        """
+        Dict of size, maxsize, hits, misses, and evictions.
+        """
+        with self.lock:
+            return {"size": len(self.items), "maxsize": self.maxsize, "hits": self.hits, "misses": self.misses,
+                    "evictions": self.evictions}
+
+
+#####################
+# Request Functions #
+#####################
+
+def solve_request(service, request):
+    """
+    Solve request with filename and optional num_solutions (default 1), engine (default "pulp"), time_limit (seconds per solve), and solver options. Return dict with status ("Optimal", "Feasible" when a solution was not proven optimal within the time limit, "Partial" when fewer solutions were found, or the status of the failed solve), solutions as dicts of names and groups, solve stats of each solution, and infeasible constraint conflicts found before solving.
+    """
+    from src.assign_groups import solved_status
+    from src.infeasibility import find_infeasibilities
+    from src.streaming import solve_solutions
+
+    spec = service.spec(request["filename"])
+    num_solutions = int(request.get("num_solutions", 1))
+    conflicts = find_infeasibilities(spec)
+    if conflicts:
+        return {"status": "Infeasible", "solutions": [], "stats": [], "conflicts": conflicts}
+
+    options = {option: request[option] for option in SOLVER_OPTIONS if request.get(option) is not None}
+    key, session = service.checkout_session(request["filename"], spec, request.get("engine", "pulp"), request.get("time_limit"), options)
+    solutions, stats = [], []
+    for solution_df, solve_stats in solve_solutions(session, num_solutions):
+        solutions.append(solution_record(solution_df))
+        stats.append(solve_stats)
+    if len(solutions) == num_solutions:
+        status = solved_status([solve_stats["status"] for solve_stats in stats])
+    else:
+        status = "Partial" if solutions else session.last_stats["status"]
+        stats.append(session.last_stats)
+    service.checkin_session(key, session)
+    return {"status": status, "solutions": solutions, "stats": stats, "conflicts": []}
+
+
+def verify_request(service, request):
+    """
+    Verify request with filename and solutions as dicts of names and groups, or groups_filename of a file written by a solution writer. Return dict with pass/fail report (one record per solution and constraint row), summary per solution and constraint, and number of failed rows.
+    """
+    import pandas as pd
+
+    from src.streaming import read_solutions
+    from src.verify import summarize_report, verify_solutions
+
+    spec = service.spec(request["filename"])
+    if request.get("groups_filename"):
+        solutions = read_solutions(request["groups_filename"])
+    else:
+        solutions = [pd.DataFrame(solution) for solution in request["solutions"]]
+    report = verify_solutions(spec, solutions)
+    summary = summarize_report(report)
+    return {"report": report.to_dict("records"), "summary": summary.to_dict("records"), "failed": int(summary["failed"].sum())}
+
+
+def diff_request(service, request):
+    """
+    Diff request with old_filename and new_filename. Return dict with the changes, names and group ids they refer to, and whether they affect every group (see incremental.diff_problem_specs).
+    """
+    from src.incremental import diff_problem_specs
+
+    diff = diff_problem_specs(service.spec(request["old_filename"]), service.spec(request["new_filename"]))
+    return {"changes": diff["changes"], "names": sorted(diff["names"]), "groups": sorted(diff["groups"]), "global": diff["global"]}
+
+
+# endpoint path --> request function
+ENDPOINTS = {"/solve": solve_request, "/verify": verify_request, "/diff": diff_request}
+
+
+###########
+# Service #
+###########
+
+class GroupingService(object):
+    """
+    Long-lived solver that keeps parsed specs and built models in memory between requests, so a request only pays for the solve. Requests run in a pool of worker threads (CBC runs in its own process, so pulp solves run side by side) behind a queue of at most max_queue waiting requests. A built model is checked out by one request at a time and reset (see SolverSession.reset) before the next request uses it.
+
+    Example:
+
+        service = GroupingService(workers=4)
+        response = service.submit("/solve", {"filename": "data/data_template.xlsx", "num_solutions": 3}).result()
+    """
+
+    def __init__(self, workers=None, max_queue=DEFAULT_MAX_QUEUE, spec_cache_size=SPEC_CACHE_SIZE, model_cache_size=MODEL_CACHE_SIZE):
+        self.workers = workers or os.cpu_count() or 1
+        self.max_queue = max_queue
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=self.workers)
+        self.specs = LRUCache(spec_cache_size)
+        self.models = LRUCache(model_cache_size)
+        self.lock = threading.Lock()
+        self.queued = 0
+        self.active = 0
+        self.rejected = 0
+        self.requests = collections.Counter()
+        self.errors = collections.Counter()
+        self.latencies = collections.defaultdict(lambda: collections.deque(maxlen=LATENCY_WINDOW))
+        self.waits = collections.defaultdict(lambda: collections.deque(maxlen=LATENCY_WINDOW))
+        self.start_time = time.time()
+
+    def spec(self, filename):
+        """
+        Parsed problem spec of input file from the spec cache, loaded again after the file changes.
+        """
+        from src.problem_spec import load_problem_spec
+
+        key = file_key(filename)
+        spec = self.specs.get(key)
+        if spec is None:
+            spec = load_problem_spec(filename)
+            self.specs.put(key, spec)
+        return spec
+
+    def checkout_session(self, filename, spec, engine, time_limit, options):
+        """
+        Take elastic session of engine for spec out of the model cache, or build it (see batch.make_session) if no other request left one there. Return model key and session.
+        """
+        from src.batch import ENGINES, make_session
+
+        if engine not in ENGINES:
+            raise ValueError(f"Unknown engine \"{engine}\", use one of {ENGINES}")
+        key = (file_key(filename), engine, time_limit, tuple(sorted(options.items())))
+        session = self.models.pop(key)
+        if session is None:
+            session = make_session(spec, engine, time_limit, options)
+        return key, session
+
+    def checkin_session(self, key, session):
+        """
+        Reset session and put it back into the model cache for the next request.
+        """
+        session.reset()
+        self.models.put(key, session)
+
+    def submit(self, endpoint, request):
+        """
+        Queue request for endpoint (see ENDPOINTS). Return Future of the response dict. Raise ServiceError when max_queue requests are already waiting.
+        """
+        func = ENDPOINTS[endpoint]
+        with self.lock:
+            if self.queued >= self.max_queue:
+                self.rejected += 1
+                raise ServiceError(f"Queue full ({self.queued} requests waiting), try again later")
+            self.queued += 1
+        return self.executor.submit(self.run, endpoint, func, request, time.perf_counter())
+
+    def run(self, endpoint, func, request, submit_time):
+        """
+        Run request function in a worker thread and record queue wait and latency.
+        """
+        start = time.perf_counter()
+        with self.lock:
+            self.queued -= 1
+            self.active += 1
+        try:
+            return func(self, request)
+        except Exception:
+            with self.lock:
+                self.errors[endpoint] += 1
+            raise
+        finally:
+            with self.lock:
+                self.active -= 1
+                self.requests[endpoint] += 1
+                self.waits[endpoint].append(start - submit_time)
+                self.latencies[endpoint].append(time.perf_counter() - submit_time)
+
+    def metrics(self):
+        """
+        Dict of queue depth, active requests, refused requests, request count, error count, and queue wait and latency (mean, median, 95th percentile, and maximum in seconds over the latest LATENCY_WINDOW requests) per endpoint, and spec and model cache stats.
+        """
+        with self.lock:
+            endpoints = {}
+            for endpoint in sorted(self.requests):
+                latencies, waits = list(self.latencies[endpoint]), list(self.waits[endpoint])
+                endpoints[endpoint] = {
+                    "requests": self.requests[endpoint],
+                    "errors": self.errors[endpoint],
+                    "wait_mean": sum(waits) / len(waits),
+                    "latency_mean": sum(latencies) / len(latencies),
+                    "latency_p50": percentile(latencies, 50),
+                    "latency_p95": percentile(latencies, 95),
+                    "latency_max": max(latencies),
+                }
+            return {"uptime": time.time() - self.start_time, "workers": self.workers, "queue_depth": self.queued,
+                    "max_queue": self.max_queue, "active": self.active, "rejected": self.rejected, "endpoints": endpoints,
+                    "spec_cache": self.specs.stats(), "model_cache": self.models.stats()}
+
+    def close(self):
+        """
+        Wait for the requests in the queue and stop the worker threads.
+        """
+        self.executor.shutdown(wait=True)
+
+
+###############
+# HTTP Server #
+###############
+
+class ServiceRequestHandler(http.server.BaseHTTPRequestHandler):
+    """
+    JSON over HTTP: GET /health and /metrics, POST a JSON request to /solve, /verify, or /diff. Errors are returned as {"error": message} with status 400 for bad requests, 503 for a full queue, and 500 otherwise.
+    """
+
+    def send_json(self, code, response):
+        from src.streaming import json_value
+
+        body = json.dumps(response, default=json_value).encode()
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path == "/health":
+            self.send_json(200, {"status": "ok"})
+        elif self.path == "/metrics":
+            self.send_json(200, self.server.service.metrics())
+        else:
+            self.send_json(404, {"error": f"Unknown path {self.path}"})
+
+    def do_POST(self):
+        if self.path not in ENDPOINTS:
+            self.send_json(404, {"error": f"Unknown path {self.path}"})
+            return
+        try:
+            request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+            response = self.server.service.submit(self.path, request).result()
+        except ServiceError as e:
+            self.send_json(503, {"error": str(e)})
+        except (KeyError, ValueError, TypeError, OSError) as e:
+            # missing request key, bad value, or unreadable input file
+            self.send_json(400, {"error": f"{type(e).__name__}: {e}"})
+        except Exception as e:
+            self.send_json(500, {"error": f"{type(e).__name__}: {e}"})
+        else:
+            self.send_json(200, response)
+
+
+def make_server(service, host=DEFAULT_HOST, port=DEFAULT_PORT):
+    """
+    Create threading HTTP server for service. Each connection gets a thread that waits for its request in the service queue. Call serve_forever to start.
+    """
+    server = http.server.ThreadingHTTPServer((host, port), ServiceRequestHandler)
+    server.service = service
+    return server
+
+
+##########
+# Client #
+##########
+
+class ServiceClient(object):
+    """
+    Client for a running service with the Python standard library only, so a front end or script starts without importing pandas or PuLP. Filenames are sent as absolute paths, so client and service must share the file system.
+
+    Example:
+
+        client = ServiceClient()
+        response = client.solve("data/data_template.xlsx", num_solutions=3, engine="sparse")
+        solution_df = pd.DataFrame(response["solutions"][0])
+    """
+
+    def __init__(self, url=f"http://{DEFAULT_HOST}:{DEFAULT_PORT}", timeout=None):
+        self.url = url.rstrip("/")
+        self.timeout = timeout
+
+    def request(self, path, payload=None):
+        """
+        Send GET (without payload) or POST request with JSON payload and return the JSON response. Raise ServiceError with the message of the service for an error response.
+        """
+        data = json.dumps(payload).encode() if payload is not None else None
+        request = urllib.request.Request(self.url + path, data=data, headers={"Content-Type": "application/json"})
+        try:
+            with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                return json.loads(response.read())
+        except urllib.error.HTTPError as e:
+            try:
+                message = json.loads(e.read())["error"]
+            except (ValueError, KeyError):
+                message = str(e)
+            raise ServiceError(message) from None
+
+    def health(self):
+        return self.request("/health")
+
+    def metrics(self):
+        return self.request("/metrics")
+
+    def solve(self, filename, num_solutions=1, engine="pulp", time_limit=None, **options):
+        """
+        Solve input file for num_solutions solutions. Solver options backend, threads, gap, and seed as in run_program.py. See solve_request for the response.
+        """
+        return self.request("/solve", {"filename": os.path.abspath(filename), "num_solutions": num_solutions, "engine": engine,
+                                       "time_limit": time_limit, **options})
+
+    def verify(self, filename, solutions=None, groups_filename=None):
+        """
+        Verify list of solution DataFrames (or dicts of names and groups), or the solutions in groups_filename, against input file. See verify_request for the response.
+        """
+        payload = {"filename": os.path.abspath(filename)}
+        if groups_filename is not None:
+            payload["groups_filename"] = os.path.abspath(groups_filename)
+        else:
+            payload["solutions"] = [solution_record(solution) if hasattr(solution, "columns") else solution for solution in solutions]
+        return self.request("/verify", payload)
+
+    def diff(self, old_filename, new_filename):
+        """
+        Compare two versions of an input file. See diff_request for the response.
+        """
+        return self.request("/diff", {"old_filename": os.path.abspath(old_filename), "new_filename": os.path.abspath(new_filename)})
@@ -0,0 +1,131 @@
+import time
+
+import numpy as np
+import pulp
+
+from src.assign_groups import (add_pair_history_constraint, add_solution_cut, build_lp_problem, make_solver, set_slack_penalty,
+                               slack_penalty, solve_lp_problem)
+from src.encoding import encode_problem_spec
+from src.problem_spec import as_problem_spec
+from src.symmetry import interchangeable_groups
+
+
+##################
+# Solver Session #
+##################
+
+class SolverSession(object):
+    """
+    Persistent LP problem for collecting multiple solutions. Build the base model once, append one uniqueness cut per collected solution, and warm start each solve from the previous assignment. Solver options as in make_solver. Stats of the latest solve are in last_stats.
+
+    With a PairHistory in pair_history, penalize repeated partners instead: each collected solution is added to the history and only updates the repeat partner rows, so the model does not grow with the number of solutions.
+
+    Example:
+
+        session = SolverSession(spec, elastic=False)
+        status, solution_df = session.solve()
+        session.add_solution(solution_df)
+        status, solution_df = session.solve()
+        ...
+    """
+
+    # no presolve with PuLP, same interface as SparseSession
+    presolve_stats = None
+
+    def __init__(self, spec, elastic, unique_solutions=None, msg=True, symmetry_breaking=False,
+                 backend="cbc", threads=None, time_limit=None, gap=None, seed=None, pair_history=None):
+        start = time.perf_counter()
+        self.spec = as_problem_spec(spec)
+        self.elastic = elastic
+        self.msg = msg
+        self.solver_options = {"backend": backend, "threads": threads, "time_limit": time_limit, "gap": gap, "seed": seed}
+        self.prob, self.d_vars = build_lp_problem(self.spec, elastic, symmetry_breaking)
+        self.build_time = time.perf_counter() - start
+        self.initial_objective = self.prob.objective.copy()
+        self.last_stats = None
+        self.group_classes = interchangeable_groups(encode_problem_spec(self.spec)) if symmetry_breaking else []
+        self.num_cuts = 0
+        self.last_solution_df = None
+        self.base_objective = None
+        self.pair_history = pair_history
+        self.repeat_vars = None
+        self.pair_weight = 0
+        if pair_history is not None:
+            self.update_pair_history()
+        for solution_df in unique_solutions or []:
+            self.add_solution(solution_df)
+
+    def add_solution(self, solution_df):
+        """
+        Append uniqueness cut for solution (or add solution to pair history) and use solution as warm start for the next solve.
+        """
+        self.last_solution_df = solution_df
+        if self.pair_history is not None:
+            self.pair_history.update(solution_df)
+            self.update_pair_history()
+            return
+        self.prob = add_solution_cut(self.prob, self.d_vars, solution_df, self.num_cuts)
+        self.num_cuts += 1
+        if self.elastic:
+            self.prob = set_slack_penalty(self.prob, slack_penalty(len(self.spec.names), self.num_cuts, self.pair_weight))
+
+    def reset(self):
+        """
+        Remove the uniqueness cuts of all collected solutions, so the session solves the model as built again without building it again (e.g. a model kept by service.ModelCache for the next request).
+        """
+        if self.pair_history is not None:
+            raise ValueError("Session with pair history cannot be reset")
+        for idx in range(self.num_cuts):
+            del self.prob.constraints[f"Unique_Solution_{idx}"]
+        # a copy registers only the variables of the remaining rows, without the repeat variables of the cuts
+        self.prob = self.prob.copy()
+        self.prob.objective = self.initial_objective.copy()
+        self.num_cuts = 0
+        self.last_solution_df = None
+        self.base_objective = None
+        self.last_stats = None
+
+    def update_pair_history(self):
+        """
+        Rebuild the repeat partner rows from the pair history.
+        """
+        known = set(self.repeat_vars or {})
+        self.prob, self.repeat_vars, self.pair_weight = add_pair_history_constraint(
+            self.prob, self.d_vars, self.spec, self.pair_history, self.repeat_vars)
+        if self.base_objective is not None:
+            self.base_objective += pulp.lpSum(var for key, var in self.repeat_vars.items() if key not in known)
+        if self.elastic:
+            self.prob = set_slack_penalty(self.prob, slack_penalty(len(self.spec.names), self.num_cuts, self.pair_weight))
+
+    def randomize_objective(self, seed):
+        """
+        Replace the decision variable objective coefficients with random weights in [0, 1) so independent solves find different solutions. The random weights add up to less than one repeat per name, so the slack penalty counts them as one more solution to stay lexicographic.
+        """
+        if self.base_objective is None:
+            self.base_objective = self.prob.objective.copy()
+        rng = np.random.default_rng(seed)
+        weights = rng.random(len(self.d_vars))
+        self.prob.objective = self.base_objective + pulp.lpSum(weight * d_var for weight, d_var in zip(weights, self.d_vars.values()))
+        if self.elastic:
+            self.prob = set_slack_penalty(self.prob, slack_penalty(len(self.spec.names), self.num_cuts + 1, self.pair_weight))
+
+    def warm_start(self, solution_df):
+        """
+        Set initial decision variable values to the (name, group) assignments in solution_df.
+        """
+        labels = self.d_vars.encoded.encode_solution(solution_df)
+        assigned = labels[self.d_vars.name_idx] == self.d_vars.group_idx
+        for d_var, value in zip(self.d_vars.values(), assigned.tolist()):
+            d_var.setInitialValue(1 if value else 0)
+
+    def solve(self):
+        """
+        Solve the LP problem with all cuts added so far. Return status and solution DataFrame with names and assigned groups.
+        """
+        warm_start = self.last_solution_df is not None and self.solver_options["backend"] != "glpk"
+        if warm_start:
+            self.warm_start(self.last_solution_df)
+        solver = make_solver(msg=self.msg, warm_start=warm_start, **self.solver_options)
+        status, solution_df, self.last_stats = solve_lp_problem(self.prob, self.d_vars, solver, return_stats=True)
+        self.last_stats["build_time"] = self.build_time
+        return status, solution_df
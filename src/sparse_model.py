@@ -0,0 +1,462 @@
+import time
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+from scipy.optimize import Bounds, LinearConstraint, milp
+
+from src.assign_groups import slack_penalty
+from src.encoding import encode_problem_spec
+from src.model_cache import cached_model, model_key
+from src.profiling import count, phase
+from src.symmetry import group_classes, spec_group_signatures, symmetry_breaking_rows
+
+
+# scipy.optimize.milp status --> PuLP status string
+MILP_STATUS = {
+    0: "Optimal",
+    1: "Not Solved",
+    2: "Infeasible",
+    3: "Unbounded",
+    4: "Undefined",
+}
+
+
+####################
+# Helper Functions #
+####################
+
+def var_idx(name_idx, group_idx, n_groups):
+    """
+    Column index of (name, group) decision variable. Columns ordered by name then group like the PuLP decision variables.
+    """
+    return name_idx * n_groups + group_idx
+
+
+class RowBlocks(object):
+    """
+    Collect constraint rows as COO triplets and stack them into one sparse matrix.
+    """
+
+    def __init__(self, n_cols):
+        self.n_cols = n_cols
+        self.n_rows = 0
+        self.rows = []
+        self.cols = []
+        self.vals = []
+        self.lb = []
+        self.ub = []
+
+    def add(self, rows, cols, vals, lb, ub, n_rows, name=None):
+        """
+        Add block of n_rows rows where rows are local to the block (0 to n_rows - 1). While profiling, count the rows under the constraint family name.
+        """
+        if name is not None:
+            count(f"rows/{name}", n_rows)
+        self.rows.append(np.asarray(rows, dtype=np.int64) + self.n_rows)
+        self.cols.append(np.asarray(cols, dtype=np.int64))
+        self.vals.append(np.broadcast_to(np.asarray(vals, dtype=float), np.shape(rows)))
+        self.lb.append(np.broadcast_to(np.asarray(lb, dtype=float), (n_rows,)))
+        self.ub.append(np.broadcast_to(np.asarray(ub, dtype=float), (n_rows,)))
+        self.n_rows += n_rows
+
+    def to_csr(self):
+        if not self.rows:
+            return sparse.csr_matrix((0, self.n_cols)), np.zeros(0), np.zeros(0)
+        A = sparse.coo_matrix((np.concatenate(self.vals), (np.concatenate(self.rows), np.concatenate(self.cols))),
+                              shape=(self.n_rows, self.n_cols)).tocsr()
+        return A, np.concatenate(self.lb), np.concatenate(self.ub)
+
+
+################
+# Sparse Model #
+################
+
+class SparseModel(object):
+    """
+    MILP in matrix form: minimize c @ x subject to row_lb <= A @ x <= row_ub and var_lb <= x <= var_ub. The first n_names * n_groups columns are the binary (name, group) decision variables and any remaining columns are continuous slack variables.
+    """
+
+    # constant part of the objective left out of c, e.g. repeats of names fixed by presolve (class attribute, so models cached without it load)
+    objective_offset = 0.0
+
+    def __init__(self, encoded, c, A, row_lb, row_ub, var_lb, var_ub, integrality):
+        self.encoded = encoded
+        self.c = c
+        self.A = A
+        self.row_lb = row_lb
+        self.row_ub = row_ub
+        self.var_lb = var_lb
+        self.var_ub = var_ub
+        self.integrality = integrality
+        # reason the problem is known to be infeasible without solving
+        self.infeasible = None
+        # classes of interchangeable groups ordered by symmetry breaking rows
+        self.group_classes = []
+        # elastic maximum characteristic slack columns
+        self.slack_cols = np.zeros(0, dtype=np.int64)
+        # repeat partner columns of the pair history penalty and matrices without them
+        self.pair_cols = np.zeros(0, dtype=np.int64)
+        self.base_matrices = None
+
+    @property
+    def n_x(self):
+        return self.encoded.n_names * self.encoded.n_groups
+
+    @property
+    def num_variables(self):
+        return self.A.shape[1]
+
+    @property
+    def num_rows(self):
+        return self.A.shape[0]
+
+    def __repr__(self):
+        return f"{type(self).__name__}(rows={self.num_rows}, cols={self.num_variables}, nnz={self.A.nnz})"
+
+    def labels_from_x(self, x):
+        """
+        Create array of group indices with one entry per name from solved column values.
+        """
+        encoded = self.encoded
+        assigned = x[:self.n_x].reshape(encoded.n_names, encoded.n_groups) > 0.5
+        name_idx, group_idx = np.nonzero(assigned)
+        labels = np.full(encoded.n_names, -1, dtype=np.int64)
+        labels[name_idx] = group_idx
+        return labels
+
+    def x_columns(self, name_idx, group_idx):
+        """
+        Column of each (name, group) decision variable. Return array of columns (-1 for pairs without a column) and array of the fixed value of pairs without a column.
+        """
+        return var_idx(name_idx, group_idx, self.encoded.n_groups), np.zeros(len(name_idx))
+
+    def add_solution_penalty(self, labels):
+        """
+        Add one to the objective coefficient of each (name, group) assignment in array of group indices.
+        """
+        assigned = np.flatnonzero(labels >= 0)
+        self.c[var_idx(assigned, labels[assigned], self.encoded.n_groups)] += 1
+
+    def set_slack_penalty(self, penalty):
+        """
+        Set objective coefficient of every elastic maximum characteristic slack column.
+        """
+        self.c[self.slack_cols] = penalty
+
+    def set_pair_penalty(self, rows):
+        """
+        Replace the repeat partner columns and rows with PairPenaltyRows rows. Repeat partner columns come after all other columns with one objective point per repeat.
+        """
+        if self.base_matrices is None:
+            self.base_matrices = (self.A, self.row_lb, self.row_ub, self.var_lb, self.var_ub, self.integrality)
+        A, row_lb, row_ub, var_lb, var_ub, integrality = self.base_matrices
+        n_cols = A.shape[1]
+        G = self.encoded.n_groups
+        groups = np.arange(G)
+        n_repeat = rows.num_rows
+        own_rows = np.arange(n_repeat)
+
+        # partner entries sum_j count[i, j] * x[j, g] and own entry big_m[k, g] * x[i, g] of row (k, g)
+        entry_rows = (rows.entry_k[:, None] * G + groups).ravel()
+        row_idx = np.concatenate([entry_rows, own_rows])
+        name_idx = np.concatenate([np.repeat(rows.entry_j, G), np.repeat(rows.partner_names, G)])
+        group_idx = np.concatenate([np.tile(groups, len(rows.entry_j)), np.tile(groups, len(rows.partner_names))])
+        vals = np.concatenate([np.repeat(rows.entry_count, G).astype(float), rows.big_m.ravel()])
+        cols, fixed = self.x_columns(name_idx, group_idx)
+
+        # pairs without a column move to the right-hand side
+        ub = rows.big_m.ravel() - np.bincount(row_idx, weights=vals * fixed * (cols < 0), minlength=n_repeat)
+        has_col = cols >= 0
+        block = sparse.coo_matrix((np.concatenate([vals[has_col], -np.ones(n_repeat)]),
+                                   (np.concatenate([row_idx[has_col], own_rows]), np.concatenate([cols[has_col], n_cols + own_rows]))),
+                                  shape=(n_repeat, n_cols + n_repeat))
+
+        self.A = sparse.vstack([sparse.hstack([A, sparse.csr_matrix((A.shape[0], n_repeat))]), block]).tocsr()
+        self.row_lb = np.concatenate([row_lb, np.full(n_repeat, -np.inf)])
+        self.row_ub = np.concatenate([row_ub, ub])
+        self.var_lb = np.concatenate([var_lb, np.zeros(n_repeat)])
+        self.var_ub = np.concatenate([var_ub, np.full(n_repeat, np.inf)])
+        self.integrality = np.concatenate([integrality, np.zeros(n_repeat)])
+        self.c = np.concatenate([self.c[:n_cols], np.ones(n_repeat)])
+        self.pair_cols = n_cols + own_rows
+
+
+def build_sparse_problem(encoded, elastic, symmetry_breaking=False):
+    """
+    Build the matrix form of the LP problem from integer-encoded problem in one vectorized pass. Equivalent to the PuLP problem from build_lp_problem with a rigid or elastic maximum characteristic constraint based on elastic parameter.
+    """
+    n, G = encoded.n_names, encoded.n_groups
+    n_x = n * G
+    groups = np.arange(G)
+
+    # elastic maximum characteristic constraint adds one slack column per (max row, group)
+    n_max = len(encoded.max_limits)
+    n_slack = n_max * G if elastic else 0
+
+    # symmetry breaking adds auxiliary prefix count columns after the slack columns
+    classes = group_classes(spec_group_signatures(encoded)) if symmetry_breaking else []
+    n_aux, symmetry_block = symmetry_breaking_rows(np.repeat(np.arange(n), G), np.tile(groups, n), G, classes, n_x + n_slack)
+    n_cols = n_x + n_slack + n_aux
+
+    blocks = RowBlocks(n_cols)
+
+    # one group per name: sum_g x[n, g] == 1
+    blocks.add(np.repeat(np.arange(n), G), np.arange(n_x), 1, 1, 1, n, name="one_group_per_name")
+
+    # max names per group: sum_n x[n, g] <= size[g]
+    blocks.add(np.tile(groups, n), np.arange(n_x), 1, -np.inf, encoded.sizes, G, name="max_name_per_group")
+
+    # with: x[a, g] - x[b, g] == 0 for consecutive names (a, b) in each set
+    pairs = encoded.with_pairs()
+    if len(pairs):
+        pair_rows = np.arange(len(pairs) * G).reshape(len(pairs), G)
+        cols_a = var_idx(pairs[:, [0]], groups, G)
+        cols_b = var_idx(pairs[:, [1]], groups, G)
+        blocks.add(np.concatenate([pair_rows.ravel(), pair_rows.ravel()]),
+                   np.concatenate([cols_a.ravel(), cols_b.ravel()]),
+                   np.concatenate([np.ones(cols_a.size), -np.ones(cols_b.size)]),
+                   0, 0, len(pairs) * G, name="with")
+
+    # not with: sum_{n in set} x[n, g] <= 1 for each set and group
+    if encoded.num_not_with_sets:
+        members = encoded.not_with_members
+        set_rows = encoded.not_with_set_ids[:, None] * G + groups
+        blocks.add(set_rows.ravel(), var_idx(members[:, None], groups, G).ravel(), 1, -np.inf, 1,
+                   encoded.num_not_with_sets * G, name="not_with")
+
+    # maximum characteristic: sum_{n with char} x[n, g] (- slack[r, g]) <= maximum
+    if n_max:
+        max_row_ids, max_names = np.nonzero(encoded.max_masks)
+        rows = max_row_ids[:, None] * G + groups
+        cols = var_idx(max_names[:, None], groups, G)
+        ub = np.repeat(encoded.max_limits, G)
+        if elastic:
+            slack_rows = np.arange(n_max * G)
+            rows = np.concatenate([rows.ravel(), slack_rows])
+            vals = np.concatenate([np.ones(cols.size), -np.ones(n_slack)])
+            cols = np.concatenate([cols.ravel(), n_x + slack_rows])
+        else:
+            rows, cols, vals = rows.ravel(), cols.ravel(), 1
+        blocks.add(rows, cols, vals, -np.inf, ub, n_max * G, name="maximum")
+
+    # symmetry breaking: order interchangeable groups by lowest-indexed name
+    blocks.add(*symmetry_block, name="symmetry")
+
+    A, row_lb, row_ub = blocks.to_csr()
+    count("variables/decision", n_x)
+    count("variables/slack", n_slack)
+    count("variables/symmetry", n_aux)
+
+    # in / not in / homogenous fix decision variables through their bounds
+    var_lb = np.zeros(n_cols)
+    var_ub = np.concatenate([np.ones(n_x), np.full(n_slack + n_aux, np.inf)])
+    var_lb[var_idx(encoded.in_names, encoded.in_groups, G)] = 1
+    var_ub[var_idx(encoded.not_in_names, encoded.not_in_groups, G)] = 0
+    for group_idx, mask in zip(encoded.hom_groups, encoded.hom_masks):
+        var_ub[var_idx(np.flatnonzero(~mask), group_idx, G)] = 0
+
+    # arbitrary objective function except for elastic penalty per slack unit (see set_slack_penalty)
+    c = np.concatenate([np.zeros(n_x), np.ones(n_slack), np.zeros(n_aux)])
+    integrality = np.concatenate([np.ones(n_x), np.zeros(n_slack + n_aux)])
+
+    model = SparseModel(encoded, c, A, row_lb, row_ub, var_lb, var_ub, integrality)
+    model.group_classes = classes
+    model.slack_cols = n_x + np.arange(n_slack)
+    return model
+
+
+def add_sparse_solution_penalty(model, solution_df):
+    """
+    Penalize repeat student assignments from one earlier solution by adding one to the objective coefficient of each (name, group) assignment in the solution. Same penalty as the uniqueness cut in add_solution_cut without adding any rows.
+    """
+    model.add_solution_penalty(model.encoded.encode_solution(solution_df))
+    return model
+
+
+def milp_options(time_limit=None, gap=None):
+    """
+    Create scipy.optimize.milp options dict from time limit in seconds and relative MIP gap. scipy does not expose thread count or random seed of HiGHS.
+    """
+    options = {}
+    if time_limit is not None:
+        options["time_limit"] = time_limit
+    if gap is not None:
+        options["mip_rel_gap"] = gap
+    return options
+
+
+def solve_sparse_problem(model, options=None, return_stats=False):
+    """
+    Solve the matrix form of the LP problem in-process with scipy.optimize.milp (HiGHS). The objective in the stats includes the constant objective_offset of the model. Return status and solution DataFrame with names and assigned groups like solve_lp_problem. With return_stats, also return dict of solve stats like solve_lp_problem.
+    """
+    start = time.perf_counter()
+    stats = {"backend": "highs", "status": "Infeasible", "objective": None, "gap": None, "nodes": None,
+             "wall_time": 0.0, "build_time": None}
+    solution_df = pd.DataFrame(columns=["name", "group"])
+
+    # conflicting variable fixings (e.g. In and Not In on the same pair)
+    if model.infeasible is not None or (model.var_lb > model.var_ub).any():
+        return ("Infeasible", solution_df, stats) if return_stats else ("Infeasible", solution_df)
+
+    # every name fixed by presolve, nothing left to solve
+    if model.num_variables == 0:
+        stats.update({"status": "Optimal", "objective": model.objective_offset, "gap": 0.0, "nodes": 0, "wall_time": time.perf_counter() - start})
+        solution_df = model.encoded.decode_solution(model.labels_from_x(np.zeros(0)))
+        return ("Optimal", solution_df, stats) if return_stats else ("Optimal", solution_df)
+
+    with phase("solve"):
+        res = milp(model.c,
+                   constraints=LinearConstraint(model.A, model.row_lb, model.row_ub),
+                   integrality=model.integrality,
+                   bounds=Bounds(model.var_lb, model.var_ub),
+                   options=options)
+    status = MILP_STATUS.get(res.status, "Undefined")
+    # time limit reached with a solution that is not proven optimal
+    if res.status == 1 and res.x is not None:
+        status = "Feasible"
+
+    if res.x is not None:
+        with phase("extract"):
+            solution_df = model.encoded.decode_solution(model.labels_from_x(res.x))
+
+    stats.update({
+        "status": status,
+        "objective": res.fun + model.objective_offset if res.fun is not None else None,
+        "gap": getattr(res, "mip_gap", None),
+        "nodes": getattr(res, "mip_node_count", None),
+        "wall_time": time.perf_counter() - start,
+    })
+    if return_stats:
+        return status, solution_df, stats
+    return status, solution_df
+
+
+def build_model(encoded, elastic, presolve=True, symmetry_breaking=False):
+    """
+    Build the matrix form of the LP problem with or without presolve. Return model and presolve stats (None without presolve).
+    """
+    if not presolve:
+        with phase("build"):
+            return build_sparse_problem(encoded, elastic, symmetry_breaking), None
+
+    from src.presolve import build_presolved_problem, presolve_stats
+    from src.presolve import presolve as presolve_problem
+
+    presolved = presolve_problem(encoded)
+    with phase("build"):
+        model = build_presolved_problem(presolved, elastic, symmetry_breaking)
+    return model, presolve_stats(presolved, model, elastic, symmetry_breaking)
+
+
+def run_sparse_problem(spec, elastic, unique_solutions, presolve=True, symmetry_breaking=False, time_limit=None, gap=None,
+                       return_stats=False):
+    """
+    Setup and solve the LP problem with the sparse matrix engine. Same arguments and return value as run_lp_problem.
+    """
+    start = time.perf_counter()
+    encoded = encode_problem_spec(spec)
+    model, stats = build_model(encoded, elastic, presolve, symmetry_breaking)
+    unique_solutions = unique_solutions or []
+    for solution_df in unique_solutions:
+        model = add_sparse_solution_penalty(model, solution_df)
+    model.set_slack_penalty(slack_penalty(encoded.n_names, len(unique_solutions)))
+    build_time = time.perf_counter() - start
+    status, solution_df, stats = solve_sparse_problem(model, milp_options(time_limit, gap), return_stats=True)
+    stats["build_time"] = build_time
+    if return_stats:
+        return status, solution_df, stats
+    return status, solution_df
+
+
+##################
+# Sparse Session #
+##################
+
+class SparseSession(object):
+    """
+    Persistent sparse matrix problem for collecting multiple solutions. Same interface as SolverSession: encode, presolve, and build once, then each added solution only updates the objective vector. Threads and seed are accepted for the same interface but not supported by scipy.
+
+    With a PairHistory in pair_history, penalize repeated partners instead: each collected solution is added to the history and only replaces the repeat partner rows.
+
+    With cache_dir, the built model is cached there keyed by the spec file and the model options (see model_cache), so a later run on the same input loads the matrices instead of building them.
+    """
+
+    def __init__(self, spec, elastic, unique_solutions=None, presolve=True, symmetry_breaking=False,
+                 threads=None, time_limit=None, gap=None, seed=None, pair_history=None, cache_dir=None):
+        start = time.perf_counter()
+        self.encoded = encode_problem_spec(spec)
+        self.elastic = elastic
+        self.options = milp_options(time_limit, gap)
+        key = model_key(self.encoded.spec, {"engine": "sparse", "elastic": elastic, "presolve": presolve, "symmetry_breaking": symmetry_breaking})
+        self.model, self.presolve_stats = cached_model(
+            lambda: build_model(self.encoded, elastic, presolve, symmetry_breaking), key, cache_dir)
+        self.build_time = time.perf_counter() - start
+        self.initial_c = self.model.c.copy()
+        self.last_stats = None
+        self.group_classes = [[self.encoded.groups[g] for g in c] for c in self.model.group_classes]
+        self.num_solutions = 0
+        self.base_c = None
+        self.pair_history = pair_history
+        self.pair_weight = 0
+        if pair_history is not None:
+            self.update_pair_history()
+        for solution_df in unique_solutions or []:
+            self.add_solution(solution_df)
+
+    def add_solution(self, solution_df):
+        """
+        Penalize repeat student assignments (or repeated partners with pair history) from solution in the next solve.
+        """
+        if self.pair_history is not None:
+            self.pair_history.update(solution_df)
+            self.update_pair_history()
+            return
+        self.model = add_sparse_solution_penalty(self.model, solution_df)
+        self.num_solutions += 1
+        self.model.set_slack_penalty(slack_penalty(self.encoded.n_names, self.num_solutions, self.pair_weight))
+
+    def reset(self):
+        """
+        Remove the penalties of all collected solutions, so the session solves the model as built again. Same as SolverSession.reset.
+        """
+        if self.pair_history is not None:
+            raise ValueError("Session with pair history cannot be reset")
+        self.model.c = self.initial_c.copy()
+        self.model.objective_offset = 0.0
+        self.num_solutions = 0
+        self.base_c = None
+        self.last_stats = None
+
+    def update_pair_history(self):
+        """
+        Rebuild the repeat partner rows from the pair history.
+        """
+        from src.pair_history import pair_penalty_rows
+
+        rows = pair_penalty_rows(self.encoded, self.pair_history)
+        self.model.set_pair_penalty(rows)
+        self.pair_weight = rows.total_weight
+        if self.base_c is not None:
+            n_cols = len(self.model.c) - len(self.model.pair_cols)
+            self.base_c = np.concatenate([self.base_c[:n_cols], self.model.c[n_cols:]])
+        self.model.set_slack_penalty(slack_penalty(self.encoded.n_names, self.num_solutions, self.pair_weight))
+
+    def randomize_objective(self, seed):
+        """
+        Replace the decision variable objective coefficients with random weights in [0, 1) so independent solves find different solutions. Same as SolverSession.randomize_objective.
+        """
+        if self.base_c is None:
+            self.base_c = self.model.c.copy()
+        rng = np.random.default_rng(seed)
+        self.model.c = self.base_c.copy()
+        self.model.c[:self.model.n_x] += rng.random(self.model.n_x)
+        self.model.set_slack_penalty(slack_penalty(self.encoded.n_names, self.num_solutions + 1, self.pair_weight))
+
+    def solve(self):
+        """
+        Solve the problem with all penalties added so far. Return status and solution DataFrame with names and assigned groups.
+        """
+        status, solution_df, self.last_stats = solve_sparse_problem(self.model, self.options, return_stats=True)
+        self.last_stats["build_time"] = self.build_time
+        return status, solution_df
@@ -0,0 +1,214 @@
+import csv
+import json
+import os
+
+import pandas as pd
+
+
+# output format --> file extension
+OUTPUT_FORMATS = {"xlsx": ".xlsx", "csv": ".csv", "jsonl": ".jsonl"}
+
+
+####################
+# Helper Functions #
+####################
+
+def json_value(value):
+    """
+    Convert NumPy scalars in solve stats to Python values for json.dumps.
+    """
+    return value.item() if hasattr(value, "item") else str(value)
+
+
+def output_format(filename):
+    """
+    Output format of solutions filename from its extension.
+    """
+    extension = os.path.splitext(filename)[1].lower()
+    for format, format_extension in OUTPUT_FORMATS.items():
+        if extension == format_extension:
+            return format
+    raise ValueError(f"Unknown solutions format of \"{filename}\", expected one of {list(OUTPUT_FORMATS.values())}")
+
+
+######################
+# Solution Generator #
+######################
+
+def solve_solutions(session, num_solutions=None):
+    """
+    Yield (solution DataFrame, solve stats) for each solution of session (optimal, or feasible when a time limit stopped the solver), one after another as they are found. Each solution is added to the session only when the next one is requested, so code in the loop body sees the session (and pair history) before the solution. Stops after num_solutions solutions (None for no limit) or at the first solve without a solution; the stats of the last solve are in session.last_stats.
+
+    Example:
+
+        for solution_df, stats in solve_solutions(session, 3):
+            writer.write(solution_df, stats)
+    """
+    from src.assign_groups import SOLVED_STATUSES
+
+    num_found = 0
+    while num_solutions is None or num_found < num_solutions:
+        status, solution_df = session.solve()
+        if status not in SOLVED_STATUSES:
+            return
+        yield solution_df, dict(session.last_stats)
+        session.add_solution(solution_df)
+        num_found += 1
+
+
+def iter_solutions(spec, num_solutions=None, engine="pulp", time_limit=None, **options):
+    """
+    Build an elastic session of engine for problem spec (see batch.make_session, options backend, threads, gap, and seed) and yield (solution DataFrame, solve stats) for each optimal solution like solve_solutions.
+    """
+    from src.batch import make_session
+    from src.problem_spec import as_problem_spec
+
+    session = make_session(as_problem_spec(spec), engine, time_limit, options)
+    yield from solve_solutions(session, num_solutions)
+
+
+####################
+# Solution Writers #
+####################
+
+class SolutionWriter(object):
+    """
+    Append solutions to a file one at a time as they are found, so nothing found so far is lost when a later solve is stopped and memory does not grow with the number of solutions. Use as a context manager or call close. Writers for each format define write_solution(idx, solution_df, stats) to write one sorted solution, and close if they hold a file open.
+    """
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.num_solutions = 0
+
+    def __repr__(self):
+        return f"{type(self).__name__}(filename={self.filename!r}, solutions={self.num_solutions})"
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def write(self, solution_df, stats=None):
+        """
+        Append solution DataFrame with names and groups, sorted by group, and its solve stats.
+        """
+        self.write_solution(self.num_solutions, solution_df.sort_values("group", kind="stable"), stats)
+        self.num_solutions += 1
+
+    def close(self):
+        pass
+
+
+class XlsxSolutionWriter(SolutionWriter):
+    """
+    Write each solution to its own "Solution_<idx>" sheet of a write-only openpyxl workbook, which streams rows to temporary files instead of keeping them in memory. The .xlsx file is a zip archive that is only complete after close, so use CSV or JSON lines output to keep solutions when the program is killed.
+    """
+
+    def __init__(self, filename):
+        from openpyxl import Workbook
+
+        super().__init__(filename)
+        self.workbook = Workbook(write_only=True)
+
+    def write_solution(self, idx, solution_df, stats):
+        sheet = self.workbook.create_sheet(f"Solution_{idx}")
+        sheet.append(list(solution_df.columns))
+        for row in solution_df.itertuples(index=False):
+            sheet.append([value.item() if hasattr(value, "item") else value for value in row])
+
+    def close(self):
+        if self.workbook is not None:
+            # a workbook needs at least one sheet
+            if not self.num_solutions:
+                self.workbook.create_sheet("Solution_0").append(["name", "group"])
+            self.workbook.save(self.filename)
+            self.workbook = None
+
+
+class CsvSolutionWriter(SolutionWriter):
+    """
+    Write all solutions to one CSV file with columns solution, name, and group, flushed after each solution.
+    """
+
+    def __init__(self, filename):
+        super().__init__(filename)
+        self.file = open(filename, "w", newline="")
+        self.writer = csv.writer(self.file)
+        self.writer.writerow(["solution", "name", "group"])
+        self.file.flush()
+
+    def write_solution(self, idx, solution_df, stats):
+        self.writer.writerows((idx, name, group) for name, group in zip(solution_df["name"], solution_df["group"]))
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+
+class JsonLinesSolutionWriter(SolutionWriter):
+    """
+    Write one JSON object per line and solution with its index, solve stats, and lists of names and groups, flushed after each solution. With append, add solutions after num_solutions solutions already in the file (e.g. a checkpoint to resume from), dropping any solutions after them.
+    """
+
+    def __init__(self, filename, append=False, num_solutions=0):
+        super().__init__(filename)
+        if append and os.path.exists(filename):
+            with open(filename, "rb+") as f:
+                for _ in range(num_solutions):
+                    f.readline()
+                f.truncate(f.tell())
+            self.file = open(filename, "a")
+            self.num_solutions = num_solutions
+        else:
+            self.file = open(filename, "w")
+
+    def write_solution(self, idx, solution_df, stats):
+        record = {"solution": idx, "stats": stats, "name": solution_df["name"].tolist(), "group": solution_df["group"].tolist()}
+        self.file.write(json.dumps(record, default=json_value) + "\n")
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+
+# output format --> writer class
+SOLUTION_WRITERS = {"xlsx": XlsxSolutionWriter, "csv": CsvSolutionWriter, "jsonl": JsonLinesSolutionWriter}
+
+
+def solution_writer(filename):
+    """
+    Open solution writer for filename in the format of its extension (.xlsx, .csv, or .jsonl).
+    """
+    return SOLUTION_WRITERS[output_format(filename)](filename)
+
+
+####################
+# Solution Readers #
+####################
+
+def read_solutions(filename, return_stats=False):
+    """
+    Read list of solution DataFrames with names and groups from a file written by a solution writer or by earlier versions of the program (one "Solution_<idx>" sheet per solution). With return_stats, also return list of solve stats of each solution (None unless saved in a JSON lines file). A JSON lines file cut off in the middle of a line, e.g. by a killed program, is read up to the last complete solution.
+    """
+    format = output_format(filename)
+    if format == "xlsx":
+        solutions = list(pd.read_excel(filename, sheet_name=None).values())
+        stats = [None] * len(solutions)
+    elif format == "csv":
+        solutions_df = pd.read_csv(filename)
+        solutions = [solution_df[["name", "group"]].reset_index(drop=True) for _, solution_df in solutions_df.groupby("solution", sort=True)]
+        stats = [None] * len(solutions)
+    else:
+        solutions, stats = [], []
+        with open(filename) as f:
+            for line in f:
+                if not line.endswith("\n"):
+                    break
+                if line.strip():
+                    record = json.loads(line)
+                    solutions.append(pd.DataFrame({"name": record["name"], "group": record["group"]}))
+                    stats.append(record.get("stats"))
+    if return_stats:
+        return solutions, stats
+    return solutions
@@ -0,0 +1,126 @@
+import numpy as np
+
+
+####################
+# Group Signatures #
+####################
+
+def group_classes(signatures):
+    """
+    Group rows of (groups x features) signature matrix into classes of identical rows. Return list of arrays of group indices, one per class with at least two groups, each sorted ascending.
+    """
+    if not len(signatures):
+        return []
+    _, inverse = np.unique(signatures, axis=0, return_inverse=True)
+    inverse = inverse.ravel()
+    classes = [np.flatnonzero(inverse == label) for label in np.unique(inverse)]
+    return sorted((c for c in classes if len(c) > 1), key=lambda c: c[0])
+
+
+def spec_group_signatures(encoded):
+    """
+    Create signature for each group from integer-encoded problem. Groups of the same size that no In, Not In, or Homogenous constraint refers to share a signature. Each referenced group gets a unique signature.
+    """
+    G = encoded.n_groups
+    referenced = np.zeros(G, dtype=bool)
+    referenced[encoded.in_groups] = True
+    referenced[encoded.not_in_groups] = True
+    referenced[encoded.hom_groups] = True
+    unique_ids = np.where(referenced, np.arange(G), -1)
+    return np.column_stack([encoded.sizes, unique_ids])
+
+
+def presolved_group_signatures(presolved):
+    """
+    Create signature for each group from presolved problem. Groups share a signature when they have the same residual capacity, the same residual maximum characteristic limits, and allow the same free units. Groups that allow no free unit get a unique signature.
+    """
+    free_units = presolved.free_units
+    allowed = presolved.allowed[free_units]
+    G = len(presolved.capacity)
+    unused_ids = np.where(allowed.any(axis=0), -1, np.arange(G))
+    return np.column_stack([presolved.capacity,
+                            presolved.max_limits.T,
+                            allowed.T.astype(np.int64),
+                            unused_ids])
+
+
+def interchangeable_groups(encoded):
+    """
+    List classes of interchangeable groups as lists of group ids.
+    """
+    return [[encoded.groups[g] for g in c] for c in group_classes(spec_group_signatures(encoded))]
+
+
+##########################
+# Symmetry Breaking Rows #
+##########################
+
+def symmetry_breaking_rows(col_items, col_groups, n_groups, classes, aux_offset):
+    """
+    Create rows ordering the groups of each class by the lowest-indexed item (name or unit) assigned to them. Columns (col_items, col_groups) are the binary assignment columns, sorted by item then group.
+
+    For class groups g_1, ..., g_k and items i in ascending order, auxiliary column p[j, i] counts the items up to i assigned to g_j:
+
+        p[j, i] - p[j, i-1] - x[i, g_j] == 0
+        x[i, g_j+1] - p[j, i-1] <= 0
+
+    so an item can only open group g_j+1 once a lower-indexed item is in g_j. Each partition then has exactly one labeling within the class.
+
+    The rows add one column and two rows per item and class group, which usually slows the solver down more than the smaller search space helps (e.g. 200 students in 40 groups: 0.3s without, 12s with), so models only get them on request.
+
+    Return number of auxiliary columns and (rows, cols, vals, lb, ub, n_rows) for RowBlocks.add. Auxiliary columns start at aux_offset.
+    """
+    col_keys = col_items * n_groups + col_groups
+
+    def lookup(items, group):
+        # column of (item, group) or -1 when not allowed
+        keys = items * n_groups + group
+        pos = np.searchsorted(col_keys, keys).clip(max=max(len(col_keys) - 1, 0))
+        found = col_keys[pos] == keys if len(col_keys) else np.zeros(len(keys), dtype=bool)
+        return np.where(found, pos, -1)
+
+    rows, cols, vals, lb, ub = [], [], [], [], []
+    n_aux = 0
+    n_rows = 0
+
+    for groups in classes:
+        items = np.unique(col_items[np.isin(col_groups, groups)])
+        t = len(items)
+        if t == 0:
+            continue
+
+        for j in range(len(groups) - 1):
+            aux = aux_offset + n_aux + np.arange(t)
+            x_j = lookup(items, groups[j])
+            x_next = lookup(items, groups[j + 1])
+
+            # prefix rows: p[j, i] - p[j, i-1] - x[i, g_j] == 0
+            prefix_rows = n_rows + np.arange(t)
+            has_x = x_j >= 0
+            rows += [prefix_rows, prefix_rows[1:], prefix_rows[has_x]]
+            cols += [aux, aux[:-1], x_j[has_x]]
+            vals += [np.ones(t), -np.ones(t - 1), -np.ones(has_x.sum())]
+            lb.append(np.zeros(t))
+            ub.append(np.zeros(t))
+            n_rows += t
+
+            # order rows: x[i, g_j+1] - p[j, i-1] <= 0
+            has_next = x_next >= 0
+            order_rows = n_rows + np.arange(has_next.sum())
+            prev_aux = np.concatenate([[-1], aux[:-1]])[has_next]
+            has_prev = prev_aux >= 0
+            rows += [order_rows, order_rows[has_prev]]
+            cols += [x_next[has_next], prev_aux[has_prev]]
+            vals += [np.ones(has_next.sum()), -np.ones(has_prev.sum())]
+            lb.append(np.full(has_next.sum(), -np.inf))
+            ub.append(np.zeros(has_next.sum()))
+            n_rows += int(has_next.sum())
+
+            n_aux += t
+
+    if not n_rows:
+        empty = np.zeros(0)
+        return 0, (empty, empty, empty, empty, empty, 0)
+
+    return n_aux, (np.concatenate(rows), np.concatenate(cols), np.concatenate(vals),
+                   np.concatenate(lb), np.concatenate(ub), n_rows)
@@ -1,6 +1,6 @@
 import pandas as pd
 
-from src.assign_groups import import_from_template
+from src.problem_spec import as_problem_spec
 
 
 ####################
@@ -113,7 +113,7 @@ def test_maximum_constraint(max_df, solution_df, verbose=True):
 # Test Multiple Solutions #
 ###########################
 
-def view_changes_by_group(file, unique_solns, verbose=False):
+def view_changes_by_group(spec, unique_solns, verbose=False):
     """
     View number of changes between one solution and the next displayed by group.
 
@@ -124,8 +124,7 @@ def view_changes_by_group(file, unique_solns, verbose=False):
         solution 1 --> solution 2: 3 of 4
         ...
     """
-    group_df = import_from_template(file, "Grouping Setup")
-    groups = group_df["group id"].to_list()
+    groups = as_problem_spec(spec).groups
 
     # only proceed if multiple solutions...
     if len(unique_solns) > 1:
@@ -150,7 +149,7 @@ def view_changes_by_group(file, unique_solns, verbose=False):
                 print(f"\tsolution {idx} --> solution {idx + 1}: {num_changes} of {len(group_soln_df_0)}")
 
 
-def view_changes_by_solution(file, unique_solns, verbose=False):
+def view_changes_by_solution(spec, unique_solns, verbose=False):
     """
     View number of changes by group between one solution and the next.
 
@@ -161,8 +160,7 @@ def view_changes_by_solution(file, unique_solns, verbose=False):
         group 2: 2
         ...
     """
-    group_df = import_from_template(file, "Grouping Setup")
-    groups = group_df["group id"].to_list()
+    groups = as_problem_spec(spec).groups
 
     for idx in range(len(unique_solns) - 1):
         print(f"\nSOLUTION {idx} --> SOLUTION {idx + 1}")
@@ -0,0 +1,199 @@
+import numpy as np
+import pandas as pd
+
+from src.encoding import encode_problem_spec
+
+
+# constraint name and heading in printed report, in report order
+CONSTRAINTS = [
+    ("with", "WITH"),
+    ("not_with", "NOT WITH"),
+    ("in", "IN"),
+    ("not_in", "NOT IN"),
+    ("homogenous", "HOMOGENOUS"),
+    ("maximum", "MAXIMUM"),
+]
+
+REPORT_COLUMNS = ["solution", "constraint", "index", "group", "count", "maximum", "violations", "ok"]
+
+
+####################
+# Helper Functions #
+####################
+
+def encode_solutions(encoded, unique_solutions):
+    """
+    Encode list of solution DataFrames as (solutions x names) matrix of group indices. Names missing from a solution are labeled -1.
+    """
+    labels = np.full((len(unique_solutions), encoded.n_names), -1, dtype=np.int64)
+    for s, solution_df in enumerate(unique_solutions):
+        labels[s] = encoded.encode_solution(solution_df)
+    return labels
+
+
+def set_group_counts(labels, members, set_ids, n_sets, n_groups):
+    """
+    Count members of each name set in each group for every solution. Missing names count toward an extra last group. Return (solutions x sets x groups + 1) array.
+    """
+    S = len(labels)
+    member_labels = labels[:, members]
+    member_labels = np.where(member_labels < 0, n_groups, member_labels)
+    keys = (np.arange(S)[:, None] * n_sets + set_ids[None, :]) * (n_groups + 1) + member_labels
+    return np.bincount(keys.ravel(), minlength=S * n_sets * (n_groups + 1)).reshape(S, n_sets, n_groups + 1)
+
+
+def group_ids(encoded, group_idx):
+    """
+    Map array of group indices to group ids.
+    """
+    return np.asarray(encoded.groups, dtype=object)[group_idx]
+
+
+def report_rows(constraint, solution, index, violations, group=None, count=None, maximum=None):
+    """
+    Create report DataFrame from equal-length arrays of solution, constraint row index, and violation count.
+    """
+    n = len(solution)
+    return pd.DataFrame({
+        "solution": solution,
+        "constraint": constraint,
+        "index": index,
+        "group": group if group is not None else np.full(n, None),
+        "count": count if count is not None else np.full(n, np.nan),
+        "maximum": maximum if maximum is not None else np.full(n, np.nan),
+        "violations": violations,
+        "ok": violations == 0,
+    }, columns=REPORT_COLUMNS)
+
+
+#####################
+# Constraint Checks #
+#####################
+
+def check_with(encoded, labels):
+    """
+    With: every name of a set in one group. Violations are the number of extra groups the set is split across.
+    """
+    S = len(labels)
+    counts = set_group_counts(labels, encoded.with_members, encoded.with_set_ids, encoded.num_with_sets, encoded.n_groups)
+    violations = (counts > 0).sum(axis=2) - 1
+    return report_rows("with", np.repeat(np.arange(S), encoded.num_with_sets), np.tile(encoded.with_rows, S), violations.ravel())
+
+
+def check_not_with(encoded, labels):
+    """
+    Not With: no two names of a set in one group. Violations are the number of names sharing a group with an earlier name of the set.
+    """
+    S = len(labels)
+    counts = set_group_counts(labels, encoded.not_with_members, encoded.not_with_set_ids, encoded.num_not_with_sets, encoded.n_groups)
+    violations = np.maximum(counts[:, :, :-1] - 1, 0).sum(axis=2)
+    return report_rows("not_with", np.repeat(np.arange(S), encoded.num_not_with_sets), np.tile(encoded.not_with_rows, S), violations.ravel())
+
+
+def check_in(encoded, labels):
+    """
+    In: name assigned to group.
+    """
+    S = len(labels)
+    violations = (labels[:, encoded.in_names] != encoded.in_groups[None, :]).astype(np.int64)
+    return report_rows("in", np.repeat(np.arange(S), len(encoded.in_rows)), np.tile(encoded.in_rows, S), violations.ravel(),
+                       group=np.tile(group_ids(encoded, encoded.in_groups), S))
+
+
+def check_not_in(encoded, labels):
+    """
+    Not In: name not assigned to group.
+    """
+    S = len(labels)
+    violations = (labels[:, encoded.not_in_names] == encoded.not_in_groups[None, :]).astype(np.int64)
+    return report_rows("not_in", np.repeat(np.arange(S), len(encoded.not_in_rows)), np.tile(encoded.not_in_rows, S), violations.ravel(),
+                       group=np.tile(group_ids(encoded, encoded.not_in_groups), S))
+
+
+def check_homogenous(encoded, labels):
+    """
+    Homogenous: every name in group has characteristic. Violations are the number of names in the group without it.
+    """
+    S = len(labels)
+    violations = np.zeros((S, len(encoded.hom_rows)), dtype=np.int64)
+    for r, (group_idx, mask) in enumerate(zip(encoded.hom_groups, encoded.hom_masks)):
+        violations[:, r] = ((labels == group_idx) & ~mask[None, :]).sum(axis=1)
+    return report_rows("homogenous", np.repeat(np.arange(S), len(encoded.hom_rows)), np.tile(encoded.hom_rows, S), violations.ravel(),
+                       group=np.tile(group_ids(encoded, encoded.hom_groups), S))
+
+
+def check_maximum(encoded, labels):
+    """
+    Maximum: no more than maximum names with characteristic in each group. One report row per (solution, constraint row, group with at least one name). Violations are the names above the maximum.
+    """
+    S, G = len(labels), encoded.n_groups
+    R = len(encoded.max_rows)
+    assigned = labels >= 0
+    solution_idx = np.repeat(np.arange(S), encoded.n_names).reshape(S, -1)
+    sizes = np.bincount((solution_idx * G + labels)[assigned], minlength=S * G).reshape(S, G)
+
+    counts = np.zeros((S, R, G), dtype=np.int64)
+    for r, mask in enumerate(encoded.max_masks):
+        has_char = assigned & mask[None, :]
+        counts[:, r] = np.bincount((solution_idx * G + labels)[has_char], minlength=S * G).reshape(S, G)
+
+    # keep groups with at least one name like a groupby over the solution
+    s, r, g = np.nonzero(np.broadcast_to(sizes[:, None, :] > 0, (S, R, G)))
+    count = counts[s, r, g]
+    maximum = encoded.max_limits[r]
+    return report_rows("maximum", s, encoded.max_rows[r], np.maximum(count - maximum, 0),
+                       group=group_ids(encoded, g), count=count, maximum=maximum)
+
+
+CHECKS = {
+    "with": check_with,
+    "not_with": check_not_with,
+    "in": check_in,
+    "not_in": check_not_in,
+    "homogenous": check_homogenous,
+    "maximum": check_maximum,
+}
+
+
+#######################
+# Verification Report #
+#######################
+
+def verify_solutions(spec, unique_solutions):
+    """
+    Check every constraint for every solution at once on (solutions x names) label arrays. Return report DataFrame with one row per (solution, constraint, constraint row), and per group for the maximum constraint: solution, constraint, index, group, count, maximum, violations, and ok.
+    """
+    encoded = encode_problem_spec(spec)
+    labels = encode_solutions(encoded, unique_solutions)
+    report = pd.concat([CHECKS[constraint](encoded, labels) for constraint, heading in CONSTRAINTS], ignore_index=True)
+    return report.sort_values(["solution"], kind="stable").reset_index(drop=True)
+
+
+def summarize_report(report):
+    """
+    Count checked rows and violations by solution and constraint.
+    """
+    summary = report.groupby(["solution", "constraint"], sort=False).agg(
+        checked=("ok", "size"), failed=("ok", lambda ok: int((~ok).sum())), violations=("violations", "sum"))
+    return summary.reset_index()
+
+
+def print_report(report, solution):
+    """
+    Print pass/fail lines of one solution from report in the format of the test_groups functions.
+    """
+    solution_report = report.loc[report["solution"] == solution]
+    for constraint, heading in CONSTRAINTS:
+        rows = solution_report.loc[solution_report["constraint"] == constraint]
+        print(f"\n{heading}..." if constraint != "with" else f"{heading}...")
+        if constraint != "maximum":
+            for row in rows.itertuples():
+                print(f"\tindex {row.index}: {'ok' if row.ok else 'FAILED'}")
+            continue
+        for idx, index_rows in rows.groupby("index", sort=False):
+            print(f"\tindex {idx}:")
+            for row in index_rows.itertuples():
+                if row.ok:
+                    print(f"\t\tgroup {row.group}: ok ({int(row.count)})")
+                else:
+                    print(f"\t\tgroup {row.group}: FAILED ({int(row.count)} not <= {int(row.maximum)})")
@@ -0,0 +1,42 @@
+import pandas as pd
+
+from src.pair_history import PairHistory
+from src.problem_spec import ProblemSpec
+from src.solver_session import SolverSession
+from src.sparse_model import SparseSession
+
+
+def four_name_spec():
+    """
+    Names A to D in groups of 3 and 1 with A in the group of 1, so the only grouping is {B, C, D} / {A}.
+    """
+    return ProblemSpec(pd.DataFrame({"name": ["A", "B", "C", "D"]}),
+                       pd.DataFrame({"group id": [1, 2], "size": [3, 1]}),
+                       pd.DataFrame(columns=["name 1", "name 2"]),
+                       pd.DataFrame(columns=["name 1", "name 2"]),
+                       pd.DataFrame({"name": ["A"], "group id": [2]}),
+                       pd.DataFrame(columns=["name", "group id"]),
+                       pd.DataFrame(columns=["group id", "characteristic", "value"]),
+                       pd.DataFrame(columns=["maximum", "characteristic", "value"]))
+
+
+def partner_history():
+    """
+    History with A grouped once with each of B, C, and D.
+    """
+    history = PairHistory()
+    for partner in ["B", "C", "D"]:
+        others = [name for name in ["B", "C", "D"] if name != partner]
+        history.update(pd.DataFrame({"name": ["A", partner] + others, "group": [1, 1, 2, 3]}))
+    return history
+
+
+def test_no_repeat_penalty_outside_own_group():
+    # group 1 holds three earlier partners of A without A, which repeats no pair
+    for Session in [SolverSession, SparseSession]:
+        history = partner_history()
+        session = Session(four_name_spec(), elastic=True, pair_history=history)
+        status, solution_df = session.solve()
+        assert status == "Optimal"
+        assert history.repeated_pairs(solution_df) == 0
+        assert session.last_stats["objective"] == 0